@@ -1,24 +1,1350 @@
+import ast
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import unicodedata
+import uuid
+import warnings
+
+import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+import shapely
 import streamlit as st
 
-@st.cache_data
-def load_data(path="df_rt.csv", for_stmap=False):
+from perfilador import cache_medido
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos (ver _bloqueo_cache)
+    fcntl = None
+
+# Carpeta (junto al CSV) donde se guardan las copias columnares
+NOMBRE_DIR_CACHE = ".cache"
+# Tamaño de bloque para calcular el hash del CSV
+BLOQUE_HASH = 1 << 20
+
+# ============================================================
+# Esquema declarado del dataset de incidentes
+# Columnas de texto con pocos valores distintos: se cargan como categóricas
+COLUMNAS_CATEGORICAS = [
+    "delito", "categoria_delito", "tipo_violencia",
+    "alcaldia_hecho", "alcaldia_hecho_N", "alcaldia_catalogo", "municipio_hecho",
+    "colonia_hecho", "colonia_catalogo",
+    "fiscalia", "agencia", "unidad_investigacion", "competencia",
+]
+# Coordenadas: float32 basta para ~1 m de precisión en la CDMX
+COLUMNAS_FLOAT32 = ["latitud", "longitud"]
+# Fechas: se parsean con formato fijo en lugar de inferirlo fila por fila
+COLUMNAS_FECHA = ["fecha_hecho", "fecha_inicio"]
+FORMATO_FECHA = "ISO8601"
+# Columnas de texto no declaradas se vuelven categóricas si repiten valores
+UMBRAL_CATEGORICA = 0.5
+# Familias de delito que siguen los tableros (se buscan como subcadena de 'delito')
+DELITOS_PREFIJOS = [
+    "ROBO DE VEHICULO DE SERVICIO PARTICULAR",
+    "ROBO DE MOTOCICLETA",
+    "ROBO DE VEHICULO DE PEDALES",
+    "ROBO DE ACCESORIOS DE AUTO",
+    "ROBO DE OBJETOS DEL INTERIOR DE UN VEHICULO",
+]
+# Columna del cubo mensual con el total de incidentes (todas las familias)
+FAMILIA_TOTAL = "TOTAL"
+# Capas de polígonos (en la carpeta del CSV) con las que se etiqueta cada incidente
+ARCHIVO_CUADRANTES = "cuadrantes.csv"
+ARCHIVO_ALCALDIAS = "limite-de-las-alcaldias.json"
+# Valor de cuadrante_id para incidentes fuera de todo cuadrante o sin coordenadas
+SIN_CUADRANTE = -1
+# Puntos por consulta al STRtree (acota la memoria de los objetos shapely)
+BLOQUE_PUNTOS = 1 << 19
+# Se incrementa cuando cambia el esquema para invalidar las copias en caché
+VERSION_ESQUEMA = 6
+# Formato del almacén: Arrow IPC sin comprimir, que se lee por memory-map sin
+# parsear ni descomprimir (la tabla Arrow usa las páginas del archivo; el
+# DataFrame de pandas que se arma a partir de ella sí es una copia)
+FORMATO_ALMACEN = "ipc"
+# Particiones del almacén en disco: una carpeta por año y mes
+PARTICIONES = ds.partitioning(
+    pa.schema([("anio", pa.int16()), ("mes", pa.int8())]), flavor="hive"
+)
+
+
+def _ruta_cache(path: str, extension: str) -> str:
+    """Ruta dentro de la carpeta de caché para un archivo derivado del CSV."""
+    carpeta = os.path.join(os.path.dirname(path) or ".", NOMBRE_DIR_CACHE)
+    os.makedirs(carpeta, exist_ok=True)
+    nombre = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(carpeta, f"{nombre}{extension}")
+
+
+def _hash_archivo(path: str) -> str:
+    """SHA-256 del contenido del archivo, leído por bloques."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(BLOQUE_HASH), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def ruta_temporal(ruta: str) -> str:
+    """
+    Nombre temporal único (por proceso y escritura) junto a 'ruta': cada
+    escritor arma su archivo o carpeta aparte y lo publica con os.replace.
+    """
+    return f"{ruta}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+
+
+# Rutas de bloqueo que ya tiene cada hilo (el bloqueo es reentrante por hilo)
+_bloqueos = threading.local()
+
+
+@contextlib.contextmanager
+def _bloqueo_cache(path: str):
+    """
+    Bloqueo exclusivo (fcntl.flock sobre <nombre>.lock en la carpeta de caché)
+    para construir las copias derivadas de un archivo. Sirve entre procesos y
+    entre hilos, porque cada uno abre su propio descriptor; si el hilo ya lo
+    tiene, no se vuelve a pedir. Quien lo obtiene debe volver a leer el
+    manifiesto: otro escritor pudo terminar la copia mientras esperaba.
+    """
+    ruta = _ruta_cache(path, ".lock")
+    tomados = vars(_bloqueos).setdefault("rutas", set())
+    if ruta in tomados:
+        yield
+        return
+    with open(ruta, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        tomados.add(ruta)
+        try:
+            yield
+        finally:
+            tomados.discard(ruta)
+
+
+def _leer_manifiesto(path: str) -> dict:
+    try:
+        with open(_ruta_cache(path, ".json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _huella_vigente(huella: dict, info: os.stat_result) -> bool:
+    return huella.get("tamano") == info.st_size and huella.get("mtime_ns") == info.st_mtime_ns
+
+
+def huella_archivo(path: str) -> dict:
+    """
+    Devuelve la huella del CSV: tamaño, mtime y hash del contenido.
+
+    El hash solo se recalcula cuando cambian el tamaño o el mtime respecto a
+    la última huella guardada; así un despliegue que copia el mismo archivo
+    (mtime nuevo, contenido igual) sigue reutilizando la caché.
+    """
+    previa = _leer_manifiesto(path)
+    if _huella_vigente(previa, os.stat(path)):
+        return previa
+
+    with _bloqueo_cache(path):
+        previa = _leer_manifiesto(path)
+        info = os.stat(path)
+        if _huella_vigente(previa, info):
+            return previa
+        # Se conserva el resto del manifiesto: si el hash no coincide con el del
+        # almacén, preparar_almacen lo reconstruye y borra la copia anterior
+        huella = {
+            **previa,
+            "tamano": info.st_size,
+            "mtime_ns": info.st_mtime_ns,
+            "sha256": _hash_archivo(path),
+        }
+        _guardar_manifiesto(path, huella)
+        return huella
+
+
+def _guardar_manifiesto(path: str, manifiesto: dict) -> None:
+    """Escribe el manifiesto de la caché de forma atómica."""
+    ruta_manifiesto = _ruta_cache(path, ".json")
+    tmp = ruta_temporal(ruta_manifiesto)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f)
+    os.replace(tmp, ruta_manifiesto)
+
+
+def mayusculas_categoria(serie: pd.Series) -> pd.Series:
+    """
+    Pasa a mayúsculas una columna categórica operando sobre sus categorías
+    (no sobre cada fila) y fusiona las que quedan repetidas.
+    """
+    categorias = serie.cat.categories.str.upper()
+    unicas = pd.Index(categorias.unique())
+    mapeo = unicas.get_indexer(categorias)
+    codigos = serie.cat.codes.to_numpy()
+    codigos = np.where(codigos >= 0, mapeo[codigos], -1)
+    return pd.Series(
+        pd.Categorical.from_codes(codigos, categories=unicas),
+        index=serie.index,
+        name=serie.name,
+    )
+
+
+def _parsear_fechas(serie: pd.Series) -> pd.Series:
+    """
+    Parsea con FORMATO_FECHA (vectorizado) y solo las filas que no lo cumplen
+    se reintentan infiriendo el formato fila por fila. Lo que siga sin poder
+    leerse queda como NaT y se avisa con un warning, en lugar de perderse en
+    silencio.
+    """
+    fechas = pd.to_datetime(serie, format=FORMATO_FECHA, errors="coerce")
+    fallidas = fechas.isna() & serie.notna() & (serie.astype(str).str.strip() != "")
+    if fallidas.any():
+        fechas.loc[fallidas] = pd.to_datetime(serie[fallidas], format="mixed", errors="coerce")
+        perdidas = int(fechas[fallidas].isna().sum())
+        if perdidas:
+            warnings.warn(
+                f"{serie.name}: {perdidas} valores no son fechas válidas y quedan como NaT",
+                stacklevel=3,
+            )
+    return fechas
+
+
+def aplicar_esquema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte el DataFrame crudo al esquema declarado: categóricas para el
+    texto repetitivo, float32 para coordenadas y datetime para las fechas.
+    """
+    for col in COLUMNAS_FECHA:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = _parsear_fechas(df[col])
+
+    for col in COLUMNAS_FLOAT32:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) or df[col].dtype != object:
+            continue
+        if col in COLUMNAS_CATEGORICAS or df[col].nunique() < UMBRAL_CATEGORICA * len(df):
+            df[col] = df[col].astype("category")
+
+    if "delito" in df.columns:
+        df["delito"] = mayusculas_categoria(df["delito"])
+
+    return df
+
+
+def _tipos_csv(path: str, flotantes: bool = True) -> dict:
+    """dtype para pd.read_csv con las columnas declaradas presentes en el archivo."""
+    columnas = pd.read_csv(path, nrows=0).columns
+    tipos = {c: "category" for c in COLUMNAS_CATEGORICAS if c in columnas}
+    if flotantes:
+        tipos.update({c: "float32" for c in COLUMNAS_FLOAT32 if c in columnas})
+    return tipos
+
+
+def _leer_csv_tipado(path: str) -> pd.DataFrame:
+    """Lee el CSV aplicando desde el parser los tipos ya conocidos."""
+    return aplicar_esquema(pd.read_csv(path, dtype=_tipos_csv(path)))
+
+
+def _alinear_categoricas(df: pd.DataFrame, esquema: pa.Schema) -> pd.DataFrame:
+    """
+    Vuelve categóricas las columnas que en 'esquema' son diccionario y en df
+    no lo son (p. ej. una columna vacía que pandas leyó como float64), porque
+    Arrow no convierte arreglos numéricos a diccionario.
+    """
+    for campo in esquema:
+        if pa.types.is_dictionary(campo.type) and not isinstance(df[campo.name].dtype, pd.CategoricalDtype):
+            serie = df[campo.name].astype(object)
+            df[campo.name] = serie.where(serie.notna(), None).astype("category")
+    return df
+
+
+# ============================================================
+# Pre-agregados del almacén
+# Cada pre-agregado es aditivo (conteos por claves), de modo que una ingesta
+# solo necesita agregar el lote nuevo y sumarlo al resultado guardado.
+AGREGADOS = {}
+
+
+def agregado(*claves):
+    """Registra funcion(df) -> DataFrame con las claves y columnas de conteo."""
+    def registrar(funcion):
+        AGREGADOS[funcion.__name__] = (funcion, list(claves))
+        return funcion
+    return registrar
+
+
+def _ruta_agregado(manifiesto: dict, nombre: str) -> str:
+    # El prefijo "_" hace que pyarrow no lo trate como parte del dataset
+    return os.path.join(manifiesto["almacen"], f"_agregado-{nombre}.parquet")
+
+
+def _guardar_agregado(manifiesto: dict, nombre: str, df: pd.DataFrame) -> None:
+    ruta = _ruta_agregado(manifiesto, nombre)
+    tmp = ruta_temporal(ruta)
+    df.reset_index(drop=True).to_parquet(tmp, index=False)
+    os.replace(tmp, ruta)
+
+
+def leer_agregado(path: str, nombre: str) -> pd.DataFrame:
+    """
+    Devuelve un pre-agregado de la versión vigente del almacén; si aún no
+    existe (agregado nuevo sobre un almacén previo) lo calcula una vez.
+    """
+    manifiesto = preparar_almacen(path)
+    ruta = _ruta_agregado(manifiesto, nombre)
+    if not os.path.exists(ruta):
+        with _bloqueo_cache(path):
+            manifiesto = preparar_almacen(path)
+            ruta = _ruta_agregado(manifiesto, nombre)
+            if not os.path.exists(ruta):
+                funcion, _ = AGREGADOS[nombre]
+                _guardar_agregado(manifiesto, nombre, funcion(_abrir_almacen(manifiesto).to_table().to_pandas()))
+    return pd.read_parquet(ruta)
+
+
+def _sumar_agregado(previo: pd.DataFrame, nuevo: pd.DataFrame, claves: list) -> pd.DataFrame:
+    """Combina dos resultados de un agregado aditivo sumando por claves."""
+    combinado = pd.concat([previo, nuevo], ignore_index=True)
+    for col in claves:
+        # Las categorías de ambos lados pueden diferir; se unifican antes de agrupar
+        if isinstance(previo[col].dtype, pd.CategoricalDtype) or isinstance(nuevo[col].dtype, pd.CategoricalDtype):
+            combinado[col] = combinado[col].astype("category")
+    return combinado.groupby(claves, observed=True, dropna=False, as_index=False, sort=True).sum()
+
+
+def a_tabla_arrow(df: pd.DataFrame, esquema: pa.Schema | None = None) -> pa.Table:
+    """
+    Convierte a Arrow conservando NaN como valor en las columnas flotantes
+    (sin máscara de nulos), para que al volver a pandas no haya que copiarlas.
+    """
+    tabla = pa.Table.from_pandas(df, schema=esquema, preserve_index=False)
+    for i, campo in enumerate(tabla.schema):
+        if pa.types.is_floating(campo.type) and tabla.column(i).null_count:
+            valores = df[campo.name].to_numpy(dtype=campo.type.to_pandas_dtype())
+            tabla = tabla.set_column(i, campo, pa.array(valores, type=campo.type, from_pandas=False))
+    return tabla
+
+
+def familia_delito(valores, prefijos=DELITOS_PREFIJOS) -> list:
+    """Familia (prefijo) de cada valor de 'delito', o None si no pertenece a ninguna."""
+    return [next((p for p in prefijos if p in v), None) for v in valores]
+
+
+def columna_familia(delito: pd.Series) -> pd.Series:
+    """
+    Familia de DELITOS_PREFIJOS de cada fila como categórica. La búsqueda de
+    subcadenas se hace una vez por categoría de 'delito' y se propaga a las
+    filas por sus códigos, sin recorrer el texto fila por fila.
+    """
+    familias = familia_delito(delito.cat.categories)
+    # El último -1 corresponde al código -1 (delito nulo)
+    mapeo = np.array([DELITOS_PREFIJOS.index(f) if f else -1 for f in familias] + [-1], dtype="int8")
+    return pd.Series(
+        pd.Categorical.from_codes(mapeo[delito.cat.codes.to_numpy()], categories=DELITOS_PREFIJOS),
+        index=delito.index,
+        name="familia",
+    )
+
+
+def _normalizar_nombre(nombre: str) -> str:
+    """Mayúsculas sin acentos, como vienen los nombres de alcaldía en df_rt."""
+    sin_acentos = unicodedata.normalize("NFKD", nombre).encode("ascii", "ignore").decode()
+    return sin_acentos.upper().strip()
+
+
+def _geometria_literal(texto) -> object:
+    """Geometría de un geo_shape escrito como literal de Python (comillas simples)."""
+    try:
+        return shapely.geometry.shape(ast.literal_eval(texto))
+    except Exception:
+        return None
+
+
+def cargar_cuadrantes(path_csv: str = "bases_de_datos/cuadrantes.csv") -> gpd.GeoDataFrame:
+    """
+    GeoDataFrame de cuadrantes (EPSG:4326) leído de una copia GeoParquet en la
+    carpeta de caché. La copia se crea la primera vez (o cuando cambia el
+    contenido del CSV) convirtiendo toda la columna geo_shape de una sola vez
+    con shapely.from_geojson; las filas sin geometría válida se descartan.
+
+    Parámetros:
+        path_csv (str): ruta de cuadrantes.csv.
+
+    Retorna:
+        gpd.GeoDataFrame: columnas del CSV con geometry en lugar de geo_shape.
+    """
+    huella = huella_archivo(path_csv)
+    ruta = _ruta_cache(path_csv, f"-{huella['sha256'][:16]}.geoparquet")
+    if huella.get("geoparquet") == ruta and os.path.exists(ruta):
+        return gpd.read_parquet(ruta)
+    with _bloqueo_cache(path_csv):
+        huella = huella_archivo(path_csv)
+        ruta = _ruta_cache(path_csv, f"-{huella['sha256'][:16]}.geoparquet")
+        if huella.get("geoparquet") == ruta and os.path.exists(ruta):
+            return gpd.read_parquet(ruta)
+        return _convertir_cuadrantes(path_csv, huella, ruta)
+
+
+def _convertir_cuadrantes(path_csv: str, huella: dict, ruta: str) -> gpd.GeoDataFrame:
+    df = pd.read_csv(path_csv)
+    geometrias = shapely.from_geojson(df["geo_shape"].to_numpy(dtype=object), on_invalid="ignore")
+    # Lo que no es JSON estricto se intenta como literal de Python, fila por fila
+    faltantes = np.flatnonzero(shapely.is_missing(geometrias))
+    geometrias[faltantes] = [_geometria_literal(t) for t in df["geo_shape"].to_numpy()[faltantes]]
+    validas = ~shapely.is_missing(geometrias)
+    gdf = gpd.GeoDataFrame(
+        df.drop(columns="geo_shape")[validas].reset_index(drop=True),
+        geometry=geometrias[validas],
+        crs="EPSG:4326",
+    )
+
+    tmp = ruta_temporal(ruta)
+    gdf.to_parquet(tmp, index=False)
+    os.replace(tmp, ruta)
+    anterior = huella.get("geoparquet")
+    if anterior and anterior != ruta and os.path.exists(anterior):
+        os.remove(anterior)
+    huella["geoparquet"] = ruta
+    _guardar_manifiesto(path_csv, huella)
+    return gdf
+
+
+def poligonos_cuadrantes(path_csv: str) -> tuple[np.ndarray, np.ndarray]:
+    """ids y geometrías shapely de cuadrantes.csv (vía la copia GeoParquet)."""
+    gdf = cargar_cuadrantes(path_csv)
+    return gdf["id"].to_numpy(), gdf.geometry.to_numpy()
+
+
+def poligonos_alcaldias(path_json: str) -> tuple[np.ndarray, np.ndarray]:
+    """Nombres normalizados y geometrías shapely del GeoJSON de alcaldías."""
+    with open(path_json, "r", encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    nombres = np.array([_normalizar_nombre(f["properties"]["NOMGEO"]) for f in features], dtype=object)
+    geometrias = shapely.from_geojson([json.dumps(f["geometry"]) for f in features])
+    return nombres, geometrias
+
+
+def asignar_poligono(latitud: np.ndarray, longitud: np.ndarray, geometrias: np.ndarray) -> np.ndarray:
+    """
+    Índice en 'geometrias' del polígono que contiene cada punto, o -1 si no cae
+    en ninguno o no tiene coordenadas. Se consulta un STRtree con todos los
+    puntos a la vez (por bloques); un punto sobre una frontera compartida se
+    asigna al polígono de menor índice.
+    """
+    indice = np.full(len(latitud), -1, dtype="int32")
+    validos = np.flatnonzero(~(np.isnan(latitud) | np.isnan(longitud)))
+    if validos.size == 0 or len(geometrias) == 0:
+        return indice
+    arbol = shapely.STRtree(geometrias)
+    for inicio in range(0, validos.size, BLOQUE_PUNTOS):
+        filas = validos[inicio:inicio + BLOQUE_PUNTOS]
+        puntos = shapely.points(longitud[filas], latitud[filas])
+        idx_punto, idx_poligono = arbol.query(puntos, predicate="intersects")
+        orden = np.lexsort((idx_poligono, idx_punto))
+        idx_punto, idx_poligono = idx_punto[orden], idx_poligono[orden]
+        primero = np.r_[True, idx_punto[1:] != idx_punto[:-1]]
+        indice[filas[idx_punto[primero]]] = idx_poligono[primero]
+    return indice
+
+
+def etiquetar_poligonos(df: pd.DataFrame, directorio: str) -> pd.DataFrame:
+    """
+    Agrega cuadrante_id (id de cuadrantes.csv, SIN_CUADRANTE si no cae en
+    ninguno) y alcaldia_geo (alcaldía del polígono que contiene el punto). Si
+    falta alguna capa, la columna se crea vacía para conservar el esquema.
+    """
+    lat = df["latitud"].to_numpy(dtype="float64")
+    lon = df["longitud"].to_numpy(dtype="float64")
+
+    cuadrante = np.full(len(df), SIN_CUADRANTE, dtype="int16")
+    ruta_cuadrantes = os.path.join(directorio, ARCHIVO_CUADRANTES)
+    if os.path.exists(ruta_cuadrantes):
+        ids, geometrias = poligonos_cuadrantes(ruta_cuadrantes)
+        idx = asignar_poligono(lat, lon, geometrias)
+        cuadrante = np.where(idx >= 0, ids[idx], SIN_CUADRANTE).astype("int16")
+    df["cuadrante_id"] = cuadrante
+
+    nombres, codigos = np.array([], dtype=object), np.full(len(df), -1, dtype="int32")
+    ruta_alcaldias = os.path.join(directorio, ARCHIVO_ALCALDIAS)
+    if os.path.exists(ruta_alcaldias):
+        nombres, geometrias = poligonos_alcaldias(ruta_alcaldias)
+        codigos = asignar_poligono(lat, lon, geometrias)
+    # Categorías fijas (todas las alcaldías, en orden) para que cada lote de la ingesta sea compatible
+    categorias, mapeo = np.unique(nombres, return_inverse=True)
+    mapeo = np.append(mapeo, -1).astype("int32")
+    df["alcaldia_geo"] = pd.Categorical.from_codes(mapeo[codigos], categories=categorias)
+    return df
+
+
+def derivar_columnas(df: pd.DataFrame, directorio_capas: str | None = None) -> pd.DataFrame:
+    """
+    Descarta filas sin fecha válida y crea las columnas derivadas: año y mes
+    (particiones), hora, día de la semana (0 = lunes) y familia del delito.
+    Si se indica la carpeta de las capas, también cuadrante_id y alcaldia_geo.
+    """
+    df = df.dropna(subset=["fecha_hecho"]).copy()
+    fechas = df["fecha_hecho"].dt
+    df["anio"] = fechas.year.astype("int16")
+    df["mes"] = fechas.month.astype("int8")
+    df["hora_num"] = fechas.hour.astype("int8")
+    df["dia_num"] = fechas.dayofweek.astype("int8")
+    if "delito" in df.columns:
+        df["familia"] = columna_familia(df["delito"])
+    if directorio_capas is not None and {"latitud", "longitud"} <= set(df.columns):
+        df = etiquetar_poligonos(df, directorio_capas)
+    return df
+
+
+def _convertir_a_almacen(path: str, huella: dict, capas: dict) -> str:
+    """
+    Parsea el CSV una sola vez y lo guarda como dataset Arrow IPC particionado
+    por año y mes (anio=AAAA/mes=M/), junto a su huella y la de las capas.
+    """
+    df = derivar_columnas(_leer_csv_tipado(path), os.path.dirname(path))
+    huella["capas"] = capas
+    ruta_almacen = _nombre_almacen(path, huella)
+    tmp = ruta_temporal(ruta_almacen)
+    try:
+        ds.write_dataset(
+            a_tabla_arrow(df),
+            tmp,
+            format=FORMATO_ALMACEN,
+            partitioning=PARTICIONES,
+        )
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    shutil.rmtree(ruta_almacen, ignore_errors=True)
+    os.replace(tmp, ruta_almacen)
+
+    # Se borra la copia de la versión anterior del CSV
+    anterior = huella.get("almacen")
+    if anterior and anterior != ruta_almacen:
+        shutil.rmtree(anterior, ignore_errors=True)
+    parquet_anterior = huella.pop("parquet", None)
+    if parquet_anterior and os.path.exists(parquet_anterior):
+        os.remove(parquet_anterior)
+
+    huella["almacen"] = ruta_almacen
+    huella["sha256_almacen"] = huella["sha256"]
+    huella["esquema"] = VERSION_ESQUEMA
+    _guardar_manifiesto(path, huella)
+
+    for nombre, (funcion, _) in AGREGADOS.items():
+        _guardar_agregado(huella, nombre, funcion(df))
+    return ruta_almacen
+
+
+def _nombre_almacen(path: str, huella: dict) -> str:
+    """Carpeta del almacén para un contenido, unas capas y una versión de esquema."""
+    return _ruta_cache(path, f"-{huella['sha256'][:16]}-{_version_capas(huella['capas'])}-v{VERSION_ESQUEMA}")
+
+
+def _huellas_capas(path: str) -> dict:
+    """
+    sha256 de cada capa de polígonos junto al CSV (None si no existe). Las
+    columnas cuadrante_id y alcaldia_geo del almacén dependen de ellas.
+    """
+    huellas = {}
+    for archivo in (ARCHIVO_CUADRANTES, ARCHIVO_ALCALDIAS):
+        ruta = os.path.join(os.path.dirname(path), archivo)
+        huellas[archivo] = huella_archivo(ruta)["sha256"] if os.path.exists(ruta) else None
+    return huellas
+
+
+def _version_capas(capas: dict) -> str:
+    return hashlib.sha256(json.dumps(capas, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def preparar_almacen(path: str) -> dict:
+    """
+    Devuelve el manifiesto del almacén particionado del CSV, creándolo si no
+    existe o si cambiaron el contenido del CSV, alguna capa de polígonos
+    (cuadrantes o alcaldías) o el esquema. La construcción se hace con el
+    bloqueo de la caché: si varias sesiones llegan a la vez sin almacén, una
+    lo construye y las demás usan el resultado.
+    """
+    huella = huella_archivo(path)
+    capas = _huellas_capas(path)
+    if _almacen_vigente(huella, capas):
+        return huella
+    with _bloqueo_cache(path):
+        huella = huella_archivo(path)
+        capas = _huellas_capas(path)
+        if not _almacen_vigente(huella, capas):
+            _convertir_a_almacen(path, huella, capas)
+    return huella
+
+
+def _almacen_vigente(huella: dict, capas: dict) -> bool:
+    return (
+        huella.get("sha256_almacen") == huella["sha256"]
+        and huella.get("capas") == capas
+        and huella.get("esquema") == VERSION_ESQUEMA
+        and os.path.isdir(huella.get("almacen") or "")
+    )
+
+
+def version_datos(path: str) -> str:
+    """
+    Identificador corto de la versión de los datos: cambia con cada ingesta y
+    cuando cambia alguna capa de polígonos con la que se etiqueta el almacén.
+    """
+    huella = preparar_almacen(path)
+    version = f"{huella['sha256'][:16]}-{_version_capas(huella['capas'])}"
+    _descartar_versiones_previas(
+        ("almacen", path), version,
+        (_cargar_datos, _cubo_mensual, _rollup_diario, _acumulado_diario, _cubo_dia_hora),
+    )
+    return version
+
+
+# Última versión vista en este proceso por clave (ver _descartar_versiones_previas)
+_versiones_vistas = {}
+_bloqueo_versiones = threading.Lock()
+
+
+def _descartar_versiones_previas(clave, version, cacheadas) -> None:
+    """
+    Vacía las cachés indexadas por versión cuando cambia la versión de 'clave':
+    tras una ingesta nadie vuelve a pedir las entradas anteriores, que solo
+    ocuparían memoria hasta salir por max_entries.
+    """
+    with _bloqueo_versiones:
+        previa = _versiones_vistas.get(clave)
+        _versiones_vistas[clave] = version
+    if previa is not None and previa != version:
+        for cacheada in cacheadas:
+            cacheada.clear()
+
+
+def _abrir_almacen(manifiesto: dict) -> ds.Dataset:
+    """Abre el dataset particionado con lectura por memory-map."""
+    return ds.dataset(
+        manifiesto["almacen"],
+        format=FORMATO_ALMACEN,
+        partitioning=PARTICIONES,
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def periodos_disponibles(path: str) -> list[tuple[int, int]]:
+    """
+    Lista los pares (año, mes) presentes en el almacén leyendo solo los
+    nombres de las particiones, sin abrir ningún archivo de datos.
+    """
+    ruta = preparar_almacen(path)["almacen"]
+    periodos = []
+    for carpeta_anio in os.listdir(ruta):
+        if not carpeta_anio.startswith("anio="):
+            continue
+        for carpeta_mes in os.listdir(os.path.join(ruta, carpeta_anio)):
+            if carpeta_mes.startswith("mes="):
+                periodos.append((int(carpeta_anio[5:]), int(carpeta_mes[4:])))
+    return sorted(periodos)
+
+
+def _expresion_filtro(anios=None, meses=None, periodos=None, delitos=None):
+    """Construye el filtro de pyarrow que se empuja hasta las particiones."""
+    filtro = None
+
+    def _y(expr):
+        return expr if filtro is None else filtro & expr
+
+    if anios is not None:
+        filtro = _y((ds.field("anio") >= anios[0]) & (ds.field("anio") <= anios[1]))
+    if meses is not None:
+        filtro = _y(ds.field("mes").isin(list(meses)))
+    if periodos is not None:
+        expr_periodos = None
+        for anio, mes in periodos:
+            expr = (ds.field("anio") == anio) & (ds.field("mes") == mes)
+            expr_periodos = expr if expr_periodos is None else expr_periodos | expr
+        if expr_periodos is not None:
+            filtro = _y(expr_periodos)
+    if delitos is not None:
+        filtro = _y(ds.field("familia").isin(list(delitos)))
+    return filtro
+
+
+def load_data(path="df_rt.csv", for_stmap=False, anios=None, meses=None, periodos=None, delitos=None):
     """
     Carga y limpia el dataset base de incidentes.
-    
+
+    La primera vez convierte el CSV a un dataset Arrow IPC particionado por
+    año y mes con el esquema declarado (categóricas, float32 y fechas); las
+    cargas siguientes leen por memory-map solo las particiones que pasan los
+    filtros, sin volver a parsear el texto, y las convierten a pandas una vez
+    por proceso y combinación de filtros. La caché se indexa por la versión
+    de los datos, así que una ingesta nueva se ve sin reiniciar.
+
+    El DataFrame devuelto se comparte entre sesiones: no debe modificarse en
+    su lugar (usar .copy() o asignar a un DataFrame nuevo).
+
     Parámetros:
         path (str): ruta del archivo CSV.
         for_stmap (bool): si True, renombra las columnas para usar con st.map().
-    
+        anios (tuple[int, int] | None): rango de años inclusivo.
+        meses (list[int] | None): meses a incluir (1-12).
+        periodos (list[tuple[int, int]] | None): pares (año, mes) exactos.
+        delitos (list[str] | None): familias de delito (valores de DELITOS_PREFIJOS).
+
     Retorna:
-        pd.DataFrame: datos listos para visualización.
+        pd.DataFrame: datos listos para visualización, ya preprocesados
+        (fechas válidas, 'delito' en mayúsculas y columnas anio, mes,
+        hora_num, dia_num y familia).
     """
     try:
-        # Leer el CSV
-        df = pd.read_csv(path)
-        #st.info(f"Archivo cargado: {len(df)} registros totales.")
-        return df
-
+        version = version_datos(path)
+    except Exception:
+        # Sin caché disponible; _cargar_datos reintenta y reporta el error
+        version = None
+    try:
+        return _cargar_datos(path, version, for_stmap, anios, meses, periodos, delitos)
     except Exception as e:
+        # El error no queda en caché: la siguiente carga vuelve a intentarlo
         st.error(f"Error al cargar el dataset: {e}")
         return pd.DataFrame()
+
+
+@cache_medido(st.cache_resource(max_entries=8))
+def _cargar_datos(path, version, for_stmap, anios, meses, periodos, delitos):
+    """
+    Lectura del almacén para una versión concreta de los datos.
+
+    Se usa cache_resource: todas las sesiones del proceso reciben el mismo
+    DataFrame (no una copia deserializada por sesión), por lo que es de solo
+    lectura. No es una vista del archivo: cada partición es un bloque de la
+    tabla Arrow, y to_pandas une los bloques y arma las categóricas en
+    arreglos nuevos, así que cada combinación de filtros ocupa su propia copia
+    en memoria (una por proceso). Los errores se propagan para que
+    cache_resource no guarde un resultado fallido.
+    """
+    try:
+        manifiesto = preparar_almacen(path)
+        filtro = _expresion_filtro(anios, meses, periodos, delitos)
+        tabla = _abrir_almacen(manifiesto).to_table(filter=filtro)
+        df = tabla.to_pandas(split_blocks=True)
+    except OSError:
+        # Sin permisos de escritura para la caché: se lee el CSV directamente
+        df = _filtrar_en_memoria(
+            derivar_columnas(_leer_csv_tipado(path), os.path.dirname(path)),
+            anios, meses, periodos, delitos,
+        )
+    #st.info(f"Archivo cargado: {len(df)} registros totales.")
+    return df
+
+
+def _filtrar_en_memoria(df, anios=None, meses=None, periodos=None, delitos=None):
+    """Mismos filtros que el almacén, aplicados sobre un DataFrame ya cargado."""
+    mascara = pd.Series(True, index=df.index)
+    if anios is not None:
+        mascara &= df["anio"].between(anios[0], anios[1])
+    if meses is not None:
+        mascara &= df["mes"].isin(list(meses))
+    if periodos is not None:
+        clave = df["anio"].astype("int32") * 100 + df["mes"]
+        mascara &= clave.isin([a * 100 + m for a, m in periodos])
+    if delitos is not None:
+        mascara &= df["familia"].isin(list(delitos))
+    return df[mascara]
+
+
+# ============================================================
+# Pre-agregados para los tableros
+
+@agregado("anio", "mes", "delito")
+def conteo_mensual(df: pd.DataFrame) -> pd.DataFrame:
+    """Incidentes por año, mes y valor de 'delito'."""
+    return (
+        df.groupby(["anio", "mes", "delito"], observed=True, dropna=False)
+        .size()
+        .reset_index(name="total")
+    )
+
+
+@cache_medido(st.cache_data(max_entries=4))
+def _cubo_mensual(path: str, version: str) -> pd.DataFrame:
+    conteo = leer_agregado(path, "conteo_mensual")
+    conteo["familia"] = familia_delito(conteo["delito"].astype(str))
+    cubo = conteo.pivot_table(
+        index=["anio", "mes"], columns="familia", values="total", aggfunc="sum", fill_value=0
+    ).reindex(columns=DELITOS_PREFIJOS, fill_value=0)
+    cubo.insert(0, FAMILIA_TOTAL, conteo.groupby(["anio", "mes"])["total"].sum())
+    return cubo.astype("int64")
+
+
+def cubo_mensual(path: str) -> pd.DataFrame:
+    """
+    Cubo de conteos mensuales: índice (anio, mes) y una columna por familia
+    de DELITOS_PREFIJOS más FAMILIA_TOTAL. Se arma con el pre-agregado
+    conteo_mensual una vez por versión de los datos, así cada KPI es una
+    búsqueda con .at en lugar de recorrer el dataset.
+    """
+    return _cubo_mensual(path, version_datos(path))
+
+
+@agregado("fecha", "familia", "delito", "alcaldia")
+def conteo_diario(df: pd.DataFrame) -> pd.DataFrame:
+    """Incidentes diarios de las familias de DELITOS_PREFIJOS por delito y alcaldía."""
+    col_alc = "alcaldia_hecho_N" if "alcaldia_hecho_N" in df.columns else "alcaldia_hecho"
+    vehiculos = df[df["familia"].notna()]
+    return (
+        vehiculos.groupby(
+            [
+                vehiculos["fecha_hecho"].dt.normalize().rename("fecha"),
+                "familia",
+                "delito",
+                vehiculos[col_alc].rename("alcaldia"),
+            ],
+            observed=True,
+            dropna=False,
+        )
+        .size()
+        .reset_index(name="total")
+    )
+
+
+@cache_medido(st.cache_resource(max_entries=4))
+def _rollup_diario(path: str, version: str) -> pd.DataFrame:
+    rollup = leer_agregado(path, "conteo_diario")
+    rollup["anio"] = rollup["fecha"].dt.year.astype("int16")
+    rollup["mes"] = rollup["fecha"].dt.month.astype("int8")
+    return rollup
+
+
+def rollup_diario(path: str) -> pd.DataFrame:
+    """
+    Rollup diario materializado (fecha x familia x delito x alcaldía, con
+    columnas anio y mes) de los robos de DELITOS_PREFIJOS. Se construye con el
+    almacén y se actualiza en cada ingesta; las gráficas de tendencia lo leen
+    en lugar de agrupar filas crudas. Compartido entre sesiones: solo lectura.
+    """
+    return _rollup_diario(path, version_datos(path))
+
+
+@agregado("fecha")
+def conteo_diario_total(df: pd.DataFrame) -> pd.DataFrame:
+    """Incidentes diarios de todos los delitos."""
+    return (
+        df.groupby(df["fecha_hecho"].dt.normalize().rename("fecha"))
+        .size()
+        .reset_index(name="total")
+    )
+
+
+@cache_medido(st.cache_resource(max_entries=8))
+def _acumulado_diario(path: str, version: str, por_alcaldia: bool) -> pd.DataFrame:
+    rollup = _rollup_diario(path, version)
+    if por_alcaldia:
+        conteos = rollup.pivot_table(
+            index="fecha", columns=["alcaldia", "familia"], values="total",
+            aggfunc="sum", fill_value=0, observed=True,
+        )
+    else:
+        familias = rollup.pivot_table(
+            index="fecha", columns="familia", values="total",
+            aggfunc="sum", fill_value=0, observed=True,
+        ).reindex(columns=DELITOS_PREFIJOS, fill_value=0)
+        total = leer_agregado(path, "conteo_diario_total").set_index("fecha")["total"]
+        conteos = pd.concat([total.rename(FAMILIA_TOTAL), familias], axis=1).fillna(0)
+    if conteos.empty:
+        return conteos.astype("int64")
+    # Días consecutivos; la fila i acumula los incidentes de los días anteriores a dias[i]
+    dias = pd.date_range(conteos.index.min(), conteos.index.max() + pd.Timedelta(days=1), freq="D")
+    valores = conteos.reindex(dias[:-1], fill_value=0).to_numpy(dtype="int64")
+    acumulado = np.vstack([np.zeros((1, valores.shape[1]), dtype="int64"), valores.cumsum(axis=0)])
+    return pd.DataFrame(acumulado, index=dias, columns=conteos.columns)
+
+
+def acumulado_diario(path: str, por_alcaldia: bool = False) -> pd.DataFrame:
+    """
+    Sumas acumuladas diarias (prefix sums) de incidentes. Índice: días
+    consecutivos desde el primer incidente hasta el día siguiente al último; la
+    fila de un día tiene los incidentes anteriores a ese día. Columnas:
+    FAMILIA_TOTAL y DELITOS_PREFIJOS o, con por_alcaldia, (alcaldía, familia).
+    El conteo de cualquier rango se obtiene con conteo_en_rango. Compartido
+    entre sesiones: solo lectura.
+    """
+    return _acumulado_diario(path, version_datos(path), por_alcaldia)
+
+
+def conteo_en_rango(acumulado: pd.DataFrame, inicio, fin) -> pd.Series:
+    """
+    Incidentes por columna entre inicio y fin (fechas, ambos inclusive) a partir
+    de un resultado de acumulado_diario: dos búsquedas y una resta.
+    """
+    if acumulado.empty:
+        return pd.Series(0, index=acumulado.columns, dtype="int64")
+    posiciones = acumulado.index.searchsorted(
+        [pd.Timestamp(inicio), pd.Timestamp(fin) + pd.Timedelta(days=1)]
+    ).clip(0, len(acumulado) - 1)
+    valores = acumulado.to_numpy()
+    return pd.Series(valores[posiciones[1]] - valores[posiciones[0]], index=acumulado.columns)
+
+
+@agregado("familia", "dia_num", "hora_num")
+def conteo_dia_hora(df: pd.DataFrame) -> pd.DataFrame:
+    """Incidentes de las familias de DELITOS_PREFIJOS por día de la semana y hora."""
+    return (
+        df[df["familia"].notna()]
+        .groupby(["familia", "dia_num", "hora_num"], observed=True)
+        .size()
+        .reset_index(name="total")
+    )
+
+
+@cache_medido(st.cache_resource(max_entries=4))
+def _cubo_dia_hora(path: str, version: str) -> dict:
+    conteo = leer_agregado(path, "conteo_dia_hora")
+    conteo = conteo[conteo["total"] > 0].sort_values(["familia", "dia_num", "hora_num"])
+    return {
+        familia: grupo.drop(columns="familia").reset_index(drop=True)
+        for familia, grupo in conteo.groupby("familia", observed=True)
+    }
+
+
+def cubo_dia_hora(path: str) -> dict:
+    """
+    Cubo familia x día de la semana x hora: diccionario familia -> DataFrame
+    (dia_num, hora_num, total) solo con las celdas que tienen incidentes. Se
+    arma una vez por versión de los datos; cambiar de tipo de robo en el mapa
+    de calor es una búsqueda en el diccionario. Compartido entre sesiones:
+    solo lectura.
+    """
+    return _cubo_dia_hora(path, version_datos(path))
+
+
+def _sufijo_opciones(opciones_csv: dict) -> str:
+    """Huella corta de las opciones de pd.read_csv ("" sin opciones)."""
+    if not opciones_csv:
+        return ""
+    texto = json.dumps(opciones_csv, sort_keys=True, default=repr)
+    return "-" + hashlib.sha256(texto.encode()).hexdigest()[:8]
+
+
+def ruta_arrow(path: str, esquema: bool = True, **opciones_csv) -> str:
+    """
+    Devuelve una copia Arrow IPC del CSV, creándola si no existe o si el
+    contenido del CSV cambió. Con esquema=False las columnas quedan como las
+    infiere pd.read_csv, sin aplicar el esquema de incidentes. Las opciones
+    de lectura forman parte del nombre y de la clave del manifiesto: cada
+    combinación tiene su propia copia.
+    """
+    opciones = _sufijo_opciones(opciones_csv)
+    sufijo = (f"-v{VERSION_ESQUEMA}" if esquema else "-crudo") + opciones
+    clave = ("arrow" if esquema else "arrow_crudo") + opciones
+    huella = huella_archivo(path)
+    ruta = _ruta_cache(path, f"-{huella['sha256'][:16]}{sufijo}.arrow")
+    if huella.get(clave) == ruta and os.path.exists(ruta):
+        return ruta
+    with _bloqueo_cache(path):
+        huella = huella_archivo(path)
+        ruta = _ruta_cache(path, f"-{huella['sha256'][:16]}{sufijo}.arrow")
+        if huella.get(clave) != ruta or not os.path.exists(ruta):
+            df = pd.read_csv(path, **opciones_csv)
+            _convertir_a_arrow(path, huella, clave, ruta, aplicar_esquema(df) if esquema else df)
+    return ruta
+
+
+def _convertir_a_arrow(path: str, huella: dict, clave: str, ruta: str, df: pd.DataFrame) -> None:
+    tabla = a_tabla_arrow(df)
+    tmp = ruta_temporal(ruta)
+    with pa.OSFile(tmp, "wb") as destino:
+        with pa.ipc.new_file(destino, tabla.schema) as escritor:
+            escritor.write_table(tabla)
+    os.replace(tmp, ruta)
+
+    anterior = huella.get(clave)
+    if anterior and anterior != ruta and os.path.exists(anterior):
+        os.remove(anterior)
+    huella[clave] = ruta
+    _guardar_manifiesto(path, huella)
+
+
+@cache_medido(st.cache_resource(max_entries=4))
+def _df_compartido(ruta: str) -> pd.DataFrame:
+    """
+    DataFrame de solo lectura sobre un archivo Arrow IPC mapeado en memoria:
+    las columnas numéricas sin nulos son vistas del archivo; las de texto se
+    convierten a objetos de Python una vez por proceso.
+    """
+    # El mapeo queda abierto mientras vivan los buffers de la tabla
+    tabla = pa.ipc.open_file(pa.memory_map(ruta)).read_all()
+    return tabla.to_pandas(split_blocks=True)
+
+
+def cargar_compartido(path: str, esquema: bool = False, **opciones_csv) -> pd.DataFrame:
+    """
+    Carga un CSV como DataFrame compartido por todas las sesiones y procesos.
+
+    El CSV se convierte una sola vez a Arrow IPC; cada proceso lo mapea en
+    memoria y todas sus sesiones reciben el mismo objeto, que es de solo
+    lectura (ver _df_compartido para qué columnas se copian). Si alguna
+    columna mezcla tipos que Arrow no puede representar, se devuelve el CSV
+    leído directamente.
+
+    Parámetros:
+        path (str): ruta del archivo CSV.
+        esquema (bool): si True, aplica el esquema de incidentes (aplicar_esquema:
+            fechas ISO 8601, 'delito' en mayúsculas, categóricas y float32); si
+            False, conserva los tipos que infiere pd.read_csv.
+        **opciones_csv: argumentos para pd.read_csv (sep, encoding, ...).
+
+    Retorna:
+        pd.DataFrame: datos del CSV.
+    """
+    try:
+        ruta = ruta_arrow(path, esquema, **opciones_csv)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = pd.read_csv(path, **opciones_csv)
+        return aplicar_esquema(df) if esquema else df
+    # Una copia nueva del CSV libera la anterior (y su memory-map) en lugar de esperar a max_entries
+    _descartar_versiones_previas(("arrow", path, esquema, _sufijo_opciones(opciones_csv)), ruta, (_df_compartido,))
+    return _df_compartido(ruta)
+
+
+# ============================================================
+# Capas geográficas para los mapas
+
+# Tolerancia de simplificación (~10 m) y rejilla de cuantización (~1 m), en grados
+TOLERANCIA_LIMITES = 1e-4
+PRECISION_LIMITES = 1e-5
+# Los cuadrantes son polígonos de pocas cuadras: se simplifican menos (~3 m)
+TOLERANCIA_CUADRANTES = 3e-5
+
+
+def _coleccion_simplificada(propiedades: list, geometrias: np.ndarray, tolerancia: float, precision: float) -> str:
+    """FeatureCollection compacta con las geometrías simplificadas y cuantizadas."""
+    # coverage_simplify simplifica las fronteras compartidas una sola vez: no abre huecos entre polígonos vecinos
+    geometrias = shapely.set_precision(shapely.coverage_simplify(geometrias, tolerancia), precision)
+    partes = [
+        f'{{"type":"Feature","properties":{json.dumps(p, ensure_ascii=False)},"geometry":{g}}}'
+        for p, g in zip(propiedades, shapely.to_geojson(geometrias))
+    ]
+    return '{"type":"FeatureCollection","features":[' + ",".join(partes) + "]}"
+
+
+@cache_medido(st.cache_resource(max_entries=4))
+def _capa_limites(path: str, mtime_ns: int, tolerancia: float, precision: float) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    geometrias = shapely.from_geojson([json.dumps(f["geometry"]) for f in features])
+    propiedades = [f.get("properties") or {} for f in features]
+    return _coleccion_simplificada(propiedades, geometrias, tolerancia, precision)
+
+
+def capa_limites(
+    path: str = "bases_de_datos/limite-de-las-alcaldias.json",
+    tolerancia: float = TOLERANCIA_LIMITES,
+    precision: float = PRECISION_LIMITES,
+) -> str:
+    """
+    GeoJSON de límites (alcaldías) simplificado y cuantizado, como texto compacto
+    listo para folium.GeoJson. Se lee y simplifica una vez por versión del archivo
+    (mtime) y se comparte entre sesiones.
+
+    Parámetros:
+        path (str): ruta del GeoJSON de polígonos.
+        tolerancia (float): tolerancia de simplificación en grados.
+        precision (float): tamaño de la rejilla a la que se redondean las coordenadas.
+
+    Retorna:
+        str: FeatureCollection serializada sin espacios.
+    """
+    return _capa_limites(path, os.stat(path).st_mtime_ns, tolerancia, precision)
+
+
+# Propiedades de cada cuadrante que usan los tooltips del mapa de patrullaje
+CAMPOS_CUADRANTE = ["id", "alcaldia", "zona", "sector", "no_region", "no_cuadran"]
+
+
+@cache_medido(st.cache_resource(max_entries=4))
+def _capa_cuadrantes(path: str, mtime_ns: int, tolerancia: float, precision: float) -> str:
+    gdf = cargar_cuadrantes(path)
+    # Escalares de Python y None en lugar de NaN, que no es JSON válido
+    campos = gdf[CAMPOS_CUADRANTE]
+    propiedades = campos.astype(object).where(campos.notna(), None).to_dict("records")
+    return _coleccion_simplificada(propiedades, gdf.geometry.to_numpy(), tolerancia, precision)
+
+
+def capa_cuadrantes(
+    path: str = "bases_de_datos/cuadrantes.csv",
+    tolerancia: float = TOLERANCIA_CUADRANTES,
+    precision: float = PRECISION_LIMITES,
+) -> str:
+    """
+    Capa base de cuadrantes para el mapa de patrullaje: GeoJSON simplificado y
+    cuantizado con solo las propiedades de CAMPOS_CUADRANTE. Se serializa una
+    vez por versión de cuadrantes.csv (mtime) y se comparte entre sesiones.
+
+    Parámetros:
+        path (str): ruta de cuadrantes.csv.
+        tolerancia (float): tolerancia de simplificación en grados.
+        precision (float): tamaño de la rejilla a la que se redondean las coordenadas.
+
+    Retorna:
+        str: FeatureCollection serializada sin espacios.
+    """
+    return _capa_cuadrantes(path, os.stat(path).st_mtime_ns, tolerancia, precision)
+
+
+# Carpeta servida por Streamlit en app/static (server.enableStaticServing)
+DIR_ESTATICO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SUBDIR_CAPAS = "capas"
+
+
+def url_estatica(ruta: str) -> str:
+    """
+    URL absoluta desde la raíz del servidor de un archivo de static (ruta
+    relativa a esa carpeta, con su query si la tiene), con el prefijo de
+    server.baseUrlPath. Los mapas corren en el iframe de un componente, así que
+    todas las capas piden sus archivos con esta URL y no con rutas relativas.
+    """
+    base_url = (st.get_option("server.baseUrlPath") or "").strip("/")
+    prefijo = f"/{base_url}" if base_url else ""
+    return f"{prefijo}/app/static/{ruta}"
+
+
+def publicar_capa(nombre: str, contenido: str) -> str:
+    """
+    Escribe una capa GeoJSON en static/capas con el hash del contenido en el
+    nombre y borra las versiones anteriores de la misma capa. Devuelve la ruta
+    dentro de static (capas/<nombre>-<hash>.json?v=<hash>; ver url_estatica),
+    para que el navegador la guarde en caché y la descargue una sola vez por
+    versión.
+    """
+    datos = contenido.encode("utf-8")
+    huella = hashlib.sha256(datos).hexdigest()[:16]
+    carpeta = os.path.join(DIR_ESTATICO, SUBDIR_CAPAS)
+    os.makedirs(carpeta, exist_ok=True)
+    archivo = f"{nombre}-{huella}.json"
+    ruta = os.path.join(carpeta, archivo)
+    if not os.path.exists(ruta):
+        tmp = ruta_temporal(ruta)
+        with open(tmp, "wb") as f:
+            f.write(datos)
+        os.replace(tmp, ruta)
+    for otro in os.listdir(carpeta):
+        if otro.startswith(f"{nombre}-") and otro != archivo and otro.endswith(".json"):
+            # Otro proceso pudo haberlo borrado ya
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(carpeta, otro))
+    return f"{SUBDIR_CAPAS}/{archivo}?v={huella}"
+
+
+@cache_medido(st.cache_resource(max_entries=4))
+def _url_capa_cuadrantes(path: str, mtime_ns: int, tolerancia: float, precision: float) -> str:
+    return publicar_capa("cuadrantes", _capa_cuadrantes(path, mtime_ns, tolerancia, precision))
+
+
+def url_capa_cuadrantes(
+    path: str = "bases_de_datos/cuadrantes.csv",
+    tolerancia: float = TOLERANCIA_CUADRANTES,
+    precision: float = PRECISION_LIMITES,
+) -> str:
+    """
+    La capa de capa_cuadrantes publicada como archivo estático: URL de
+    url_estatica (.../app/static/capas/cuadrantes-<hash>.json?v=<hash>) que el
+    mapa descarga una vez y el navegador conserva en caché. Requiere
+    server.enableStaticServing.
+    """
+    return url_estatica(_url_capa_cuadrantes(path, os.stat(path).st_mtime_ns, tolerancia, precision))
+
+
+@cache_medido(st.cache_resource(max_entries=4))
+def _medidas_cuadrantes(path: str, mtime_ns: int) -> pd.DataFrame:
+    gdf = cargar_cuadrantes(path)
+    geometrias = gdf.geometry.to_numpy()
+    centroides = shapely.centroid(geometrias)
+    cajas = shapely.bounds(geometrias)
+    return pd.DataFrame(
+        {
+            "alcaldia": gdf["alcaldia"].to_numpy(),
+            "zona": gdf["zona"].to_numpy(),
+            "sector": gdf["sector"].to_numpy(),
+            "centro_lon": shapely.get_x(centroides),
+            "centro_lat": shapely.get_y(centroides),
+            "area": shapely.area(geometrias),
+            "oeste": cajas[:, 0],
+            "sur": cajas[:, 1],
+            "este": cajas[:, 2],
+            "norte": cajas[:, 3],
+        },
+        index=pd.Index(gdf["id"].to_numpy(), name="id"),
+    )
+
+
+def medidas_cuadrantes(path: str = "bases_de_datos/cuadrantes.csv") -> pd.DataFrame:
+    """
+    Alcaldía, zona, sector, centroide, área (en grados²) y caja envolvente de
+    cada cuadrante, con índice id. Se calcula una vez por versión de cuadrantes.csv (mtime) y se
+    comparte entre sesiones: solo lectura.
+    """
+    return _medidas_cuadrantes(path, os.stat(path).st_mtime_ns)
+
+
+@cache_medido(st.cache_resource(max_entries=4))
+def _extension_alcaldias(path: str, mtime_ns: int) -> pd.DataFrame:
+    return _medidas_cuadrantes(path, mtime_ns).groupby("alcaldia").agg(
+        oeste=("oeste", "min"), sur=("sur", "min"), este=("este", "max"), norte=("norte", "max")
+    )
+
+
+def extension_alcaldias(path: str = "bases_de_datos/cuadrantes.csv") -> pd.DataFrame:
+    """
+    Caja envolvente (oeste, sur, este, norte) de los cuadrantes de cada
+    alcaldía, con índice alcaldia. Se calcula una vez por versión de
+    cuadrantes.csv (mtime) a partir de medidas_cuadrantes y se comparte entre
+    sesiones: solo lectura.
+    """
+    return _extension_alcaldias(path, os.stat(path).st_mtime_ns)
+
+
+def encuadre(medidas: pd.DataFrame, ids=None) -> tuple[list, list] | None:
+    """
+    Centro y límites del mapa para un conjunto de cuadrantes sin unir sus
+    polígonos: el centro es el promedio de los centroides ponderado por área
+    (el centroide de la unión cuando no se traslapan) y los límites son el
+    mínimo y máximo de sus cajas.
+
+    Parámetros:
+        medidas (pd.DataFrame): resultado de medidas_cuadrantes.
+        ids: ids de los cuadrantes; None para todos.
+
+    Retorna:
+        tuple | None: ([lat, lon], [[sur, oeste], [norte, este]]), o None si
+        ningún id tiene geometría.
+    """
+    if ids is not None:
+        posiciones = medidas.index.get_indexer(np.asarray(ids))
+        medidas = medidas.iloc[posiciones[posiciones >= 0]]
+    if medidas.empty:
+        return None
+    area = medidas["area"].to_numpy()
+    centro = [
+        float(np.average(medidas["centro_lat"].to_numpy(), weights=area)),
+        float(np.average(medidas["centro_lon"].to_numpy(), weights=area)),
+    ]
+    limites = [
+        [float(medidas["sur"].min()), float(medidas["oeste"].min())],
+        [float(medidas["norte"].max()), float(medidas["este"].max())],
+    ]
+    return centro, limites
+
+
+# ============================================================
+# Ingesta incremental
+
+def ingestar_incidentes(path_lote: str, path: str = "bases_de_datos/df_rt.csv") -> int:
+    """
+    Agrega un lote de incidentes al CSV y al almacén sin reprocesar el historial.
+
+    Solo el lote se tipa y se le derivan año, mes, hora y día; sus filas se
+    escriben como archivos nuevos en sus particiones y los pre-agregados se
+    actualizan sumando el agregado del lote. El parseo es proporcional al
+    lote, no al historial; lo único que recorre el CSV completo es el hash
+    de sus bytes, que el manifiesto guarda igual que en una carga completa.
+
+    Los archivos del lote y los agregados se escriben primero con nombres
+    que el almacén ignora y solo se publican después de añadir el texto al
+    CSV. Si el proceso se interrumpe antes, el almacén queda como estaba;
+    si se interrumpe después, el CSV ya no coincide con el manifiesto y el
+    almacén se reconstruye en la siguiente carga.
+
+    Parámetros:
+        path_lote (str): CSV con las filas nuevas (mismas columnas que path).
+        path (str): CSV base de incidentes.
+
+    Retorna:
+        int: número de filas con fecha válida incorporadas al almacén.
+    """
+    # Con el bloqueo de la caché: dos ingestas (o una ingesta y una reconstrucción) no se intercalan
+    with _bloqueo_cache(path):
+        return _ingestar(path_lote, path)
+
+
+PREFIJO_PENDIENTE = "_pendiente-"
+
+
+def _descartar_pendientes(almacen: str) -> None:
+    """Borra los archivos de una ingesta que se interrumpió antes de publicarse."""
+    for carpeta, _, archivos in os.walk(almacen):
+        for archivo in archivos:
+            if archivo.startswith(PREFIJO_PENDIENTE) or archivo.endswith(".tmp"):
+                os.remove(os.path.join(carpeta, archivo))
+
+
+def _ingestar(path_lote: str, path: str) -> int:
+    manifiesto = preparar_almacen(path)
+    _descartar_pendientes(manifiesto["almacen"])
+    columnas_csv = pd.read_csv(path, nrows=0).columns
+    # Mismos tipos declarados que la carga completa; las coordenadas se leen tal cual
+    # para que el texto añadido al CSV conserve su precisión
+    crudo = pd.read_csv(path_lote, dtype=_tipos_csv(path_lote, flotantes=False))
+    faltantes = [c for c in ("fecha_hecho", "delito") if c in columnas_csv and c not in crudo.columns]
+    if faltantes:
+        raise ValueError(f"El lote no tiene las columnas requeridas: {faltantes}")
+    crudo = crudo.reindex(columns=columnas_csv)
+
+    # (temporal, definitivo) de cada archivo que se publica al final
+    pendientes = []
+    lote = derivar_columnas(aplicar_esquema(crudo.copy()), os.path.dirname(path))
+    if not lote.empty:
+        # Mismo esquema que el almacén para que todos los archivos sean compatibles
+        esquema = _abrir_almacen(manifiesto).schema
+        tabla = a_tabla_arrow(_alinear_categoricas(lote[esquema.names].copy(), esquema), esquema)
+        sello = pd.Timestamp.now().strftime("%Y%m%d%H%M%S%f")
+        # Con prefijo "_" el dataset no lee estos archivos hasta que se renombran
+        escritos = []
+        ds.write_dataset(
+            tabla,
+            manifiesto["almacen"],
+            format=FORMATO_ALMACEN,
+            partitioning=PARTICIONES,
+            basename_template=f"{PREFIJO_PENDIENTE}{sello}-{{i}}.arrow",
+            existing_data_behavior="overwrite_or_ignore",
+            file_visitor=lambda archivo: escritos.append(archivo.path),
+        )
+        for ruta in escritos:
+            carpeta, nombre = os.path.split(ruta)
+            pendientes.append((ruta, os.path.join(carpeta, "lote-" + nombre[len(PREFIJO_PENDIENTE):])))
+        for nombre, (funcion, claves) in AGREGADOS.items():
+            ruta = _ruta_agregado(manifiesto, nombre)
+            tmp = ruta_temporal(ruta)
+            total = _sumar_agregado(leer_agregado(path, nombre), funcion(lote), claves)
+            total.reset_index(drop=True).to_parquet(tmp, index=False)
+            pendientes.append((tmp, ruta))
+
+    # Se añade el texto al CSV fuente para que siga siendo la fuente de verdad
+    texto = crudo.to_csv(header=False, index=False).encode("utf-8")
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                texto = b"\n" + texto
+        f.write(texto)
+
+    for tmp, ruta in pendientes:
+        os.replace(tmp, ruta)
+
+    info = os.stat(path)
+    sha = _hash_archivo(path)
+    manifiesto.update({
+        "tamano": info.st_size,
+        "mtime_ns": info.st_mtime_ns,
+        "sha256": sha,
+        "sha256_almacen": sha,
+    })
+    _guardar_manifiesto(path, manifiesto)
+    return len(lote)
@@ -0,0 +1,33 @@
+"""
+Ingesta incremental de incidentes.
+
+Agrega un lote de filas nuevas a bases_de_datos/df_rt.csv y a su almacén
+particionado sin reprocesar el historial. Pensado para la actualización
+nocturna:
+
+    python ingesta.py lote_del_dia.csv
+    python ingesta.py lote_del_dia.csv --destino bases_de_datos/df_rt.csv
+"""
+import argparse
+import time
+
+from data_loader import ingestar_incidentes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta incremental de incidentes.")
+    parser.add_argument("lote", help="CSV con los incidentes nuevos")
+    parser.add_argument(
+        "--destino",
+        default="bases_de_datos/df_rt.csv",
+        help="CSV base de incidentes (por defecto: bases_de_datos/df_rt.csv)",
+    )
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    filas = ingestar_incidentes(args.lote, path=args.destino)
+    print(f"{filas} incidentes agregados en {time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,11 @@ import matplotlib.pyplot as plt
 import os
 import pandas as pd
 import re
+from data_loader import cargar_compartido
+import perfilador as perfil
+
+# Perfilado opcional por sección (PERFIL_SECCIONES=1 o ?perfil=1)
+perfil.iniciar_perfil("Chatbot")
 
 # Configuración de la clave API
 CLIENT_API_KEY = st.secrets["openai_api_key"]
@@ -66,17 +71,26 @@ else:
 # ================================
 #   1.1 CARGAR BASE_DE_DATOS.csv Y UTILIDADES
 # ================================
-@st.cache_data
+RUTA_BASE = "archivos_chatbot/BASE_DE_DATOS.csv"
+
+
+@perfil.cache_medido(st.cache_resource(max_entries=2))
+def _base_compartida(mtime_ns: int):
+    # Copia Arrow en caché (sin volver a parsear el texto), con los tipos que infiere pd.read_csv.
+    # Todas las sesiones del proceso reciben los mismos DataFrames: solo lectura
+    df = cargar_compartido(RUTA_BASE, sep=";", encoding="latin-1")
+    if "ï»¿anio" in df.columns and "anio" not in df.columns:
+        df = df.rename(columns={"ï»¿anio": "anio"}, copy=False)
+    return df, normalizar_df_base(df.copy(deep=False))  # Copia superficial: solo renombra y reemplaza columnas
+
+
 def cargar_base():
-    file_path = "archivos_chatbot/BASE_DE_DATOS.csv"
+    """Base del chatbot y su versión normalizada, compartidas entre sesiones (una vez por versión del archivo)."""
     try:
-        df = pd.read_csv(file_path, sep=";", encoding="latin-1")
-        if "ï»¿anio" in df.columns and "anio" not in df.columns:
-            df = df.rename(columns={"ï»¿anio": "anio"})
-        return df
+        return _base_compartida(os.stat(RUTA_BASE).st_mtime_ns)
     except FileNotFoundError:
         st.error("No se encontró 'archivos_chatbot/BASE_DE_DATOS.csv'.")
-        return pd.DataFrame()
+        return pd.DataFrame(), pd.DataFrame()
 
 MESES_MAP = {
     "ENERO": "ENERO", "FEBRERO": "FEBRERO", "MARZO": "MARZO", "ABRIL": "ABRIL",
@@ -155,7 +169,7 @@ def responder_desde_csv(prompt: str, df_norm: pd.DataFrame) -> str | None:
 
     if not filtros: return None
 
-    df_filtrado = df_norm.copy()
+    df_filtrado = df_norm  # Solo se filtra (no se modifica): no hace falta copiar
     for col, val in filtros.items():
         if col in df_filtrado.columns:
             df_filtrado = df_filtrado[df_filtrado[col] == val]
@@ -189,8 +203,10 @@ def es_pregunta_conteo_simple(prompt: str) -> bool:
 # =======================================
 
 # CARGAMOS LOS DATAFRAMES GLOBALES (Importante para que funcione el chat)
-df = cargar_base()
-df_norm_global = normalizar_df_base(df.copy())
+perfil.etapa("carga")
+df, df_norm_global = cargar_base()
+perfil.registrar(filas=len(df))
+perfil.etapa("asistente")
 
 if "assistant_id" not in st.session_state:
     assistant = client.beta.assistants.create(
@@ -249,9 +265,11 @@ if "thread_id" not in st.session_state:
 # ================================
 #   4. CHAT DE USUARIO
 # ================================
+perfil.etapa(None)
 prompt = st.chat_input("Haz una pregunta sobre el proyecto o la CDMX...")
 
 if prompt:
+    perfil.etapa("espera_openai")
     st.chat_message("user").write(prompt)
 
     client.beta.threads.messages.create(
@@ -276,6 +294,7 @@ if prompt:
 
     messages = client.beta.threads.messages.list(thread_id=st.session_state.thread_id)
     answer = messages.data[0].content[0].text.value
+    perfil.etapa("respuesta")
 
     # =========================================
     #   INTENTAR INTERPRETAR COMO JSON
@@ -297,7 +316,8 @@ if prompt:
         group_by = data.get("group_by")
         chart_type = data.get("chart_type", "line")
 
-        df_filtrado = df.copy()
+        # Copia superficial: df es compartido y aquí solo se reemplazan columnas completas
+        df_filtrado = df.copy(deep=False)
 
         # Normalizar texto para filtrado
         for col in ["alcaldia", "mes", "dia", "tipo_robo"]:
@@ -320,7 +340,7 @@ if prompt:
             st.error("No se encontraron datos con esos filtros.")
         else:
             if group_by in df_filtrado.columns:
-                conteo = df_filtrado.groupby(group_by).size().reset_index(name="conteo")
+                conteo = df_filtrado.groupby(group_by, observed=True).size().reset_index(name="conteo")
                 try:
                     conteo = conteo.sort_values(group_by)
                 except: pass
@@ -344,6 +364,7 @@ if prompt:
                 ax.set_title(data.get("title", "Gráfica"))
                 ax.grid(True, linestyle="--", alpha=0.4)
                 st.pyplot(fig)
+                perfil.registrar(filas=len(df), payload=conteo)
             else:
                 st.error(f"Columna {group_by} no disponible.")
 
@@ -363,7 +384,7 @@ if prompt:
             filters = data.get("filters", {})
             group_by = data.get("group_by")
             
-            df_filtrado = df.copy()
+            df_filtrado = df.copy(deep=False)
             for col in ["alcaldia", "mes", "dia", "tipo_robo"]:
                 if col in df_filtrado.columns:
                     df_filtrado[col] = df_filtrado[col].astype(str).str.strip().str.upper()
@@ -375,9 +396,10 @@ if prompt:
             if df_filtrado.empty:
                 st.info("Sin datos para esta tabla.")
             else:
-                conteo = df_filtrado.groupby(group_by).size().reset_index(name="conteo").sort_values("conteo", ascending=False)
+                conteo = df_filtrado.groupby(group_by, observed=True).size().reset_index(name="conteo").sort_values("conteo", ascending=False)
                 st.subheader(data.get("title", "Resultados"))
                 st.dataframe(conteo.head(k))
+                perfil.registrar(filas=len(df), payload=conteo.head(k))
 
     # -----------------------------------------
     #   MODO TEXTO NORMAL
@@ -390,4 +412,6 @@ if prompt:
             else:
                 st.chat_message("assistant").write(answer)
         else:
-            st.chat_message("assistant").write(answer)
\ No newline at end of file
+            st.chat_message("assistant").write(answer)
+
+perfil.panel_perfil()
\ No newline at end of file
@@ -1,11 +1,32 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import branca.colormap as cm
-import geopandas as gpd
 import folium
-from shapely.geometry import shape
-import ast
+from branca.element import MacroElement
+from folium.elements import JSCSSMixin
+from folium.plugins import VectorGridProtobuf
+from jinja2 import Template
 from streamlit_folium import st_folium
+import perfilador as perfil
+from teselas import plantilla_teselas
+from data_loader import (
+    cargar_cuadrantes,
+    capa_cuadrantes,
+    url_capa_cuadrantes,
+    medidas_cuadrantes,
+    encuadre,
+    extension_alcaldias,
+)
+from predicciones import (
+    filas_predicciones,
+    cubo_predicciones,
+    rebanada_predicciones,
+    indices_mayores,
+    grafo_cuadrantes,
+    asignar_patrullaje,
+    TODOS_LOS_DELITOS,
+)
 
 # ======================================
 # CONFIGURACIÓN DE LA PÁGINA
@@ -13,6 +34,8 @@ st.set_page_config(
     page_title="Sistema de seguridad CDMX",
     layout="wide"
 )
+# Perfilado opcional por sección (PERFIL_SECCIONES=1 o ?perfil=1)
+perfil.iniciar_perfil("Dashboard_policia")
 
 # ======================================
 # CONTROL DE SESIÓN
@@ -45,39 +68,162 @@ with col_btn_logout:
 
 # ======================================
 
+# CAPAS DE CUADRANTES PARA EL MAPA
+# Leaflet.VectorGrid, el mismo que usa folium.plugins.VectorGridProtobuf
+URL_VECTORGRID = dict(VectorGridProtobuf.default_js)["vectorGrid"]
+
+
+class FuenteCuadrantes(MacroElement):
+    """
+    Geometría de los cuadrantes como promesa de JavaScript compartida por las
+    capas del mapa: se descarga de 'url' (archivo estático que el navegador
+    guarda en caché, con la URL de data_loader.url_estatica) o, si no hay url,
+    va incrustada una sola vez desde 'geojson'.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            {% if this.url %}
+            var {{ this.get_name() }} = fetch({{ this.url|tojson }}).then(function (r) { return r.json(); });
+            {% else %}
+            var {{ this.get_name() }} = Promise.resolve({{ this.geojson|safe }});
+            {% endif %}
+        {% endmacro %}
+    """)
+
+    def __init__(self, url=None, geojson=None):
+        super().__init__()
+        self._name = "FuenteCuadrantes"
+        self.url = url
+        self.geojson = geojson
+
+
+class CapaCuadrantes(JSCSSMixin, folium.FeatureGroup):
+    """
+    Capa de polígonos de cuadrantes. La geometría sale de teselas vectoriales
+    locales ('teselas', ver teselas.plantilla_teselas: solo se piden las
+    visibles) o de una FuenteCuadrantes. Con 'valores' la capa es coroplética:
+    solo muestra los cuadrantes listados y toma de ahí color y tooltip, así que
+    un cambio de filtro envía unos cuantos arreglos en lugar de la geometría.
+
+    valores = {"id": [...], "valor": [...], "color": [...],
+               "lista": [código por id], "listas": [textos]}
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup();
+            (function (grupo, mapa) {
+                var campos = {{ this.campos|tojson }};
+                var estilo = {{ this.estilo|tojson }};
+                var valores = {{ this.valores|tojson }};
+                var extra = {{ this.extra|tojson }};
+                var indice = {};
+                if (valores) {
+                    valores.id.forEach(function (id, i) { indice[id] = i; });
+                }
+                function visible(p) { return !valores || p.id in indice; }
+                function estiloDe(p) {
+                    if (!valores) { return estilo; }
+                    return Object.assign({}, estilo, {fillColor: valores.color[indice[p.id]]});
+                }
+                function fila(alias, valor) {
+                    return "<tr><th>" + alias + "</th><td>" + valor + "</td></tr>";
+                }
+                function contenido(p) {
+                    var filas = campos.map(function (c) { return fila(c[1], p[c[0]]); });
+                    if (valores) {
+                        var i = indice[p.id];
+                        filas.push(fila(extra.alias_lista, valores.listas[valores.lista[i]]));
+                        filas.push(fila(extra.alias_valor, valores.valor[i]));
+                    }
+                    return '<div style="' + extra.css + '"><table>' + filas.join("") + "</table></div>";
+                }
+                {% if this.teselas %}
+                var teselas = {{ this.teselas|tojson }};
+                var estilos = {};
+                // Un arreglo vacío de estilos no dibuja el polígono (cuadrantes sin predicción)
+                estilos[teselas.capa] = function (p) {
+                    return visible(p) ? Object.assign({fill: true}, estiloDe(p)) : [];
+                };
+                var capa = L.vectorGrid.protobuf(teselas.url, {
+                    vectorTileLayerStyles: estilos,
+                    interactive: true,
+                    minNativeZoom: teselas.zoom_min,
+                    maxNativeZoom: teselas.zoom_max,
+                    bounds: teselas.limites,
+                }).addTo(grupo);
+                var tooltip = L.tooltip({sticky: true});
+                capa.on("mouseover mousemove", function (e) {
+                    mapa.openTooltip(tooltip.setLatLng(e.latlng).setContent(contenido(e.layer.properties)));
+                });
+                capa.on("mouseout", function () { mapa.closeTooltip(tooltip); });
+                {% else %}
+                {{ this.fuente.get_name() }}.then(function (datos) {
+                    L.geoJson(datos, {
+                        filter: function (f) { return visible(f.properties); },
+                        style: function (f) { return estiloDe(f.properties); },
+                        onEachFeature: function (f, capa) {
+                            capa.bindTooltip(contenido(f.properties), {sticky: true});
+                        },
+                    }).addTo(grupo);
+                });
+                {% endif %}
+            })({{ this.get_name() }}, {{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    default_js = []
+
+    def __init__(self, name, campos, estilo, fuente=None, teselas=None, valores=None,
+                 alias_lista="", alias_valor="", css_tooltip=""):
+        super().__init__(name=name)
+        self._name = "CapaCuadrantes"
+        self.fuente = fuente
+        self.teselas = teselas
+        self.campos = campos
+        self.estilo = estilo
+        self.valores = valores
+        self.extra = {"alias_lista": alias_lista, "alias_valor": alias_valor, "css": css_tooltip}
+        if teselas:
+            self.default_js = [("vectorGrid", URL_VECTORGRID)]
+
+
+# Color de los cuadrantes sin valor (NaN o infinito): branca no define uno, se usa el de folium.Choropleth
+COLOR_SIN_VALOR = "#000000ff"
+
+
+def colores_escala(colormap, valores: np.ndarray) -> list:
+    """
+    Colores '#RRGGBBAA' de un LinearColormap para un arreglo de valores, sin llamar
+    al colormap por valor. Los valores no finitos reciben COLOR_SIN_VALOR.
+    """
+    valores = np.asarray(valores, dtype=float)
+    finitos = np.isfinite(valores)
+    indice = np.asarray(colormap.index, dtype=float)
+    colores = np.asarray(colormap.colors, dtype=float)
+    canales = np.column_stack([np.interp(valores[finitos], indice, colores[:, j]) for j in range(4)])
+    bytes_rgba = (canales * 255.9999).astype(int)
+    resultado = np.full(len(valores), COLOR_SIN_VALOR, dtype=object)
+    resultado[finitos] = ["#%02x%02x%02x%02x" % tuple(c) for c in bytes_rgba]
+    return resultado.tolist()
+
+
+# ======================================
+
 # CARGA Y PREPARACIÓN DE DATOS
-@st.cache_data
+@perfil.cache_medido(st.cache_resource)
 def load_cuadrantes(path_csv: str):
-    df = pd.read_csv(path_csv)
-
-    def parse_geo_shape(geo_string):
-        try:
-            geo_dict = ast.literal_eval(geo_string)
-            return shape(geo_dict)
-        except Exception:
-            return None
-
-    df["geometry"] = df["geo_shape"].apply(parse_geo_shape)
-    df = df[~df["geometry"].isna()].copy()
-
-    gdf = gpd.GeoDataFrame(
-        df,
-        geometry="geometry",
-        crs="EPSG:4326"
-    )
-    return gdf
-
+    # Geometrías desde la copia GeoParquet (se crea en la primera carga); compartidas, solo lectura
+    return cargar_cuadrantes(path_csv)
 
-@st.cache_data
-def load_predicciones(path_csv: str):
-    df = pd.read_csv(path_csv, parse_dates=["ds"])
-    return df
 
 # Rutas de los archivos
 RUTA_CUADRANTES = "bases_de_datos/cuadrantes.csv"
 RUTA_PREDICCIONES = "bases_de_datos/predicciones_xgb.csv"
 
 # Cargar los mapas y predicciones
+perfil.etapa("carga")
 try:
     gdf_cuadrantes = load_cuadrantes(RUTA_CUADRANTES)
 except FileNotFoundError:
@@ -89,16 +235,15 @@ if gdf_cuadrantes.empty:
     st.stop()
 
 try:
-    df_pred = load_predicciones(RUTA_PREDICCIONES)
+    # Filas crudas (para los percentiles de los KPIs) y cubo: compartidos entre sesiones, solo lectura
+    df_pred = filas_predicciones(RUTA_PREDICCIONES)
+    cubo_pred = cubo_predicciones(RUTA_PREDICCIONES)
 except FileNotFoundError:
     st.error(f"No se encontró el archivo `{RUTA_PREDICCIONES}`. Verifica la ruta.")
     st.stop()
 
 # =====================================================
 # MAPA DE PREDICCIONES XGBoost POR CUADRANTE
-df_pred["anio"] = df_pred["ds"].dt.year
-df_pred["mes"] = df_pred["ds"].dt.month
-
 # Enumeración de meses
 NOMBRE_MESES = {
     1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
@@ -181,11 +326,12 @@ st.markdown(filtros_css, unsafe_allow_html=True)
 
 # ======================================
 # FILTROS (AÑO, MES, DELITO, CELDA)
+perfil.etapa("filtros")
 col_f1, col_f2, col_f3, col_f4 = st.columns(4)
 
 with col_f1:
     st.markdown('<div class="filtro-label">Año de predicción:</div>', unsafe_allow_html=True)
-    anios_disponibles = sorted(df_pred["anio"].unique())
+    anios_disponibles = list(cubo_pred.index.levels[0])
     anio_sel = st.selectbox(
         "Año de predicción",
         options=anios_disponibles,
@@ -196,7 +342,7 @@ with col_f1:
 
 with col_f2:
     st.markdown('<div class="filtro-label">Mes de predicción:</div>', unsafe_allow_html=True)
-    meses_disp = sorted(df_pred[df_pred["anio"] == anio_sel]["mes"].unique())
+    meses_disp = list(cubo_pred.loc[anio_sel].index.get_level_values("mes").unique())
     opciones_meses = [NOMBRE_MESES[m] for m in meses_disp]
     nombre_mes_sel = st.selectbox(
         "Mes de predicción",
@@ -209,8 +355,8 @@ with col_f2:
 
 with col_f3:
     st.markdown('<div class="filtro-label">Tipo de robo:</div>', unsafe_allow_html=True)
-    delitos_unicos = sorted(df_pred["delito"].unique())
-    opciones_delito = ["Todos los delitos"] + delitos_unicos
+    delitos_unicos = [d for d in cubo_pred.index.levels[2] if d != TODOS_LOS_DELITOS]
+    opciones_delito = [TODOS_LOS_DELITOS] + delitos_unicos
     delito_sel = st.selectbox(
         "Tipo de robo",
         options=opciones_delito,
@@ -221,7 +367,7 @@ with col_f3:
 
 with col_f4:
     st.markdown('<div class="filtro-label">ID del cuadrante :</div>', unsafe_allow_html=True)
-    ids_unicos = sorted(df_pred["cell_id"].unique())
+    ids_unicos = list(cubo_pred.index.levels[3])
     opciones_celda = ["Todos los cuadrantes"] + [str(i) for i in ids_unicos]
     celda_sel = st.selectbox(
         "ID del cuadrante",
@@ -243,35 +389,39 @@ with col_var:
         label_visibility="collapsed"
     )
 
-# Base global para rangos de colores
-df_pred_base = df_pred[
-    (df_pred["anio"] == anio_sel) &
-    (df_pred["mes"] == mes_sel)
-].copy()
-
-if delito_sel != "Todos los delitos":
-    df_pred_base = df_pred_base[df_pred_base["delito"] == delito_sel]
+# Celdas del mes y delito (base global para rangos de colores): rebanada del cubo
+df_pred_base = rebanada_predicciones(cubo_pred, anio_sel, mes_sel, delito_sel)
 
 # Filtro para KPIs y mapa
-df_pred_filtro = df_pred_base.copy()
-
+df_pred_agg = df_pred_base
 if celda_sel != "Todos los cuadrantes":
     id_celda = int(celda_sel)
+    df_pred_agg = df_pred_agg[df_pred_agg["cell_id"] == id_celda]
+
+# Filas del mes (para los percentiles de los KPIs): df_pred está ordenado por fecha
+inicio_mes = pd.Timestamp(year=int(anio_sel), month=int(mes_sel), day=1)
+desde, hasta = df_pred["ds"].searchsorted([inicio_mes, inicio_mes + pd.DateOffset(months=1)])
+df_pred_filtro = df_pred.iloc[desde:hasta]
+if delito_sel != TODOS_LOS_DELITOS:
+    df_pred_filtro = df_pred_filtro[df_pred_filtro["delito"] == delito_sel]
+if celda_sel != "Todos los cuadrantes":
     df_pred_filtro = df_pred_filtro[df_pred_filtro["cell_id"] == id_celda]
 
 # ======================================
 # KPIs + MAPA
-if df_pred_filtro.empty:
+perfil.etapa("kpis_mapa")
+perfil.registrar(filas=len(df_pred_filtro) + len(df_pred_base))
+if df_pred_agg.empty:
     st.info("No hay predicciones para esa combinación de filtros.")
 else:
     # KPIs PRINCIPALES
     kpi1, kpi2, kpi3, kpi4 = st.columns(4)
 
     # Robos esperados en el mes - Se suman las predicciones
-    total_robos = df_pred_filtro["yhat_cnt_xgb"].sum()
+    total_robos = df_pred_agg["suma_cnt"].sum()
 
     # Riesgo promedio en el subset
-    riesgo_prom = df_pred_filtro["score"].mean()
+    riesgo_prom = df_pred_agg["suma_score"].sum() / df_pred_agg["n"].sum()
 
     # Cuadrantes críticos en el subset percentil 75
     umbral_alto = df_pred_filtro["score"].quantile(0.75)
@@ -314,74 +464,69 @@ else:
     # MAPA DE PREDICCIONES
     # ============================
     
-    # 1. Agrupación avanzada: Promedio del valor Y lista de delitos únicos
-    # Usamos .agg() para aplicar funciones diferentes a cada columna
-    df_pred_agg = (
-        df_pred_filtro
-        .groupby("cell_id", as_index=False)
-        .agg({
-            variable_sel: "mean",                                  # Promedio del score/conteo
-            "delito": lambda x: ", ".join(sorted(x.unique()))      # Lista de delitos separados por coma
-        })
-    )
-    
-    # Renombramos la columna 'delito' para que se vea claro en el código
-    df_pred_agg.rename(columns={"delito": "lista_delitos"}, inplace=True)
-
-    # Unión de cuadrantes con predicciones
-    gdf_pred = gdf_cuadrantes.merge(
-        df_pred_agg,
-        left_on="id",
-        right_on="cell_id",
-        how="inner"
-    )
+    # Cuadrantes con geometría y su predicción: promedio del valor y lista de delitos por celda (del cubo)
+    medidas = medidas_cuadrantes(RUTA_CUADRANTES)
+    df_mapa_pred = df_pred_agg[df_pred_agg["cell_id"].isin(medidas.index)]
 
-    if gdf_pred.empty:
+    if df_mapa_pred.empty:
         st.info("No hay cuadrantes con geometría para esas predicciones.")
     else:
         # Calcular rangos globales para el color (igual que antes)
-        df_pred_agg_global = df_pred_base.groupby("cell_id", as_index=False)[variable_sel].mean()
-        vmin = df_pred_agg_global[variable_sel].min()
-        vmax = df_pred_agg_global[variable_sel].max()
+        vmin = df_pred_base[variable_sel].min()
+        vmax = df_pred_base[variable_sel].max()
         if vmin == vmax: vmax = vmin + 1e-6
 
-        # Formato de fechas para evitar errores en el GeoJSON
-        datetime_cols = gdf_pred.select_dtypes(include=["datetime64[ns]", "datetime64[ns, UTC]"]).columns
-        for c in datetime_cols:
-            gdf_pred[c] = gdf_pred[c].dt.strftime("%Y-%m-%d")
-
-        # Centro del mapa
-        centro_pred = gdf_pred.geometry.unary_union.centroid
-        centro_lat_pred = centro_pred.y
-        centro_lon_pred = centro_pred.x
+        # Centro y límites del mapa con las medidas precalculadas de los cuadrantes
+        centro_pred, limites_pred = encuadre(medidas, df_mapa_pred["cell_id"])
+        # Con un solo cuadrante se encuadra su alcaldía, para verlo en contexto
+        if celda_sel != "Todos los cuadrantes":
+            extension = extension_alcaldias(RUTA_CUADRANTES)
+            alcaldia_celda = medidas.at[id_celda, "alcaldia"]
+            if alcaldia_celda in extension.index:
+                caja = extension.loc[alcaldia_celda]
+                limites_pred = [[float(caja["sur"]), float(caja["oeste"])], [float(caja["norte"]), float(caja["este"])]]
 
         mapa_pred = folium.Map(
-            location=[centro_lat_pred, centro_lon_pred],
+            location=centro_pred,
             zoom_start=11,
             tiles="CartoDB positron"
         )
+        mapa_pred.fit_bounds(limites_pred)
+
+        # Geometría de los cuadrantes: teselas vectoriales locales si ya se generaron (python teselas.py);
+        # si no, un archivo estático que el navegador descarga una vez por versión o, sin archivos
+        # estáticos habilitados, incrustada en el mapa
+        teselas = plantilla_teselas("cuadrantes")
+        if teselas:
+            origen = {"teselas": teselas}
+        else:
+            if st.get_option("server.enableStaticServing"):
+                fuente = FuenteCuadrantes(url=url_capa_cuadrantes(RUTA_CUADRANTES))
+            else:
+                fuente = FuenteCuadrantes(geojson=capa_cuadrantes(RUTA_CUADRANTES))
+            fuente.add_to(mapa_pred)
+            perfil.registrar(payload=fuente.url or fuente.geojson)
+            origen = {"fuente": fuente}
 
         # Capa base (Sectores)
-        tooltip_base = folium.GeoJsonTooltip(
-            fields=["id", "alcaldia", "zona", "sector", "no_region", "no_cuadran"],
-            aliases=["ID:", "Alcaldía:", "Zona:", "Sector:", "Región:", "Cuadrante:"],
-            sticky=True
-        )
-        folium.GeoJson(
-            gdf_cuadrantes.to_json(),
-            name="Sectores de patrullaje",
-            tooltip=tooltip_base,
-            style_function=lambda feature: {
+        CapaCuadrantes(
+            "Sectores de patrullaje",
+            campos=list(zip(
+                ["id", "alcaldia", "zona", "sector", "no_region", "no_cuadran"],
+                ["ID:", "Alcaldía:", "Zona:", "Sector:", "Región:", "Cuadrante:"],
+            )),
+            estilo={
                 "fillColor": "rgba(0, 0, 255, 0.1)",
                 "color": "black",
                 "weight": 1,
                 "fillOpacity": 0.1,
             },
+            **origen,
         ).add_to(mapa_pred)
 
         # Configuración del ColorMap
         colormap = cm.linear.YlOrRd_09.scale(vmin, vmax)
-        etiqueta_delito = "Todos los delitos" if delito_sel == "Todos los delitos" else delito_sel
+        etiqueta_delito = delito_sel
         
         if celda_sel != "Todos los cuadrantes":
             extra_celda = f" - Cuadrante {celda_sel}"
@@ -390,35 +535,146 @@ else:
         
         colormap.caption = f"Nivel de riesgo ({variable_sel}) - {etiqueta_delito} - {nombre_mes_sel} {anio_sel}{extra_celda}"
 
-        # --- CAMBIO CLAVE EN EL TOOLTIP ---
-        # Ahora mostramos 'lista_delitos' que contiene los delitos reales del cuadrante
-        tooltip_pred = folium.GeoJsonTooltip(
-            fields=["id", "alcaldia", "zona", "sector", "lista_delitos", variable_sel],
-            aliases=["ID:", "Alcaldía:", "Zona:", "Sector:", "Delitos previstos:", "Predicción:"],
-            sticky=True,
-            style="""
-                background-color: #F0F0F0; 
-                border: 1px solid black; 
-                border-radius: 3px; 
-                box-shadow: 3px 3px 3px rgba(0,0,0,0.2);
-                max-width: 300px;  /* Limitamos el ancho para que la lista no se salga */
-                font-size: 12px;
-            """
-        )
-
-        folium.GeoJson(
-            gdf_pred.to_json(),
-            name="Predicciones XGB",
-            style_function=lambda feature: {
-                "fillColor": colormap(feature["properties"][variable_sel]),
-                "color": "black",
-                "weight": 1,
-                "fillOpacity": 0.7,
-            },
-            tooltip=tooltip_pred,
+        # Capa de predicciones: solo viajan id, valor, color y lista de delitos (como código) por cuadrante
+        valores_pred = df_mapa_pred[variable_sel].to_numpy(dtype=float)
+        codigos_lista, listas = pd.factorize(df_mapa_pred["lista_delitos"])
+        valores_capa = {
+            "id": df_mapa_pred["cell_id"].tolist(),
+            "valor": valores_pred.tolist(),
+            "color": colores_escala(colormap, valores_pred),
+            "lista": codigos_lista.tolist(),
+            "listas": list(listas),
+        }
+        perfil.registrar(payload=valores_capa)
+        CapaCuadrantes(
+            "Predicciones XGB",
+            campos=list(zip(["id", "alcaldia", "zona", "sector"], ["ID:", "Alcaldía:", "Zona:", "Sector:"])),
+            estilo={"color": "black", "weight": 1, "fillOpacity": 0.7},
+            valores=valores_capa,
+            alias_lista="Delitos previstos:",
+            alias_valor="Predicción:",
+            # Limitamos el ancho para que la lista no se salga
+            css_tooltip="background-color: #F0F0F0; max-width: 300px; white-space: normal; font-size: 12px;",
+            **origen,
         ).add_to(mapa_pred)
 
         colormap.add_to(mapa_pred)
         folium.LayerControl().add_to(mapa_pred)
 
-        st_folium(mapa_pred, width="100%", height=600)
\ No newline at end of file
+        st_folium(mapa_pred, width="100%", height=600)
+
+    # ============================
+    # CUADRANTES PRIORITARIOS
+    # ============================
+    st.markdown("---")
+    st.markdown('<div class="filtro-label">Cuadrantes con mayor riesgo:</div>', unsafe_allow_html=True)
+    n_top = st.number_input(
+        "Número de cuadrantes",
+        min_value=1,
+        max_value=max(1, len(df_pred_base)),
+        value=min(10, max(1, len(df_pred_base))),
+        step=1,
+        key="top_n_policia",
+    )
+
+    # Selección parcial sobre las celdas de la rebanada del cubo (todas las celdas del mes y delito)
+    top = df_pred_base.iloc[indices_mayores(df_pred_base[variable_sel].to_numpy(), n_top)]
+    datos_top = medidas.reindex(top["cell_id"].to_numpy())
+    tabla_top = pd.DataFrame({
+        "Posición": np.arange(1, len(top) + 1),
+        "ID": top["cell_id"].to_numpy(),
+        "Alcaldía": datos_top["alcaldia"].to_numpy(),
+        "Zona": datos_top["zona"].to_numpy(),
+        "Sector": datos_top["sector"].to_numpy(),
+        "Probabilidad (score)": top["score"].to_numpy(),
+        "Conteo esperado": top["yhat_cnt_xgb"].to_numpy(),
+        "Delitos previstos": top["lista_delitos"].to_numpy(),
+    })
+    perfil.registrar(filas=len(df_pred_base), payload=tabla_top)
+    st.dataframe(
+        tabla_top,
+        hide_index=True,
+        column_config={
+            "Probabilidad (score)": st.column_config.NumberColumn(format="%.3f"),
+            "Conteo esperado": st.column_config.NumberColumn(format="%.2f"),
+        },
+    )
+
+    # ============================
+    # OPTIMIZADOR DE PATRULLAJE
+    # ============================
+    st.markdown("---")
+    st.markdown('<div class="filtro-label">Asignación de patrullas:</div>', unsafe_allow_html=True)
+    col_o1, col_o2, col_o3 = st.columns(3)
+    with col_o1:
+        modo_patrullaje = st.radio(
+            "Modo",
+            options=["Cuadrantes individuales", "Rutas contiguas"],
+            horizontal=True,
+            key="modo_patrullaje_policia",
+        )
+    with col_o2:
+        k_patrullas = st.number_input(
+            "Número de patrullas (K)", min_value=1, max_value=100, value=10, step=1, key="k_patrullas_policia"
+        )
+    with col_o3:
+        tam_ruta = st.number_input(
+            "Cuadrantes por ruta", min_value=2, max_value=20, value=4, step=1, key="tam_ruta_policia",
+            disabled=modo_patrullaje != "Rutas contiguas",
+        )
+
+    # Robos esperados del mes (delito seleccionado) por cuadrante, en el orden del grafo de adyacencia
+    ids_grafo, indptr_grafo, vecinos_grafo = grafo_cuadrantes(RUTA_CUADRANTES)
+    robos_celda = (
+        pd.Series(df_pred_base["suma_cnt"].to_numpy(), index=df_pred_base["cell_id"].to_numpy())
+        .reindex(ids_grafo, fill_value=0.0)
+        .to_numpy()
+    )
+    rutas = asignar_patrullaje(
+        robos_celda, indptr_grafo, vecinos_grafo, k_patrullas,
+        tam_ruta if modo_patrullaje == "Rutas contiguas" else 1,
+    )
+    perfil.registrar(filas=len(ids_grafo))
+
+    cubiertos = sum(robos_celda[r].sum() for r in rutas)
+    total_mes = robos_celda.sum()
+    pct_cubierto = cubiertos / total_mes * 100 if total_mes > 0 else 0.0
+    n_cuadrantes = sum(len(r) for r in rutas)
+
+    kpi_o1, kpi_o2, kpi_o3 = st.columns(3)
+    with kpi_o1:
+        st.markdown(f"""
+        <div class="kpi-card">
+            <div class="kpi-label">Robos esperados cubiertos</div>
+            <div class="kpi-value">{cubiertos:,.1f}</div>
+        </div>
+        """, unsafe_allow_html=True)
+    with kpi_o2:
+        st.markdown(f"""
+        <div class="kpi-card">
+            <div class="kpi-label">Cobertura del total del mes</div>
+            <div class="kpi-value">{pct_cubierto:.1f}%</div>
+        </div>
+        """, unsafe_allow_html=True)
+    with kpi_o3:
+        st.markdown(f"""
+        <div class="kpi-card">
+            <div class="kpi-label">Cuadrantes asignados</div>
+            <div class="kpi-value">{n_cuadrantes}</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    alcaldia_grafo = medidas["alcaldia"].reindex(ids_grafo).to_numpy()
+    tabla_rutas = pd.DataFrame({
+        "Patrulla": np.arange(1, len(rutas) + 1),
+        "Cuadrantes": [", ".join(str(i) for i in ids_grafo[r]) for r in rutas],
+        "Alcaldías": [", ".join(pd.unique(alcaldia_grafo[r].astype(str))) for r in rutas],
+        "Robos esperados": [robos_celda[r].sum() for r in rutas],
+    })
+    st.dataframe(
+        tabla_rutas,
+        hide_index=True,
+        column_config={"Robos esperados": st.column_config.NumberColumn(format="%.2f")},
+    )
+
+perfil.panel_perfil()
@@ -7,10 +7,16 @@ import altair as alt
 import numpy as np
 import json
 from datetime import timedelta
-from data_loader import load_data 
+from data_loader import (
+    load_data, periodos_disponibles, cubo_mensual, rollup_diario, cubo_dia_hora,
+    capa_limites, acumulado_diario, conteo_en_rango, version_datos,
+    DELITOS_PREFIJOS, FAMILIA_TOTAL,
+)
+from teselas import plantilla_teselas
+import perfilador as perfil
 import folium
 from streamlit_folium import st_folium
-from folium.plugins import HeatMap
+from folium.plugins import HeatMap, FastMarkerCluster, VectorGridProtobuf
 
 # ============================================================
 # Tema global 
@@ -40,126 +46,150 @@ if st.session_state.get("role") not in ["viewer"]:
 # ============================================================
 # Configuración de la página
 st.set_page_config(page_title="Dashboard  Usuario", layout="wide")
+#Perfilado opcional por sección (PERFIL_SECCIONES=1 o ?perfil=1)
+perfil.iniciar_perfil("Dashboard_usuario")
 
 # ============================================================
 # Controles de tamaño de texto (sidebar) 
-# Control para los textos de las KPIs
-tam_kpi = st.sidebar.number_input(
-    "Tamaño texto KPIs (Valor/Título)",
-    min_value=10,
-    max_value=40,
-    value=15,   
-    step=1,
-    key="tam_kpi_usuario_new"
-)
+#Estos controles solo cambian CSS: viven en su propio fragmento, así moverlos
+#no vuelve a ejecutar las secciones de la página
+def relanzar_si_cambia(clave: str, valor) -> None:
+    """
+    Relanza la página completa si 'valor' cambió desde la última ejecución.
+    Lo usan los fragmentos cuyos controles también afectan a otras secciones.
+    """
+    marca = f"_dibujado_{clave}"
+    anterior = st.session_state.get(marca, valor)
+    st.session_state[marca] = valor
+    if anterior != valor:
+        st.rerun()
+
+
+@st.fragment
+def controles_texto():
+    # Control para los textos de las KPIs
+    tam_kpi = st.number_input(
+        "Tamaño texto KPIs (Valor/Título)",
+        min_value=10,
+        max_value=40,
+        value=15,   
+        step=1,
+        key="tam_kpi_usuario_new"
+    )
 
-# Control para los textos de varianza de los KPIs
-tam_delta = st.sidebar.number_input(
-    "Tamaño texto Delta (+X.X%)",
-    min_value=8,
-    max_value=30,
-    value=16, 
-    step=1,
-    key="tam_delta_usuario"
-)
-#Control para el de las leyendas  de las graficas
-tam_graficas = st.sidebar.number_input(
-    "Tamaño texto gráficas (ejes/leyendas)",
-    min_value=8,
-    max_value=30,
-    value=12,
-    step=1,
-    key="tam_graficas_usuario",
-)
-#Control para el texto de los filtros
-tam_filtros = st.sidebar.number_input(
-    "Tamaño texto filtros",
-    min_value=10,
-    max_value=30,
-    value=17,      
-    step=1,
-    key="tam_filtros_usuario_new"
-)
+    # Control para los textos de varianza de los KPIs
+    tam_delta = st.number_input(
+        "Tamaño texto Delta (+X.X%)",
+        min_value=8,
+        max_value=30,
+        value=16, 
+        step=1,
+        key="tam_delta_usuario"
+    )
+    #Control para el de las leyendas  de las graficas
+    tam_graficas = st.number_input(
+        "Tamaño texto gráficas (ejes/leyendas)",
+        min_value=8,
+        max_value=30,
+        value=12,
+        step=1,
+        key="tam_graficas_usuario",
+    )
+    #Control para el texto de los filtros
+    tam_filtros = st.number_input(
+        "Tamaño texto filtros",
+        min_value=10,
+        max_value=30,
+        value=17,      
+        step=1,
+        key="tam_filtros_usuario_new"
+    )
 
-# Control para la altura de las tarjetas KPI
-altura_tarjetas_kpi = st.sidebar.number_input(
-    "Altura de las tarjetas KPI (px)",
-    min_value=100,
-    max_value=300,
-    value=150, 
-    step=10,
-    key="altura_tarjetas_kpi_usuario"
-)
+    # Control para la altura de las tarjetas KPI
+    altura_tarjetas_kpi = st.number_input(
+        "Altura de las tarjetas KPI (px)",
+        min_value=100,
+        max_value=300,
+        value=150, 
+        step=10,
+        key="altura_tarjetas_kpi_usuario"
+    )
+
+    # CSS global de las  METRICAS 
+    #Se utilizaron las variables definidas en el css global 
+    kpi_css = f"""
+    <style>
+    /* El contenedor general del KPI */
+    .kpi-card {{
+        background-color: #000275;
+        padding: 14px 18px;
+        border-radius: 0.75rem; 
+        min-height: {altura_tarjetas_kpi}px; 
+        color: #FFFFFF;
+        display: flex;
+        flex-direction: column;
+        justify-content: space-between;
+    }}
+
+    /* Etiqueta (texto de arriba) - Controlada por tam_kpi */
+    .kpi-label {{
+        font-size: {tam_kpi + 5}px; 
+        font-weight: 700;
+        line-height: 1.2;
+        opacity: 1;
+    }}
+
+    /* Valor principal de la KPI (El Número) - Controlada por tam_kpi */
+    .kpi-value {{
+        font-size: {tam_kpi + 15}px; 
+        font-weight: 800;
+        margin-top: 4px;
+    }}
+
+    /* Texto secundario (El Delta / Vs Mes Anterior) - 🟢 CONTROLADO POR tam_delta */
+    .kpi-sub {{
+        font-size: {tam_delta}px; 
+        font-weight: 600;
+        opacity: 0.9;
+        margin-top: 4px;
+        border-radius: 4px;
+        padding: 2px 6px;
+        display: inline-block;
+        width: fit-content;
+    }}
+
+    /* Clases para el color del delta */
+    .delta-normal {{ background-color: #19c95d; color: #FFFFFF; }} /* Verde para mejora */
+    .delta-inverse {{ background-color: #e73650; color: #FFFFFF; }} /* Rojo para alerta */
+    </style>
+    """
+    st.markdown(kpi_css, unsafe_allow_html=True)
+
+    # CSS para filtros 
+    filtros_css = f"""
+    <style>
+    /* Etiqueta personalizada de filtro */
+    .filtro-label {{
+        font-size: {tam_filtros}px;
+        font-weight: 500;
+        margin-bottom: 3px;
+    }}
+
+    /* Texto dentro de los selectbox (opción seleccionada) */
+    .stSelectbox div[data-baseweb="select"] > div {{
+        font-size: {tam_filtros - 1}px;
+    }}
+    </style>
+    """
+    st.markdown(filtros_css, unsafe_allow_html=True)
+
+    #El tamaño de texto de las gráficas sí requiere redibujarlas
+    relanzar_si_cambia("tam_graficas", tam_graficas)
 
-# ============================================================
-# CSS global de las  METRICAS 
-#Se utilizaron las variables definidas en el css global 
-kpi_css = f"""
-<style>
-/* El contenedor general del KPI */
-.kpi-card {{
-    background-color: #000275;
-    padding: 14px 18px;
-    border-radius: 0.75rem; 
-    min-height: {altura_tarjetas_kpi}px; 
-    color: #FFFFFF;
-    display: flex;
-    flex-direction: column;
-    justify-content: space-between;
-}}
-
-/* Etiqueta (texto de arriba) - Controlada por tam_kpi */
-.kpi-label {{
-    font-size: {tam_kpi + 5}px; 
-    font-weight: 700;
-    line-height: 1.2;
-    opacity: 1;
-}}
-
-/* Valor principal de la KPI (El Número) - Controlada por tam_kpi */
-.kpi-value {{
-    font-size: {tam_kpi + 15}px; 
-    font-weight: 800;
-    margin-top: 4px;
-}}
-
-/* Texto secundario (El Delta / Vs Mes Anterior) - 🟢 CONTROLADO POR tam_delta */
-.kpi-sub {{
-    font-size: {tam_delta}px; 
-    font-weight: 600;
-    opacity: 0.9;
-    margin-top: 4px;
-    border-radius: 4px;
-    padding: 2px 6px;
-    display: inline-block;
-    width: fit-content;
-}}
-
-/* Clases para el color del delta */
-.delta-normal {{ background-color: #19c95d; color: #FFFFFF; }} /* Verde para mejora */
-.delta-inverse {{ background-color: #e73650; color: #FFFFFF; }} /* Rojo para alerta */
-</style>
-"""
-st.markdown(kpi_css, unsafe_allow_html=True)
-
-# CSS para filtros 
-filtros_css = f"""
-<style>
-/* Etiqueta personalizada de filtro */
-.filtro-label {{
-    font-size: {tam_filtros}px;
-    font-weight: 500;
-    margin-bottom: 3px;
-}}
-
-/* Texto dentro de los selectbox (opción seleccionada) */
-.stSelectbox div[data-baseweb="select"] > div {{
-    font-size: {tam_filtros - 1}px;
-}}
-</style>
-"""
-st.markdown(filtros_css, unsafe_allow_html=True)
 
+with st.sidebar:
+    controles_texto()
+tam_graficas = st.session_state["tam_graficas_usuario"]
 
 # ============================================================
 # Inicio de la página 
@@ -197,88 +227,73 @@ st.markdown("---")
 # ============================================================
 #  CONSTANTES Y FUNCIONES
 #Definición de constantes y funciones para el filtrado de los datos
-DELITOS_PREFIJOS = [
-    "ROBO DE VEHICULO DE SERVICIO PARTICULAR",
-    "ROBO DE MOTOCICLETA",
-    "ROBO DE VEHICULO DE PEDALES",
-    "ROBO DE ACCESORIOS DE AUTO",
-    "ROBO DE OBJETOS DEL INTERIOR DE UN VEHICULO",
-]
-
+#DELITOS_PREFIJOS se define en data_loader: el almacén precalcula sus conteos por familia
 NOMBRE_MESES = {
     1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril", 5: "Mayo", 6: "Junio",
     7: "Julio", 8: "Agosto", 9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre",
 }
 
 
-@st.cache_data 
-def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Limpia la fecha y normaliza el texto de 'delito', creando columnas de tiempo."""
-    df["fecha_hecho"] = pd.to_datetime(df["fecha_hecho"], errors="coerce") #Convierte la columna a datetime
-    df = df.dropna(subset=["fecha_hecho"]) #Elimina filas con fechas inválidas
+def mes_anterior(anio: int, mes: int) -> tuple[int, int]:
+    """Devuelve el par (año, mes) del mes previo."""
+    return (anio - 1, 12) if mes == 1 else (anio, mes - 1)
 
-    if "delito" in df.columns:
-        df["delito"] = df["delito"].str.upper()
-    
-    df["anio"] = df["fecha_hecho"].dt.year #Crea columna de año
-    df["mes"] = df["fecha_hecho"].dt.month#Crea columna de mes
 
-    return df
+def formatear_delta(current_period: int, previous_period: int) -> tuple[str, bool]:
+    """Texto de la variación entre dos periodos y si el cambio es positivo."""
+    if previous_period > 0:
+        delta_value = ((current_period - previous_period) / previous_period) * 100
+        return f"{delta_value:+.1f}%", delta_value > 0
+    if current_period > 0:
+        return "Nuevos", True
+    return "0.0%", False
 
 
 def calculate_delta( #Función principal apra calcular la variación mensual de incidentes
-    df: pd.DataFrame, anio_filtro: int, mes_filtro: int, custom_filter: str | None = None,
+    cubo: pd.DataFrame, anio_filtro: int, mes_filtro: int, custom_filter: str | None = None,
 ) -> tuple[int, str, bool]:
     """
     Calcula incidentes del mes seleccionado completo vs. el mes anterior completo.
+    Lee el cubo mensual precalculado (índice anio/mes, una columna por familia).
     Devuelve el conteo, el delta crudo, y si el cambio es positivo.
     """
-    if df.empty or anio_filtro is None or mes_filtro is None:
+    if cubo.empty or anio_filtro is None or mes_filtro is None:
         return 0, "0.0%", False
 
-    df_filtered = df.copy()
-    if custom_filter: #Filtro por un tipo de delito en específico
-        df_filtered = df_filtered[df_filtered["delito"].str.contains(custom_filter, na=False)]
+    columna = custom_filter or FAMILIA_TOTAL #Filtro por un tipo de delito en específico
+
+    def conteo_periodo(anio, mes): #Búsqueda directa en el cubo; un mes sin datos cuenta 0
+        try:
+            return int(cubo.at[(anio, mes), columna])
+        except KeyError:
+            return 0
+
     #Conteo del periodo actual (mes seleccionado)
-    current_period = df_filtered[(df_filtered["anio"] == anio_filtro) & (df_filtered["mes"] == mes_filtro)].shape[0]
+    current_period = conteo_periodo(anio_filtro, mes_filtro)
 
     # Calcular mes anterior
-    if mes_filtro == 1:
-        previous_mes = 12
-        previous_anio = anio_filtro - 1
-    else: #Si no es enero, el mes anterior es el mes -1
-        previous_mes = mes_filtro - 1
-        previous_anio = anio_filtro
+    previous_anio, previous_mes = mes_anterior(anio_filtro, mes_filtro)
     #Conteo del periodo anterior (mes anterior)
-    previous_period = df_filtered[(df_filtered["anio"] == previous_anio) & (df_filtered["mes"] == previous_mes)].shape[0]
+    previous_period = conteo_periodo(previous_anio, previous_mes)
 #Caluclo de la varianza
-    if previous_period > 0:
-        delta_value = ((current_period - previous_period) / previous_period) * 100
-        raw_delta_str = f"{delta_value:+.1f}%"
-        is_positive = delta_value > 0
-    elif current_period > 0:
-        raw_delta_str = "Nuevos"
-        is_positive = True
-    else:
-        raw_delta_str = "0.0%"
-        is_positive = False
+    raw_delta_str, is_positive = formatear_delta(current_period, previous_period)
         
     return current_period, raw_delta_str, is_positive #Devuelve el conteo y si es positivo lo pinta verde 
 
 
 #Función para generar los graficos de linea
 def plot_delito_variation(
-    df: pd.DataFrame, delito_prefix: str, color_hex: str = "#FF4B4B"
+    rollup: pd.DataFrame, delito_prefix: str, color_hex: str = "#FF4B4B"
 ) -> None:
-    """Gráfico de línea de la evolución diaria de un delito."""
-    df_delito = df[df["delito"].str.contains(delito_prefix, na=False)]
+    """Gráfico de línea de la evolución diaria de un delito (a partir del rollup diario)."""
+    df_delito = rollup[rollup["familia"] == delito_prefix]
     #Función altair para gráfico de línea
     df_daily = (
-        df_delito.groupby(df_delito["fecha_hecho"].dt.date)
-        .size()
+        df_delito.groupby(df_delito["fecha"].dt.date)["total"]
+        .sum()
         .reset_index(name="total")
     )
-    df_daily.rename(columns={"fecha_hecho": "Fecha"}, inplace=True)
+    df_daily.rename(columns={"fecha": "Fecha"}, inplace=True)
 
     if df_daily.empty:
         st.info(f"No hay datos para el delito: {delito_prefix}")
@@ -302,308 +317,330 @@ def plot_delito_variation(
     st.altair_chart(chart, use_container_width=True)
 
 
+#Tamaño de celda de la rejilla del mapa de calor en grados (~300 m en la CDMX)
+TAM_CELDA_CALOR = 0.003
+
+
+def rejilla_calor(
+    latitud: np.ndarray, longitud: np.ndarray, tam_celda: float = TAM_CELDA_CALOR
+) -> list:
+    """
+    Agrupa todos los puntos en una rejilla fija y devuelve [lat, lon, peso] por
+    celda ocupada: el centroide de sus puntos y el conteo normalizado a 1. El
+    tamaño de la salida depende del área cubierta, no del número de incidentes.
+    """
+    lat = np.asarray(latitud, dtype="float64")
+    lon = np.asarray(longitud, dtype="float64")
+    if lat.size == 0:
+        return []
+    fila = np.floor((lat - lat.min()) / tam_celda).astype("int64")
+    col = np.floor((lon - lon.min()) / tam_celda).astype("int64")
+    celdas, celda = np.unique(fila * (col.max() + 1) + col, return_inverse=True)
+    conteo = np.bincount(celda, minlength=celdas.size)
+    centro_lat = np.bincount(celda, weights=lat) / conteo
+    centro_lon = np.bincount(celda, weights=lon) / conteo
+    peso = conteo / conteo.max()
+    return np.column_stack([centro_lat.round(5), centro_lon.round(5), peso.round(4)]).tolist()
+
+
 # ============================================================
 # 2. CARGA Y PREPROCESAMIENTO
 #Se define la carga y el preprocesamiento de los datos que se encuentra en el path de base de datos. 
+#Los periodos se leen de las particiones del almacén (año/mes) sin cargar filas
+RUTA_INCIDENTES = "bases_de_datos/df_rt.csv"
+perfil.etapa("carga")
 try:
-    df_raw = load_data(path="bases_de_datos/df_rt.csv") #carga el dataframe donde están los datos
-    df = preprocess_data(df_raw)
+    periodos = periodos_disponibles(RUTA_INCIDENTES)
 except Exception as e:
     st.error(f" No se pudieron cargar o preprocesar los datos: {e}")
     st.stop()
 
 
-if df.empty:
+if not periodos:
     st.error("El DataFrame está vacío después del preprocesamiento.")
     st.stop()
     
 # Determinar el último mes/año disponible para el valor por defecto
-if not df.empty:
-    max_date = df["fecha_hecho"].max()
-    default_anio = max_date.year
-    default_mes = max_date.month
-else:
-    default_anio = 2024
-    default_mes = 1
+default_anio, default_mes = periodos[-1]
+
+#Las KPIs se leen del cubo mensual precalculado (conteos por año, mes y familia)
+#El resto de secciones usa el historial, pero solo de robos relacionados con vehículos
+try:
+    cubo = cubo_mensual(RUTA_INCIDENTES)
+    #load_data ya entrega el frame preprocesado (fechas válidas, delito en mayúsculas, anio/mes/hora/día/familia)
+    #y su caché se indexa por ruta + versión de los datos: no hay que hashear el DataFrame en cada rerun.
+    #Es compartido entre sesiones, así que no se modifica en su lugar.
+    df_vehiculos = load_data(path=RUTA_INCIDENTES, delitos=DELITOS_PREFIJOS)
+    #Las gráficas de tendencia y el ranking leen el rollup diario materializado (fecha x familia x delito x alcaldía)
+    rollup = rollup_diario(RUTA_INCIDENTES)
+except Exception as e:
+    st.error(f" No se pudieron cargar o preprocesar los datos: {e}")
+    st.stop()
+perfil.etapa(None)
 
 
 # ============================================================
 # 3. Filtros para las metricas del inicio
-#Aqui se muestran los filros en una select box de Año y Mes para controlar las tarjteas de kpi 
-st.markdown("### Filtros de periodo para el resumen de incidentes")
+@st.fragment
+@perfil.seccion("kpis")
+def seccion_kpis():
+    #Aqui se muestran los filros en una select box de Año y Mes para controlar las tarjteas de kpi 
+    st.markdown("### Filtros de periodo para el resumen de incidentes")
 
-col_f1, col_f2, _ = st.columns([1, 1, 2])
+    col_f1, col_f2, _ = st.columns([1, 1, 2])
 
-# 1. Filtro de Año
-with col_f1:
-    st.markdown('<div class="filtro-label">Año de referencia:</div>', unsafe_allow_html=True)
+    # 1. Filtro de Año
+    with col_f1:
+        st.markdown('<div class="filtro-label">Año de referencia:</div>', unsafe_allow_html=True)
     
-    anios_disponibles = sorted(df["anio"].unique())
-    anio_sel_metricas = st.selectbox(
-        "Año de referencia",
-        options=anios_disponibles,
-        index=anios_disponibles.index(default_anio) if default_anio in anios_disponibles else len(anios_disponibles) - 1,
-        key="anio_metricas",
-        label_visibility="collapsed"
-    )
+        anios_disponibles = sorted({a for a, _ in periodos})
+        anio_sel_metricas = st.selectbox(
+            "Año de referencia",
+            options=anios_disponibles,
+            index=anios_disponibles.index(default_anio) if default_anio in anios_disponibles else len(anios_disponibles) - 1,
+            key="anio_metricas",
+            label_visibility="collapsed"
+        )
 
-# 2. Filtro de Mes
-with col_f2:
-    st.markdown('<div class="filtro-label">Mes de referencia:</div>', unsafe_allow_html=True)
-    #se crea un df temporal con la columna de año para filtrar los meses disponibles
-    df_temp = df[df["anio"] == anio_sel_metricas] 
-    meses_disp_num = sorted(df_temp["mes"].unique())
-    meses_disp_nombre = [NOMBRE_MESES[m] for m in meses_disp_num if m in NOMBRE_MESES]
-    #Se obtienen los meses disponibles en nombre y se selecciona el mes por defecto 
-    default_mes_nombre = NOMBRE_MESES.get(default_mes, meses_disp_nombre[-1])
-    default_index_mes = meses_disp_nombre.index(default_mes_nombre) if default_mes_nombre in meses_disp_nombre else len(meses_disp_nombre) - 1
+    # 2. Filtro de Mes
+    with col_f2:
+        st.markdown('<div class="filtro-label">Mes de referencia:</div>', unsafe_allow_html=True)
+        #se filtran los periodos del año seleccionado para obtener los meses disponibles
+        meses_disp_num = sorted(m for a, m in periodos if a == anio_sel_metricas)
+        meses_disp_nombre = [NOMBRE_MESES[m] for m in meses_disp_num if m in NOMBRE_MESES]
+        #Se obtienen los meses disponibles en nombre y se selecciona el mes por defecto 
+        default_mes_nombre = NOMBRE_MESES.get(default_mes, meses_disp_nombre[-1])
+        default_index_mes = meses_disp_nombre.index(default_mes_nombre) if default_mes_nombre in meses_disp_nombre else len(meses_disp_nombre) - 1
     
-    #Aqui se crea la select box para el mes
-    nombre_mes_sel = st.selectbox(
-        "Mes de referencia",
-        options=meses_disp_nombre,
-        index=default_index_mes,
-        key="mes_metricas",
-        label_visibility="collapsed"
-    )
-    #Convertimos el nombre del mes seleccionado a su valor numérico
-    mes_sel_metricas = [k for k, v in NOMBRE_MESES.items() if v == nombre_mes_sel][0]
+        #Aqui se crea la select box para el mes
+        nombre_mes_sel = st.selectbox(
+            "Mes de referencia",
+            options=meses_disp_nombre,
+            index=default_index_mes,
+            key="mes_metricas",
+            label_visibility="collapsed"
+        )
+        #Convertimos el nombre del mes seleccionado a su valor numérico
+        mes_sel_metricas = [k for k, v in NOMBRE_MESES.items() if v == nombre_mes_sel][0]
 
 
-delito_filtro_total = None
+    delito_filtro_total = None
     
-etiqueta_mes = f"({nombre_mes_sel} {anio_sel_metricas})"
+    etiqueta_mes = f"({nombre_mes_sel} {anio_sel_metricas})"
 
-st.markdown("---")
-
-# ============================================================
-# 4. MÉTRICAS KPI CARDS
-#Se crean las tarjetas de kpi con los datos filtrados, usando una estrucutra html para un diseño más libre
-st.markdown(f"### Resumen de incidentes por mes {etiqueta_mes}")
-
-cols_kpis_total = st.columns(5)  # Se crean 5 columnas para que el kpi tenga el mimsmo ancho  que los otros 5 kpi 
-
-# KPI total
-with cols_kpis_total[0]: 
-    total_incidentes, delta_raw, is_positive = calculate_delta( #Calcula la variación a partir de los filtros seleccionados
-        df, 
-        anio_filtro=anio_sel_metricas,
-        mes_filtro=mes_sel_metricas,
-        custom_filter=delito_filtro_total
-    )
-    
-    label_total = f"Total de incidentes" #Nombre que se va a mostrar en total incidentes
-    delta_class = "delta-inverse" if is_positive else "delta-normal"  #Si es positivo es verde si es opuesto es rojo
-
-    st.markdown(f"""
-        <div class="kpi-card">
-            <div class="kpi-label">{label_total}</div>
-            <div class="kpi-value">{total_incidentes:,.0f}</div>
-            <div class="kpi-sub {delta_class}">
-                {delta_raw} vs Mes Anterior
-            </div>
-        </div>
-    """, unsafe_allow_html=True) #Renderiza el HTML de la tarjeta
+    st.markdown("---")
 
+    # ============================================================
+    # 4. MÉTRICAS KPI CARDS
+    #Se crean las tarjetas de kpi con los datos filtrados, usando una estrucutra html para un diseño más libre
+    st.markdown(f"### Resumen de incidentes por mes {etiqueta_mes}")
 
-st.markdown(f"### Robos relacionados con vehículos ") 
-cols_delitos = st.columns(len(DELITOS_PREFIJOS)) #Se crean 5 columans para los 5 tipos de delitos. 
+    cols_kpis_total = st.columns(5)  # Se crean 5 columnas para que el kpi tenga el mimsmo ancho  que los otros 5 kpi 
 
-for i, delito in enumerate(DELITOS_PREFIJOS): #Se itera sobre la lista de los prefijos definidios anteriormente 
-    col = cols_delitos[i]
-    conteo, delta_raw, is_positive = calculate_delta( #Calcula la variación a partir de los filtros seleccionados
-        df, 
-        custom_filter=delito, 
-        anio_filtro=anio_sel_metricas,
-        mes_filtro=mes_sel_metricas,
-    )
-    
-    # Si es positivo es verde si es opuesto es rojo
-    delta_class = "delta-inverse" if is_positive else "delta-normal"
+    # KPI total
+    with cols_kpis_total[0]: 
+        total_incidentes, delta_raw, is_positive = calculate_delta( #Calcula la variación a partir de los filtros seleccionados
+            cubo, 
+            anio_filtro=anio_sel_metricas,
+            mes_filtro=mes_sel_metricas,
+            custom_filter=delito_filtro_total
+        )
     
-    with col: #Se pintan las tarjetas con la estructura html
+        label_total = f"Total de incidentes" #Nombre que se va a mostrar en total incidentes
+        delta_class = "delta-inverse" if is_positive else "delta-normal"  #Si es positivo es verde si es opuesto es rojo
+
         st.markdown(f"""
             <div class="kpi-card">
-                <div class="kpi-label">{delito.title()}</div>
-                <div class="kpi-value">{conteo:,.0f}</div>
+                <div class="kpi-label">{label_total}</div>
+                <div class="kpi-value">{total_incidentes:,.0f}</div>
                 <div class="kpi-sub {delta_class}">
                     {delta_raw} vs Mes Anterior
                 </div>
             </div>
-        """, unsafe_allow_html=True)
+        """, unsafe_allow_html=True) #Renderiza el HTML de la tarjeta
 
-# ============================================================
-# Tendencia diaria de robos de vehículos
-#Se muestra la tendencia diaria de robos de vehículos con filtros para año, mes y tipo de robo
-st.markdown("### Tendencia diaria de robos de vehículos")
 
-df_vehiculos = df[df["delito"].str.contains("|".join(DELITOS_PREFIJOS), na=False)].copy()
+    st.markdown(f"### Robos relacionados con vehículos ") 
+    cols_delitos = st.columns(len(DELITOS_PREFIJOS)) #Se crean 5 columans para los 5 tipos de delitos. 
 
-if df_vehiculos.empty:
-    st.info("No hay datos de esos tipos de robo en el dataset.")
-else:
-    col_filters, col_chart = st.columns([1, 3])
+    for i, delito in enumerate(DELITOS_PREFIJOS): #Se itera sobre la lista de los prefijos definidios anteriormente 
+        col = cols_delitos[i]
+        conteo, delta_raw, is_positive = calculate_delta( #Calcula la variación a partir de los filtros seleccionados
+            cubo, 
+            custom_filter=delito, 
+            anio_filtro=anio_sel_metricas,
+            mes_filtro=mes_sel_metricas,
+        )
+    
+        # Si es positivo es verde si es opuesto es rojo
+        delta_class = "delta-inverse" if is_positive else "delta-normal"
+    
+        with col: #Se pintan las tarjetas con la estructura html
+            st.markdown(f"""
+                <div class="kpi-card">
+                    <div class="kpi-label">{delito.title()}</div>
+                    <div class="kpi-value">{conteo:,.0f}</div>
+                    <div class="kpi-sub {delta_class}">
+                        {delta_raw} vs Mes Anterior
+                    </div>
+                </div>
+            """, unsafe_allow_html=True)
 
-    with col_filters: #Filtros para la grafica de tendencia 
-        st.markdown("#### Filtros")
 
-        anios_disponibles_graf = sorted(df_vehiculos["anio"].unique())
-        anio_seleccionado = st.selectbox("Año:", options=anios_disponibles_graf, key="graf_anio")
+seccion_kpis()
 
-        meses_disponibles = sorted(
-            df_vehiculos[df_vehiculos["anio"] == anio_seleccionado]["mes"].unique()
-        )
-        opciones_meses = [NOMBRE_MESES[m] for m in meses_disponibles if m in NOMBRE_MESES]
-        nombre_mes_sel_graf = st.selectbox("Mes:", options=opciones_meses, key="graf_mes")
+# ============================================================
+# KPIs por rango de fechas
+@st.fragment
+@perfil.seccion("rango_fechas")
+def seccion_rango_fechas():
+    #Ventanas móviles o rango libre; cada conteo sale de las sumas acumuladas diarias
+    #(dos búsquedas por ventana), así mover el slider no vuelve a recorrer filas
+    st.markdown("### Incidentes por rango de fechas")
+
+    acumulado_familias = acumulado_diario(RUTA_INCIDENTES)
+    acumulado_alcaldias = acumulado_diario(RUTA_INCIDENTES, por_alcaldia=True)
+
+    if acumulado_familias.empty:
+        st.info("No hay datos para calcular rangos de fechas.")
+    else:
+        #El índice termina en el día siguiente al último incidente
+        fecha_min = acumulado_familias.index[0].date()
+        fecha_max = acumulado_familias.index[-1].date() - timedelta(days=1)
 
-        mes_seleccionado = [k for k, v in NOMBRE_MESES.items() if v == nombre_mes_sel_graf][0]
+        col_ventana, col_alc_rango, col_rango = st.columns([1, 1, 2])
 
-        delito_seleccionado = st.selectbox( #Filtro por tipo de robo
-            "Tipo de robo:",
-            options=["Todos"] + DELITOS_PREFIJOS,
-            key="graf_delito"
+        with col_ventana: #Ventanas móviles que terminan en el último día con datos
+            ventana_rango = st.radio(
+                "Ventana:",
+                options=["Últimos 7 días", "Últimos 28 días", "Últimos 90 días", "Rango personalizado"],
+                key="ventana_rango",
+            )
+
+        with col_alc_rango: #Filtro por alcaldía (solo robos de vehículos)
+            alcaldias_rango = list(acumulado_alcaldias.columns.get_level_values(0).unique()) if not acumulado_alcaldias.empty else []
+            alcaldia_rango = st.selectbox("Alcaldía:", options=["Todas"] + alcaldias_rango, key="alcaldia_rango")
+
+        with col_rango:
+            if ventana_rango == "Rango personalizado":
+                inicio_rango, fin_rango = st.slider(
+                    "Rango de fechas:",
+                    min_value=fecha_min,
+                    max_value=fecha_max,
+                    value=(max(fecha_min, fecha_max - timedelta(days=27)), fecha_max),
+                    format="YYYY-MM-DD",
+                    key="rango_fechas",
+                )
+            else:
+                dias_ventana = int(ventana_rango.split()[1])
+                fin_rango = fecha_max
+                inicio_rango = fecha_max - timedelta(days=dias_ventana - 1)
+                st.markdown(f"Del **{inicio_rango:%Y-%m-%d}** al **{fin_rango:%Y-%m-%d}**")
+
+        if alcaldia_rango == "Todas":
+            acumulado = acumulado_familias
+            columnas_rango = [FAMILIA_TOTAL] + DELITOS_PREFIJOS
+        else:
+            acumulado = acumulado_alcaldias[alcaldia_rango].reindex(columns=DELITOS_PREFIJOS, fill_value=0)
+            columnas_rango = DELITOS_PREFIJOS
+
+        #Periodo actual vs. el periodo inmediato anterior de la misma duración
+        dias_rango = (fin_rango - inicio_rango).days + 1
+        conteo_rango = conteo_en_rango(acumulado, inicio_rango, fin_rango)
+        conteo_rango_previo = conteo_en_rango(
+            acumulado, inicio_rango - timedelta(days=dias_rango), inicio_rango - timedelta(days=1)
         )
 
-    df_mes = df_vehiculos[ #Filtro por año y mes seleccionado
-        (df_vehiculos["anio"] == anio_seleccionado)
-        & (df_vehiculos["mes"] == mes_seleccionado)
-    ].copy()
+        cols_rango = st.columns(len(columnas_rango))
+        for col, columna in zip(cols_rango, columnas_rango):
+            delta_raw, is_positive = formatear_delta(int(conteo_rango[columna]), int(conteo_rango_previo[columna]))
+            delta_class = "delta-inverse" if is_positive else "delta-normal"
+            etiqueta = "Total de incidentes" if columna == FAMILIA_TOTAL else columna.title()
+            with col:
+                st.markdown(f"""
+                    <div class="kpi-card">
+                        <div class="kpi-label">{etiqueta}</div>
+                        <div class="kpi-value">{int(conteo_rango[columna]):,.0f}</div>
+                        <div class="kpi-sub {delta_class}">
+                            {delta_raw} vs {dias_rango} días previos
+                        </div>
+                    </div>
+                """, unsafe_allow_html=True)
+
+
+seccion_rango_fechas()
 
-    if delito_seleccionado != "Todos": #Filtro para cuando se seleccione todos los  tipos de robo seleccionado
-        df_mes = df_mes[df_mes["delito"].str.contains(delito_seleccionado, na=False)] 
-        
-    titulo_grafica = ""
+# ============================================================
+# Tendencia diaria de robos de vehículos
+@st.fragment
+@perfil.seccion("tendencia")
+def seccion_tendencia():
+    #Se muestra la tendencia diaria de robos de vehículos con filtros para año, mes y tipo de robo
+    st.markdown("### Tendencia diaria de robos de vehículos")
+
+    if rollup.empty:
+        st.info("No hay datos de esos tipos de robo en el dataset.")
+    else:
+        col_filters, col_chart = st.columns([1, 3])
 
-    #Definición de la columna donde se va a pintar la grafica
-    with col_chart:
-        st.markdown(f"#### {titulo_grafica}")
+        with col_filters: #Filtros para la grafica de tendencia 
+            st.markdown("#### Filtros")
 
-        if df_mes.empty:
-            st.info("No hay datos para el filtro seleccionado (año / mes / tipo de robo).")
-        else: #Si hay datos, se pintan los datos de los datos encontrados en el df
-            df_mes["Fecha"] = df_mes["fecha_hecho"].dt.date
-            
-            df_daily_tipo = (
-                df_mes.groupby(["Fecha", "delito"])
-                .size()
-                .reset_index(name="total")
+            anios_disponibles_graf = sorted(rollup["anio"].unique())
+            anio_seleccionado = st.selectbox("Año:", options=anios_disponibles_graf, key="graf_anio")
+
+            meses_disponibles = sorted(
+                rollup[rollup["anio"] == anio_seleccionado]["mes"].unique()
             )
-            df_daily_tipo.rename(columns={"delito": "tipo_robo"}, inplace=True)
-            #Función altair para gráfico de línea
-            chart_evolucion = (
-                alt.Chart(df_daily_tipo)
-                .mark_line(point=True)
-                .encode(
-                    x=alt.X("Fecha:T", title="Fecha"), #Eje X - Fecha
-                    y=alt.Y("total:Q", title="Incidentes diarios"),#Eje Y - Incidentes diarios
-                    color=alt.Color("tipo_robo:N", title="Tipo de robo"), #Titulo de la leyenda
-                    tooltip=["Fecha:T", "tipo_robo:N", "total:Q"], #Información al pasar el mouse
-                )
-                .properties(height=280)
-                .configure_axis(
-                    labelFontSize=tam_graficas,
-                    titleFontSize=tam_graficas + 2,
-                )
-                .configure_legend(
-                    labelFontSize=tam_graficas,
-                    titleFontSize=tam_graficas + 2,
-                )
-                .interactive()
+            opciones_meses = [NOMBRE_MESES[m] for m in meses_disponibles if m in NOMBRE_MESES]
+            nombre_mes_sel_graf = st.selectbox("Mes:", options=opciones_meses, key="graf_mes")
+
+            mes_seleccionado = [k for k, v in NOMBRE_MESES.items() if v == nombre_mes_sel_graf][0]
+            #El ranking de alcaldías usa este mismo periodo: si cambia, se relanza la página
+            relanzar_si_cambia("periodo_tendencia", (anio_seleccionado, mes_seleccionado))
+
+            delito_seleccionado = st.selectbox( #Filtro por tipo de robo
+                "Tipo de robo:",
+                options=["Todos"] + DELITOS_PREFIJOS,
+                key="graf_delito"
             )
 
-            st.altair_chart(chart_evolucion, use_container_width=True)
+        df_mes = rollup[ #Filtro por año y mes seleccionado
+            (rollup["anio"] == anio_seleccionado)
+            & (rollup["mes"] == mes_seleccionado)
+        ].copy()
 
-# ============================================================
-# Proporción CON/SIN violencia
-#Analiza y visualiza los robos con y sin violencia encontrados en el dataset
-st.markdown("### Proporción de robos con y sin violencia")
-#Creamos una copia del df para no modificar el original
-base_violencia = df.copy()
-
-#Usamos los prefijos definidos para filtrar los robos relacionados con vehículos
-base_violencia = base_violencia[
-    base_violencia["delito"].str.contains("|".join(DELITOS_PREFIJOS), na=False)
-].copy()
-
-if base_violencia.empty:
-    st.info("No hay datos para esos tipos de robo.")
-else:#Si hay datos, se pintan los datos de los datos encontrados en el df
-    col_filters, col_chart = st.columns([1, 3])
-    #Filtro para poder seleccionar por tipo de robo 
-    with col_filters:
-        st.markdown("#### Filtros")
-        opcion_delito = st.selectbox(
-            "Filtrar por tipo de robo:",
-            options=["Todos"] + DELITOS_PREFIJOS,
-            key="filtro_violencia",
-        )
+        if delito_seleccionado != "Todos": #Filtro para cuando se seleccione todos los  tipos de robo seleccionado
+            df_mes = df_mes[df_mes["familia"] == delito_seleccionado] 
+        
+        titulo_grafica = ""
 
-    df_filtro = base_violencia.copy()
-    #Si se selecciona opción para todos muestra todos los tipos de robo
-    if opcion_delito != "Todos":
-        df_filtro = df_filtro[df_filtro["delito"].str.contains(opcion_delito, na=False)]
-
-    if df_filtro.empty:
-        st.info("No hay datos para ese filtro de delito.")
-    else: #Filtro para buscar tipo de robos si por violencia o sin violencia
-        df_filtro["tipo_violencia"] = np.where(
-            df_filtro["delito"].str.contains("CON VIOLENCIA", na=False),
-            "CON VIOLENCIA",
-            "SIN VIOLENCIA",
-        )
-        #Agrupamos y contamos los tipos que contengan violencia y los que no
-        conteo_violencia = (
-            df_filtro.groupby("tipo_violencia")
-            .size()
-            .reset_index(name="total")
-        )
+        #Definición de la columna donde se va a pintar la grafica
+        with col_chart:
+            st.markdown(f"#### {titulo_grafica}")
 
-        if conteo_violencia.empty:
-            st.info("No hay registros CON o SIN VIOLENCIA para este filtro.")
-        else:
-            #Pintamos la grafica de barras con los delitos violentos y no violentos. 
-            with col_chart:
-                barras = (
-                    alt.Chart(conteo_violencia)
-                    .mark_bar()
-                    .encode(
-                        x=alt.X( #Eje X - Tipo de violencia
-                            "tipo_violencia:N",
-                            title="",
-                            axis=alt.Axis(
-                                labelAngle=0,
-                                labelFontSize=tam_graficas,
-                                labelPadding=10,
-                            ),
-                        ),
-                        y=alt.Y( #Eje Y - Número de incidentes
-                            "total:Q",
-                            title="Número de incidentes",
-                        ),
-                        color=alt.Color(
-                            "tipo_violencia:N",
-                            title="Tipo de incidente",
-                            scale=alt.Scale(
-                                domain=["CON VIOLENCIA", "SIN VIOLENCIA"],
-                                range=["#FF4B4B", "#4CAF50"],
-                            ),
-                        ), #Cuanto pasamos el mouse por encima muestra la información
-                        tooltip=["tipo_violencia:N", "total:Q"],
-                    )
-                    .properties(width=450, height=280)
+            if df_mes.empty:
+                st.info("No hay datos para el filtro seleccionado (año / mes / tipo de robo).")
+            else: #Si hay datos, se pintan los datos de los datos encontrados en el df
+                df_mes["Fecha"] = df_mes["fecha"].dt.date
+            
+                df_daily_tipo = (
+                    df_mes.groupby(["Fecha", "delito"], observed=True)["total"]
+                    .sum()
+                    .reset_index(name="total")
                 )
-
-                etiquetas = ( #Etiquetas de los totales encima de las barras
-                    alt.Chart(conteo_violencia)
-                    .mark_text(dy=-8, fontSize=tam_graficas)
+                df_daily_tipo.rename(columns={"delito": "tipo_robo"}, inplace=True)
+                #Función altair para gráfico de línea
+                chart_evolucion = (
+                    alt.Chart(df_daily_tipo)
+                    .mark_line(point=True)
                     .encode(
-                        x="tipo_violencia:N",
-                        y="total:Q",
-                        text=alt.Text("total:Q", format=","),
+                        x=alt.X("Fecha:T", title="Fecha"), #Eje X - Fecha
+                        y=alt.Y("total:Q", title="Incidentes diarios"),#Eje Y - Incidentes diarios
+                        color=alt.Color("tipo_robo:N", title="Tipo de robo"), #Titulo de la leyenda
+                        tooltip=["Fecha:T", "tipo_robo:N", "total:Q"], #Información al pasar el mouse
                     )
-                )
-                chart_barras = (
-                    (barras + etiquetas)
+                    .properties(height=280)
                     .configure_axis(
                         labelFontSize=tam_graficas,
                         titleFontSize=tam_graficas + 2,
@@ -612,263 +649,391 @@ else:#Si hay datos, se pintan los datos de los datos encontrados en el df
                         labelFontSize=tam_graficas,
                         titleFontSize=tam_graficas + 2,
                     )
+                    .interactive()
                 )
 
-                st.altair_chart(chart_barras, use_container_width=True)
+                st.altair_chart(chart_evolucion, use_container_width=True)
+                perfil.registrar(filas=len(rollup), payload=df_daily_tipo)
+
+
+seccion_tendencia()
+
+# ============================================================
+# Proporción CON/SIN violencia
+@st.fragment
+@perfil.seccion("violencia")
+def seccion_violencia():
+    #Analiza y visualiza los robos con y sin violencia encontrados en el dataset
+    st.markdown("### Proporción de robos con y sin violencia")
+    #El df de vehículos ya viene filtrado por los prefijos; es compartido, así que no se copia ni se modifica
+    base_violencia = df_vehiculos
+
+    if base_violencia.empty:
+        st.info("No hay datos para esos tipos de robo.")
+    else:#Si hay datos, se pintan los datos de los datos encontrados en el df
+        col_filters, col_chart = st.columns([1, 3])
+        #Filtro para poder seleccionar por tipo de robo 
+        with col_filters:
+            st.markdown("#### Filtros")
+            opcion_delito = st.selectbox(
+                "Filtrar por tipo de robo:",
+                options=["Todos"] + DELITOS_PREFIJOS,
+                key="filtro_violencia",
+            )
+
+        df_filtro = base_violencia
+        #Si se selecciona opción para todos muestra todos los tipos de robo
+        if opcion_delito != "Todos":
+            df_filtro = df_filtro[df_filtro["familia"] == opcion_delito]
+
+        if df_filtro.empty:
+            st.info("No hay datos para ese filtro de delito.")
+        else: #Filtro para buscar tipo de robos si por violencia o sin violencia
+            #La etiqueta va en una serie aparte en lugar de una columna nueva: así no hay que copiar df_filtro
+            tipo_violencia = pd.Series(
+                np.where(
+                    df_filtro["delito"].str.contains("CON VIOLENCIA", na=False),
+                    "CON VIOLENCIA",
+                    "SIN VIOLENCIA",
+                ),
+                index=df_filtro.index,
+                name="tipo_violencia",
+            )
+            #Agrupamos y contamos los tipos que contengan violencia y los que no
+            conteo_violencia = (
+                tipo_violencia.groupby(tipo_violencia)
+                .size()
+                .reset_index(name="total")
+            )
+
+            if conteo_violencia.empty:
+                st.info("No hay registros CON o SIN VIOLENCIA para este filtro.")
+            else:
+                #Pintamos la grafica de barras con los delitos violentos y no violentos. 
+                with col_chart:
+                    barras = (
+                        alt.Chart(conteo_violencia)
+                        .mark_bar()
+                        .encode(
+                            x=alt.X( #Eje X - Tipo de violencia
+                                "tipo_violencia:N",
+                                title="",
+                                axis=alt.Axis(
+                                    labelAngle=0,
+                                    labelFontSize=tam_graficas,
+                                    labelPadding=10,
+                                ),
+                            ),
+                            y=alt.Y( #Eje Y - Número de incidentes
+                                "total:Q",
+                                title="Número de incidentes",
+                            ),
+                            color=alt.Color(
+                                "tipo_violencia:N",
+                                title="Tipo de incidente",
+                                scale=alt.Scale(
+                                    domain=["CON VIOLENCIA", "SIN VIOLENCIA"],
+                                    range=["#FF4B4B", "#4CAF50"],
+                                ),
+                            ), #Cuanto pasamos el mouse por encima muestra la información
+                            tooltip=["tipo_violencia:N", "total:Q"],
+                        )
+                        .properties(width=450, height=280)
+                    )
+
+                    etiquetas = ( #Etiquetas de los totales encima de las barras
+                        alt.Chart(conteo_violencia)
+                        .mark_text(dy=-8, fontSize=tam_graficas)
+                        .encode(
+                            x="tipo_violencia:N",
+                            y="total:Q",
+                            text=alt.Text("total:Q", format=","),
+                        )
+                    )
+                    chart_barras = (
+                        (barras + etiquetas)
+                        .configure_axis(
+                            labelFontSize=tam_graficas,
+                            titleFontSize=tam_graficas + 2,
+                        )
+                        .configure_legend(
+                            labelFontSize=tam_graficas,
+                            titleFontSize=tam_graficas + 2,
+                        )
+                    )
+
+                    st.altair_chart(chart_barras, use_container_width=True)
+                    perfil.registrar(filas=len(base_violencia), payload=conteo_violencia)
+
+
+seccion_violencia()
 
 # ============================================================
 # Alcaldías con más y menos robos
-#Muestra el ranking de alcaldías con más y menos robos según los filtros seleccionados 
-st.markdown("### Alcaldías con más y menos robos")
+@st.fragment
+@perfil.seccion("ranking")
+def seccion_ranking():
+    #Muestra el ranking de alcaldías con más y menos robos según los filtros seleccionados 
+    st.markdown("### Alcaldías con más y menos robos")
 
-#Definimos la columna para verificar si existe alcaldia_hecho_N o alcaldia_hecho
-col_alc = (
-    "alcaldia_hecho_N" if "alcaldia_hecho_N" in df_vehiculos.columns else "alcaldia_hecho"
-)
+    #El rollup ya resuelve si se usa alcaldia_hecho_N o alcaldia_hecho en la columna "alcaldia"
+    col_alc = "alcaldia"
 
-col_filters, col_charts = st.columns([1, 3])
- #Filtros para poder seleccionar por tipo de robo 
-with col_filters:
-    st.markdown("#### Filtros")
-    delito_barras = st.selectbox(
-        "Tipo de robo para el ranking de alcaldías:",
-        options=["Todos"] + DELITOS_PREFIJOS,
-        key="delito_barras",
-    )
+    col_filters, col_charts = st.columns([1, 3])
+     #Filtros para poder seleccionar por tipo de robo 
+    with col_filters:
+        st.markdown("#### Filtros")
+        delito_barras = st.selectbox(
+            "Tipo de robo para el ranking de alcaldías:",
+            options=["Todos"] + DELITOS_PREFIJOS,
+            key="delito_barras",
+        )
     
-try: #Se filtran por año y mes seleccionado
-    current_anio_rank = anio_seleccionado
-    current_mes_rank = mes_seleccionado
-except NameError:
-    current_anio_rank = df["anio"].max()
-    current_mes_rank = df[df["anio"] == current_anio_rank]["mes"].max()
-
-#Se define el df top para poder hacer el ranking
-df_top = df_vehiculos[
-    (df_vehiculos["anio"] == current_anio_rank)
-    & (df_vehiculos["mes"] == current_mes_rank)
-].copy()
-
-#Se pinta la grafica de barras para grafcarlo cuando tenga la opción de todos.
-if delito_barras != "Todos":
-    df_top = df_top[df_top["delito"].str.contains(delito_barras, na=False)]
-
-
-if df_top.empty:
-    st.info(f"No hay datos suficientes para este filtro (Año: {current_anio_rank} / Mes: {current_mes_rank} / Tipo de robo: {delito_barras}).")
-else:
-    conteo_alc = (
-        df_top.groupby(col_alc)
-        .size()
-        .reset_index(name="total_delitos")
-    )
-    #Solo se muestra el top 5 de alcaldias con más y menos robos
-    TOP_N = 5
-    conteo_top = conteo_alc.sort_values("total_delitos", ascending=False).head(TOP_N) #Hacemos el conteo para poder asi definir el ranking TOP
-    conteo_bottom = conteo_alc.sort_values("total_delitos", ascending=True).head(TOP_N)#Hacemos el conteo para poder asi definir el ranking Ultimos
-
-    #Se pintan las gráficas de barras para el top y ultimo de alcaldias
-    with col_charts:
-        col_mas, col_menos = st.columns(2)
-        #Gráfico para el top 
-        chart_top = (
-            alt.Chart(conteo_top)
-            .mark_bar()
-            .encode(
-                x=alt.X("total_delitos:Q", title="Número de incidentes"), #Eje X - Número de incidentes
-                y=alt.Y(f"{col_alc}:N", sort="-x", title="Alcaldía"), #Eje Y - Alcaldía
-                tooltip=[f"{col_alc}:N", "total_delitos:Q"], #Información al pasar el mouse
-            )
-            .properties(height=260)
-            .configure_axis(
-                labelFontSize=tam_graficas,
-                titleFontSize=tam_graficas + 2,
-            )
+    #Se filtran por el año y mes seleccionados en la tendencia diaria (o el último periodo con datos)
+    current_anio_rank = st.session_state.get("graf_anio")
+    current_mes_rank = {v: k for k, v in NOMBRE_MESES.items()}.get(st.session_state.get("graf_mes"))
+    if current_anio_rank is None or current_mes_rank is None:
+        current_anio_rank = rollup["anio"].max()
+        current_mes_rank = rollup[rollup["anio"] == current_anio_rank]["mes"].max()
+
+    #Se define el df top para poder hacer el ranking (a partir del rollup diario)
+    df_top = rollup[
+        (rollup["anio"] == current_anio_rank)
+        & (rollup["mes"] == current_mes_rank)
+    ]
+
+    #Se pinta la grafica de barras para grafcarlo cuando tenga la opción de todos.
+    if delito_barras != "Todos":
+        df_top = df_top[df_top["familia"] == delito_barras]
+
+
+    if df_top.empty:
+        st.info(f"No hay datos suficientes para este filtro (Año: {current_anio_rank} / Mes: {current_mes_rank} / Tipo de robo: {delito_barras}).")
+    else:
+        conteo_alc = (
+            df_top.groupby(col_alc, observed=True)["total"]
+            .sum()
+            .reset_index(name="total_delitos")
         )
-        #Grafico para el ultimo 
-        chart_bottom = (
-            alt.Chart(conteo_bottom)
-            .mark_bar()
-            .encode(
-                x=alt.X("total_delitos:Q", title="Número de incidentes"),
-                y=alt.Y(f"{col_alc}:N", sort="x", title="Alcaldía"),
-                tooltip=[f"{col_alc}:N", "total_delitos:Q"],
+        #Solo se muestra el top 5 de alcaldias con más y menos robos
+        TOP_N = 5
+        conteo_top = conteo_alc.sort_values("total_delitos", ascending=False).head(TOP_N) #Hacemos el conteo para poder asi definir el ranking TOP
+        conteo_bottom = conteo_alc.sort_values("total_delitos", ascending=True).head(TOP_N)#Hacemos el conteo para poder asi definir el ranking Ultimos
+
+        #Se pintan las gráficas de barras para el top y ultimo de alcaldias
+        with col_charts:
+            col_mas, col_menos = st.columns(2)
+            #Gráfico para el top 
+            chart_top = (
+                alt.Chart(conteo_top)
+                .mark_bar()
+                .encode(
+                    x=alt.X("total_delitos:Q", title="Número de incidentes"), #Eje X - Número de incidentes
+                    y=alt.Y(f"{col_alc}:N", sort="-x", title="Alcaldía"), #Eje Y - Alcaldía
+                    tooltip=[f"{col_alc}:N", "total_delitos:Q"], #Información al pasar el mouse
+                )
+                .properties(height=260)
+                .configure_axis(
+                    labelFontSize=tam_graficas,
+                    titleFontSize=tam_graficas + 2,
+                )
             )
-            .properties(height=260)
-            .configure_axis(
-                labelFontSize=tam_graficas,
-                titleFontSize=tam_graficas + 2,
+            #Grafico para el ultimo 
+            chart_bottom = (
+                alt.Chart(conteo_bottom)
+                .mark_bar()
+                .encode(
+                    x=alt.X("total_delitos:Q", title="Número de incidentes"),
+                    y=alt.Y(f"{col_alc}:N", sort="x", title="Alcaldía"),
+                    tooltip=[f"{col_alc}:N", "total_delitos:Q"],
+                )
+                .properties(height=260)
+                .configure_axis(
+                    labelFontSize=tam_graficas,
+                    titleFontSize=tam_graficas + 2,
+                )
             )
-        )
 
-        with col_mas:
-            st.markdown(f"#### Top {TOP_N} alcaldías con mayor cantidad de robos")
-            st.altair_chart(chart_top, use_container_width=True)
+            with col_mas:
+                st.markdown(f"#### Top {TOP_N} alcaldías con mayor cantidad de robos")
+                st.altair_chart(chart_top, use_container_width=True)
+
+            with col_menos:
+                st.markdown(f"#### Top {TOP_N} alcaldías con menor cantidad de robos")
+                st.altair_chart(chart_bottom, use_container_width=True)
 
-        with col_menos:
-            st.markdown(f"#### Top {TOP_N} alcaldías con menor cantidad de robos")
-            st.altair_chart(chart_bottom, use_container_width=True)
+        perfil.registrar(filas=len(rollup), payload=conteo_alc)
+
+
+seccion_ranking()
 
 # ============================================================
 # Mapa de calor día / hora
-st.markdown("### Mapa de calor día/hora robos")
-
-#Personalización de títulos y etiquetas de la gráfica
-TITULO_GRAFICA = ""
-TIT_EJE_X = "Hora del día"
-TIT_EJE_Y = "Día de la semana"
-TIT_LEYENDA = "Incidentes"
-
-#Definición de columnas para filtros y gráfica
-col_filters, col_chart = st.columns([1, 3])
-
-#Se crea la columna donde van a estar los filtros 
-with col_filters:
-    st.markdown("#### Filtros")
-    delito_calor = st.selectbox(
-        "Selecciona un tipo de robo para el mapa de calor:",
-        options=DELITOS_PREFIJOS,
-        key="delito_calor",
-    )
-    #Crear columnas de hora y día de la semana si no existen seguridad extra 
-    if "hora_num" not in df_vehiculos.columns:
-        df_vehiculos["hora_num"] = df_vehiculos["fecha_hecho"].dt.hour
-    if "dia_semana" not in df_vehiculos.columns:
-        df_vehiculos["dia_semana"] = df_vehiculos["fecha_hecho"].dt.day_name()
-        dias_map = { #Mapeo de días al español
-            'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sabado',
-            'Sunday': 'Domingo'
-        }
-        df_vehiculos["dia_semana"] = df_vehiculos["dia_semana"].replace(dias_map)
-
-#Filtro por el tipo de robo seleccionado 
-df_heat = df_vehiculos[df_vehiculos["delito"].str.contains(delito_calor, na=False)].copy()
-#Se agrupa por el dia de la semana y la hora del día para contar los incidentes
-df_heat_mapa = (
-    df_heat.groupby(["dia_semana", "hora_num"])
-    .size()
-    .reset_index(name="total")
-)
-#Ordenamos los días para que se muestren correctamente en la gráfica
-orden_dias = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sabado", "Domingo"]
-#Sin no hay datos suficientes se muestra un mensaje
-if df_heat_mapa.empty:
-    st.info("No hay datos suficientes para este tipo de robo.")
-else:
-    #Columna donde esta definida la gráfica
-    with col_chart:
-        if TITULO_GRAFICA:
-            st.markdown(f"#### {TITULO_GRAFICA}")
-        #Función altair para gráfico de mapa de calor
-        heatmap = (
-            alt.Chart(df_heat_mapa)
-            .mark_rect()
-            .encode(
-                x=alt.X( #Eje X - Hora del día
-                    "hora_num:O",
-                    title=TIT_EJE_X,
-                    axis=alt.Axis(labelAngle=0),
-                ),
-                y=alt.Y( #Eje Y - dia de la semana
-                    "dia_semana:O",
-                    title=TIT_EJE_Y,
-                    sort=orden_dias,
-                    scale=alt.Scale(paddingInner=0.1, paddingOuter=0.25),
-                ),
-                color=alt.Color( #Para pintar los colores en el heat map 
-                    "total:Q",
-                    title=TIT_LEYENDA,
-                    scale=alt.Scale(scheme="reds"),
-                ),
-                tooltip=["dia_semana:N", "hora_num:Q", "total:Q"],
-            )
-            .properties(
-                height=240,
-                padding={"top": 5, "right": 10, "left": 0, "bottom": 0},
-            )
-            .configure_axis(
-                labelFontSize=tam_graficas,
-                titleFontSize=tam_graficas + 2,
-            )
-            .configure_legend(
-                labelFontSize=tam_graficas,
-                titleFontSize=tam_graficas + 2,
-            )
+@st.fragment
+@perfil.seccion("mapa_calor")
+def seccion_mapa_calor():
+    st.markdown("### Mapa de calor día/hora robos")
+
+    #Personalización de títulos y etiquetas de la gráfica
+    TITULO_GRAFICA = ""
+    TIT_EJE_X = "Hora del día"
+    TIT_EJE_Y = "Día de la semana"
+    TIT_LEYENDA = "Incidentes"
+
+    #Definición de columnas para filtros y gráfica
+    col_filters, col_chart = st.columns([1, 3])
+
+    #Se crea la columna donde van a estar los filtros 
+    with col_filters:
+        st.markdown("#### Filtros")
+        delito_calor = st.selectbox(
+            "Selecciona un tipo de robo para el mapa de calor:",
+            options=DELITOS_PREFIJOS,
+            key="delito_calor",
         )
 
-        st.altair_chart(heatmap, use_container_width=True)
+    #Ordenamos los días para que se muestren correctamente en la gráfica (dia_num: 0 = lunes)
+    orden_dias = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sabado", "Domingo"]
+
+    #Rebanada del cubo precalculado (familia x día x hora) para el tipo de robo seleccionado
+    df_heat_mapa = cubo_dia_hora(RUTA_INCIDENTES).get(
+        delito_calor, pd.DataFrame(columns=["dia_num", "hora_num", "total"])
+    ).copy()
+    df_heat_mapa.insert(0, "dia_semana", df_heat_mapa.pop("dia_num").map(dict(enumerate(orden_dias))))
+    #Sin no hay datos suficientes se muestra un mensaje
+    if df_heat_mapa.empty:
+        st.info("No hay datos suficientes para este tipo de robo.")
+    else:
+        #Columna donde esta definida la gráfica
+        with col_chart:
+            if TITULO_GRAFICA:
+                st.markdown(f"#### {TITULO_GRAFICA}")
+            #Función altair para gráfico de mapa de calor
+            heatmap = (
+                alt.Chart(df_heat_mapa)
+                .mark_rect()
+                .encode(
+                    x=alt.X( #Eje X - Hora del día
+                        "hora_num:O",
+                        title=TIT_EJE_X,
+                        axis=alt.Axis(labelAngle=0),
+                    ),
+                    y=alt.Y( #Eje Y - dia de la semana
+                        "dia_semana:O",
+                        title=TIT_EJE_Y,
+                        sort=orden_dias,
+                        scale=alt.Scale(paddingInner=0.1, paddingOuter=0.25),
+                    ),
+                    color=alt.Color( #Para pintar los colores en el heat map 
+                        "total:Q",
+                        title=TIT_LEYENDA,
+                        scale=alt.Scale(scheme="reds"),
+                    ),
+                    tooltip=["dia_semana:N", "hora_num:Q", "total:Q"],
+                )
+                .properties(
+                    height=240,
+                    padding={"top": 5, "right": 10, "left": 0, "bottom": 0},
+                )
+                .configure_axis(
+                    labelFontSize=tam_graficas,
+                    titleFontSize=tam_graficas + 2,
+                )
+                .configure_legend(
+                    labelFontSize=tam_graficas,
+                    titleFontSize=tam_graficas + 2,
+                )
+            )
 
-# ============================================================
-# Mapa de robos de vehículos en CDMX
-#Se pintan los puntos de la base de datos  para mostrar la concentración de robos alrededor de la ciudad de méxico 
-st.markdown("### Mapa de robos de vehículos en CDMX")
-
-col_filters, col_map = st.columns([1, 3])
-
-with col_filters:
-    st.markdown("#### Filtros")
-    #Se definen para el mapa los filtros de año, mes, tipo de robo y tipo de vista
-    anios_disponibles_map = sorted(df_vehiculos["anio"].unique())
-    opciones_anio_map = ["Todos"] + list(anios_disponibles_map) 
-    anio_mapa = st.selectbox("Año:", options=opciones_anio_map, key="anio_mapa")
-
-    meses_disponibles_map = sorted(df_vehiculos["mes"].unique()) #Filtro para mes 
-    opciones_meses_map = ["Todos"] + [NOMBRE_MESES[m] for m in meses_disponibles_map if m in NOMBRE_MESES]
-    nombre_mes_map = st.selectbox("Mes:", options=opciones_meses_map, key="mes_mapa")
-
-    delito_mapa = st.selectbox( #Filtro por tipo de robo 
-        "Tipo de robo:",
-        options=["Todos"] + DELITOS_PREFIJOS,
-        key="delito_mapa",
-    )
+            st.altair_chart(heatmap, use_container_width=True)
+            perfil.registrar(payload=df_heat_mapa)
 
-    vista_mapa = st.radio( #Filtro para el tipo de vista del mapa son 3
-        "Tipo de vista:",
-        options=["Puntos", "Mapa de calor", "Puntos y mapa de calor"],
-        horizontal=False,
-    )
 
-df_mapa = df_vehiculos.copy()
+seccion_mapa_calor()
+
+# ============================================================
+# Mapa de robos de vehículos en CDMX
+@perfil.cache_medido(st.cache_resource(max_entries=8))
+def insumos_mapa(version: str, anio_mapa, nombre_mes_map: str, delito_mapa: str):
+    """
+    Lo costoso del mapa para unos filtros: centro, puntos muestreados con sus
+    catálogos y rejilla del mapa de calor; None si no hay puntos. Compartido
+    entre sesiones (solo lectura): 'version' (version_datos) invalida la entrada
+    cuando cambian los datos.
+    """
+    df_mapa = df_vehiculos #Los filtros de abajo generan DataFrames nuevos; el original no se modifica
 
-#Aplicación de filtros por año , mes y delito del mapa
-if anio_mapa != "Todos": #Si no es todos, filtra por el año seleccionado
-    df_mapa = df_mapa[df_mapa["anio"] == anio_mapa]
+    #Aplicación de filtros por año , mes y delito del mapa
+    if anio_mapa != "Todos": #Si no es todos, filtra por el año seleccionado
+        df_mapa = df_mapa[df_mapa["anio"] == anio_mapa]
 
-if nombre_mes_map != "Todos": #Si no es todos, filtra por el mes seleccionado
-    mes_num = [k for k, v in NOMBRE_MESES.items() if v == nombre_mes_map][0]
-    df_mapa = df_mapa[df_mapa["mes"] == mes_num]
+    if nombre_mes_map != "Todos": #Si no es todos, filtra por el mes seleccionado
+        mes_num = [k for k, v in NOMBRE_MESES.items() if v == nombre_mes_map][0]
+        df_mapa = df_mapa[df_mapa["mes"] == mes_num]
 
-if delito_mapa != "Todos": #Si no es todos, filtra por el tipo de robo seleccionado
-    df_mapa = df_mapa[df_mapa["delito"].str.contains(delito_mapa, na=False)]
+    if delito_mapa != "Todos": #Si no es todos, filtra por el tipo de robo seleccionado
+        df_mapa = df_mapa[df_mapa["familia"] == delito_mapa]
 
-df_mapa = df_mapa.dropna(subset=["latitud", "longitud"]) #Se eliminan los que no tienen latitud ni longitud
+    df_mapa = df_mapa.dropna(subset=["latitud", "longitud"]) #Se eliminan los que no tienen latitud ni longitud
+    perfil.registrar(filas=len(df_vehiculos))
 
-with col_map: #Columna donde se va a mapear el mapa
     if df_mapa.empty:
-        st.info("No hay datos para el filtro seleccionado (año / mes / tipo de robo).")
+        return None
+
+    MAX_PUNTOS = 50_000 #Tope de puntos enviados al navegador (la capa de puntos se arma en una sola pasada)
+    if len(df_mapa) > MAX_PUNTOS:
+        df_mapa_sample = df_mapa.sample(MAX_PUNTOS, random_state=42)
     else:
-        MAX_PUNTOS = 150 #Cantidad de puntos mostrados en el mapa 
-        if len(df_mapa) > MAX_PUNTOS:
-            df_mapa_sample = df_mapa.sample(MAX_PUNTOS, random_state=42)
-        else:
-            df_mapa_sample = df_mapa
+        df_mapa_sample = df_mapa
+
+    #Cada punto viaja como [lat, lon, código de delito, código de alcaldía, año]; los
+    #textos se mandan una sola vez como catálogos y el navegador arma los marcadores. Las
+    #columnas ya son categóricas con las categorías de toda la base: solo viajan las presentes
+    tipos = df_mapa_sample["delito"].astype("category").cat.remove_unused_categories()
+    alcaldias = df_mapa_sample["alcaldia_hecho"].astype("category").cat.remove_unused_categories()
+    return {
         #Se calcula el centro del mapa basado en los puntos muestrados
-        if not df_mapa_sample.empty:
-            centro_lat = df_mapa_sample["latitud"].mean()
-            centro_lon = df_mapa_sample["longitud"].mean()
-        else:
-            centro_lat, centro_lon = 19.4326, -99.1332 
-
-        m = folium.Map( #Inicializa el mapa de folium 
-            location=[centro_lat, centro_lon],
-            zoom_start=11,
-            tiles="CartoDB positron",
-        )
+        "centro": [df_mapa_sample["latitud"].mean(), df_mapa_sample["longitud"].mean()],
+        "puntos": list(zip(
+            df_mapa_sample["latitud"].round(5).tolist(),
+            df_mapa_sample["longitud"].round(5).tolist(),
+            tipos.cat.codes.tolist(),
+            alcaldias.cat.codes.tolist(),
+            df_mapa_sample["anio"].tolist(),
+        )),
+        "tipos": tipos.cat.categories.astype(str).tolist(),
+        "alcaldias": alcaldias.cat.categories.astype(str).tolist(),
+        #Para el calor se usan todos los puntos filtrados, agregados por celda
+        "calor": rejilla_calor(df_mapa["latitud"].to_numpy(), df_mapa["longitud"].to_numpy()),
+    }
+
+
+def construir_mapa(insumos: dict, vista_mapa: str):
+    """Arma el mapa de folium (objeto ligero) a partir de los insumos cacheados."""
+    m = folium.Map( #Inicializa el mapa de folium 
+        location=insumos["centro"],
+        zoom_start=11,
+        tiles="CartoDB positron",
+        prefer_canvas=True, #Los CircleMarker se dibujan en canvas y no como miles de nodos SVG
+    )
 
-        try: #Carga el archivo geojson con las delimimitaciones de las alcaldias
-            with open("bases_de_datos/limite-de-las-alcaldias.json", "r", encoding="utf-8") as f:
-                gj_alcaldias = json.load(f)
+    teselas_alcaldias = plantilla_teselas("alcaldias")
+    if teselas_alcaldias: #Límites de las alcaldías como teselas vectoriales locales: solo se piden las visibles
+        VectorGridProtobuf(
+            teselas_alcaldias["url"],
+            "Límites de alcaldías",
+            {
+                "vectorTileLayerStyles": {
+                    "alcaldias": {"fill": False, "color": "#2b2b2b", "weight": 1.5},
+                },
+                "minNativeZoom": teselas_alcaldias["zoom_min"],
+                "maxNativeZoom": teselas_alcaldias["zoom_max"],
+                "bounds": teselas_alcaldias["limites"],
+            },
+        ).add_to(m)
+    else:
+        try: #Límites de las alcaldías: simplificados y cuantizados una sola vez (caché compartida)
+            gj_alcaldias = capa_limites("bases_de_datos/limite-de-las-alcaldias.json")
 
             folium.GeoJson( # Pinta las delimitaciones de las alcaldias en el mapa de la CDMX
                 gj_alcaldias,
@@ -879,39 +1044,91 @@ with col_map: #Columna donde se va a mapear el mapa
                     "weight": 1.5,
                 },
             ).add_to(m)
+            perfil.registrar(payload=gj_alcaldias)
         except FileNotFoundError:
             st.warning("No se encontró el archivo GeoJSON de alcaldías.")
         except Exception as e:
             st.warning(f"Error al cargar el GeoJSON: {e}")
 
 
-        if vista_mapa in ["Puntos", "Puntos y mapa de calor"]:#Filtro para mostrar los puntos en el mapa
-            for _, row in df_mapa_sample.iterrows():
-                tipo = row.get("delito", "Sin tipo")
-                anio = row.get("anio", row["fecha_hecho"].year)
-
-                folium.CircleMarker(
-                    location=[row["latitud"], row["longitud"]],
-                    radius=3,
-                    color="#FF4B4B",
-                    fill=True,
-                    fill_opacity=0.6,
-                    popup=f"{tipo} - {row.get('alcaldia_hecho', '')}",
-                    tooltip=folium.Tooltip(
-                        f"{tipo} | Año: {anio}",
-                        sticky=True,
-                    ),
-                ).add_to(m)
+    if vista_mapa in ["Puntos", "Puntos y mapa de calor"]:#Filtro para mostrar los puntos en el mapa
+        callback_puntos = f"""(function () {{
+            var tipos = {json.dumps(insumos["tipos"])};
+            var alcaldias = {json.dumps(insumos["alcaldias"])};
+            return function (row) {{
+                var tipo = tipos[row[2]] || "Sin tipo";
+                var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {{
+                    radius: 3, color: "#FF4B4B", fill: true, fillOpacity: 0.6
+                }});
+                marker.bindPopup(tipo + " - " + (alcaldias[row[3]] || ""));
+                marker.bindTooltip(tipo + " | Año: " + row[4], {{sticky: true}});
+                return marker;
+            }};
+        }})()"""
+
+        FastMarkerCluster( #Capa de puntos agrupados; al acercarse se ven los puntos individuales
+            insumos["puntos"],
+            callback=callback_puntos,
+            name="Incidentes",
+            disableClusteringAtZoom=15,
+        ).add_to(m)
+        perfil.registrar(payload=insumos["puntos"])
+
+    if vista_mapa in ["Mapa de calor", "Puntos y mapa de calor"]: #Filtro para mostrar el mapa de calor 
+        #Solo viajan los centroides de las celdas con su peso
+        HeatMap( #Configuración del mapa de calor
+            insumos["calor"],
+            radius=12,
+            blur=18,
+            max_zoom=13,
+        ).add_to(m)
+        perfil.registrar(payload=insumos["calor"])
+
+    folium.LayerControl().add_to(m) #Se añaden las capas 
+    return m
+
+
+@st.fragment
+@perfil.seccion("mapa")
+def seccion_mapa():
+    #Se pintan los puntos de la base de datos  para mostrar la concentración de robos alrededor de la ciudad de méxico 
+    st.markdown("### Mapa de robos de vehículos en CDMX")
+
+    col_filters, col_map = st.columns([1, 3])
 
-        if vista_mapa in ["Mapa de calor", "Puntos y mapa de calor"]: #Filtro para mostrar el mapa de calor 
-            heat_data = df_mapa_sample[["latitud", "longitud"]].values.tolist()
+    with col_filters:
+        st.markdown("#### Filtros")
+        #Se definen para el mapa los filtros de año, mes, tipo de robo y tipo de vista
+        anios_disponibles_map = sorted(df_vehiculos["anio"].unique())
+        opciones_anio_map = ["Todos"] + list(anios_disponibles_map) 
+        anio_mapa = st.selectbox("Año:", options=opciones_anio_map, key="anio_mapa")
 
-            HeatMap( #Configuración del mapa de calor
-                heat_data,
-                radius=12,
-                blur=18,
-                max_zoom=13,
-            ).add_to(m)
+        meses_disponibles_map = sorted(df_vehiculos["mes"].unique()) #Filtro para mes 
+        opciones_meses_map = ["Todos"] + [NOMBRE_MESES[m] for m in meses_disponibles_map if m in NOMBRE_MESES]
+        nombre_mes_map = st.selectbox("Mes:", options=opciones_meses_map, key="mes_mapa")
+
+        delito_mapa = st.selectbox( #Filtro por tipo de robo 
+            "Tipo de robo:",
+            options=["Todos"] + DELITOS_PREFIJOS,
+            key="delito_mapa",
+        )
+
+        vista_mapa = st.radio( #Filtro para el tipo de vista del mapa son 3
+            "Tipo de vista:",
+            options=["Puntos", "Mapa de calor", "Puntos y mapa de calor"],
+            horizontal=False,
+        )
+
+    #Solo los insumos (puntos, catálogos, rejilla de calor) se cachean, compartidos entre
+    #sesiones; el objeto folium es ligero y se arma en cada ejecución
+    insumos = insumos_mapa(version_datos(RUTA_INCIDENTES), anio_mapa, nombre_mes_map, delito_mapa)
+    with col_map: #Columna donde se va a mapear el mapa
+        if insumos is None:
+            st.info("No hay datos para el filtro seleccionado (año / mes / tipo de robo).")
+        else:
+            st_folium(construir_mapa(insumos, vista_mapa), width="100%", height=500) #Se muestran el mapa en streamlit
+
+
+seccion_mapa()
 
-        folium.LayerControl().add_to(m) #Se añaden las capas 
-        st_folium(m, width="100%", height=500) #Se muestran el mapa en streamlit
\ No newline at end of file
+perfil.panel_perfil()
@@ -3,6 +3,7 @@ import pandas as pd
 import plotly.graph_objects as go
 import altair as alt
 from theme_config import inject_custom_css, CUSTOM_THEME
+import perfilador as perfil
 
 # ==========================================
 # 1. CONFIGURACIÓN DE PÁGINA Y ESTILOS
@@ -11,6 +12,8 @@ st.set_page_config(
     page_title="Dashboard de Clustering: Alcaldías y Colonias",
     layout="wide"
 )
+# Perfilado opcional por sección (PERFIL_SECCIONES=1 o ?perfil=1)
+perfil.iniciar_perfil("Perfiles_de_alcaldias")
 
 # Aplicar estilos globales del tema
 inject_custom_css(CUSTOM_THEME)
@@ -165,13 +168,14 @@ def mostrar_tarjetas_informativas(info_dict):
 # ==============================================================================
 # PESTAÑA 1: CLUSTERING DE ALCALDÍAS
 
-with tab_alcaldias:
+with tab_alcaldias, perfil.seccion("alcaldias"):
     st.subheader("Perfiles de Alcaldías (Cámaras vs. Delitos vs. IDS)")
     mostrar_tarjetas_informativas(INFO_ALCALDIAS)
     
     try:
         df_alc = pd.read_csv("bases_de_datos/clustering_alcaldias.csv")
         cent_alc = pd.read_csv("bases_de_datos/clustering_centroides.csv")
+        perfil.registrar(filas=len(df_alc) + len(cent_alc))
     except FileNotFoundError:
         st.error("⚠️ No se encontraron los archivos de Alcaldías en 'bases_de_datos/'.")
         st.stop()
@@ -265,7 +269,7 @@ with tab_alcaldias:
 
 # ==============================================================================
 # PESTAÑA 2: CLUSTERING DE COLONIAS
-with tab_colonias:
+with tab_colonias, perfil.seccion("colonias"):
     st.subheader("Perfiles de Colonias ")
     
     X_VAR, Y_VAR, Z_VAR = "ue_por_1k_log", "delitos_por_1k_log", "alumbrado_por_1k_log"
@@ -274,6 +278,7 @@ with tab_colonias:
     try:
         df_col = pd.read_csv("bases_de_datos/resultados_colonias_clusters.csv")
         cent_col = pd.read_csv("bases_de_datos/centroides_valores_reales.csv")
+        perfil.registrar(filas=len(df_col) + len(cent_col))
     except FileNotFoundError:
         st.error("⚠️ Faltan los archivos CSV en 'bases_de_datos/'.")
         st.stop()
@@ -388,4 +393,6 @@ with tab_colonias:
     fig_col.update_layout(height=600, template="plotly_white", margin=dict(l=0, r=0, b=0, t=30), paper_bgcolor="white", scene=dict(xaxis_title=LABELS[X_VAR], yaxis_title=LABELS[Y_VAR], zaxis_title=LABELS[Z_VAR], bgcolor="white", xaxis=dict(backgroundcolor="white", gridcolor="#E0E0E0"), yaxis=dict(backgroundcolor="white", gridcolor="#E0E0E0"), zaxis=dict(backgroundcolor="white", gridcolor="#E0E0E0")))
 
     with col_c3d_col:
-        st.plotly_chart(fig_col, use_container_width=True)
\ No newline at end of file
+        st.plotly_chart(fig_col, use_container_width=True)
+
+perfil.panel_perfil()
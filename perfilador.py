@@ -0,0 +1,204 @@
+"""
+Perfilado opcional de las páginas de Streamlit.
+
+Mide por sección el tiempo de pared, las filas recorridas y los bytes que se
+envían al navegador, y registra cada acierto o fallo de las funciones en caché.
+Está apagado por defecto; se activa con la variable de entorno
+PERFIL_SECCIONES=1 o abriendo la página con ?perfil=1. Con el perfilado activo
+cada medición se agrega como una línea JSON a PERFIL_LOG (por defecto
+perfil_secciones.jsonl) y la última ejecución completa se muestra en un panel
+de la barra lateral:
+
+    perfil.iniciar_perfil("Dashboard_usuario")
+
+    @st.fragment
+    @perfil.seccion("kpis")
+    def seccion_kpis():
+        ...
+        perfil.registrar(filas=len(df), payload=df_grafica)
+
+    perfil.etapa("filtros")   # páginas lineales: cierra la etapa anterior y abre otra
+    ...
+    perfil.panel_perfil()
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+# Variable de entorno y parámetro de la URL que activan el perfilado
+VARIABLE_ACTIVACION = "PERFIL_SECCIONES"
+PARAMETRO_URL = "perfil"
+# Archivo JSONL donde se agregan las mediciones
+RUTA_LOG = os.environ.get("PERFIL_LOG", "perfil_secciones.jsonl")
+
+# Estado del hilo que ejecuta el script: secciones abiertas y fallos de caché
+_local = threading.local()
+_bloqueo_log = threading.Lock()
+
+
+def perfil_activo() -> bool:
+    """True si el perfilado está activado por entorno o por la URL."""
+    if os.environ.get(VARIABLE_ACTIVACION, "") not in ("", "0"):
+        return True
+    try:
+        return st.query_params.get(PARAMETRO_URL) == "1"
+    except Exception:
+        return False
+
+
+def _pila() -> list:
+    if not hasattr(_local, "pila"):
+        _local.pila = []
+    return _local.pila
+
+
+def _fallos() -> dict:
+    if not hasattr(_local, "fallos"):
+        _local.fallos = {}
+    return _local.fallos
+
+
+def _escribir(registro: dict) -> None:
+    """Agrega el registro al log JSONL y a las mediciones de la ejecución actual."""
+    registro = {"ts": time.time(), "pagina": st.session_state.get("_perfil_pagina"), **registro}
+    st.session_state.setdefault("_perfil_registros", []).append(registro)
+    try:
+        with _bloqueo_log, open(RUTA_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+    except OSError:
+        pass
+
+
+def tamano_payload(obj) -> int:
+    """Bytes aproximados de un objeto que se envía al navegador."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=False).sum())
+    if isinstance(obj, bytes):
+        return len(obj)
+    if isinstance(obj, str):
+        return len(obj.encode("utf-8"))
+    try:
+        return len(json.dumps(obj, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return 0
+
+
+def iniciar_perfil(pagina: str) -> None:
+    """Se llama al inicio de cada página: reinicia las mediciones de la ejecución."""
+    if not perfil_activo():
+        return
+    st.session_state["_perfil_pagina"] = pagina
+    st.session_state["_perfil_registros"] = []
+    _pila().clear()
+
+
+class seccion(contextlib.ContextDecorator):
+    """
+    Mide una sección con nombre; se usa como bloque with o como decorador (por
+    ejemplo, debajo de @st.fragment para medir cada rerun del fragmento).
+    """
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+
+    def __enter__(self):
+        if perfil_activo():
+            _pila().append({"seccion": self.nombre, "filas": 0, "bytes": 0, "_inicio": time.perf_counter()})
+        return self
+
+    def __exit__(self, *exc):
+        pila = _pila()
+        if pila and pila[-1]["seccion"] == self.nombre:
+            medicion = pila.pop()
+            inicio = medicion.pop("_inicio")
+            _escribir({"tipo": "seccion", **medicion, "ms": round((time.perf_counter() - inicio) * 1000, 2)})
+        return False
+
+
+def etapa(nombre: str | None) -> None:
+    """
+    Para páginas lineales: cierra la etapa abierta con etapa() (si hay) y abre
+    una nueva llamada 'nombre'. etapa(None) solo cierra la actual.
+    """
+    abierta = getattr(_local, "etapa", None)
+    if abierta is not None:
+        abierta.__exit__(None, None, None)
+        _local.etapa = None
+    if nombre is not None and perfil_activo():
+        _local.etapa = seccion(nombre).__enter__()
+
+
+def registrar(filas: int | None = None, payload=None) -> None:
+    """Suma filas recorridas y bytes enviados a la sección abierta más interna."""
+    pila = _pila()
+    if not pila:
+        return
+    if filas is not None:
+        pila[-1]["filas"] += int(filas)
+    if payload is not None:
+        pila[-1]["bytes"] += tamano_payload(payload)
+
+
+def cache_medido(decorador_cache):
+    """
+    Envuelve un decorador de caché de Streamlit (st.cache_data, st.cache_resource
+    o sus versiones con parámetros) y registra cada llamada como acierto o fallo
+    con su duración. El cuerpo de la función solo se ejecuta en un fallo, así
+    que ahí se marca.
+    """
+    def envolver(funcion):
+        nombre = funcion.__qualname__
+
+        @functools.wraps(funcion)
+        def cuerpo(*args, **kwargs):
+            _fallos()[nombre] = _fallos().get(nombre, 0) + 1
+            return funcion(*args, **kwargs)
+
+        cacheada = decorador_cache(cuerpo)
+
+        @functools.wraps(funcion)
+        def llamada(*args, **kwargs):
+            if not perfil_activo():
+                return cacheada(*args, **kwargs)
+            antes = _fallos().get(nombre, 0)
+            inicio = time.perf_counter()
+            resultado = cacheada(*args, **kwargs)
+            _escribir({
+                "tipo": "cache",
+                "funcion": nombre,
+                "acierto": _fallos().get(nombre, 0) == antes,
+                "ms": round((time.perf_counter() - inicio) * 1000, 2),
+            })
+            return resultado
+
+        llamada.clear = cacheada.clear
+        return llamada
+
+    return envolver
+
+
+def panel_perfil() -> None:
+    """Muestra en la barra lateral las mediciones de la última ejecución completa."""
+    etapa(None)
+    if not perfil_activo():
+        return
+    registros = st.session_state.get("_perfil_registros", [])
+    with st.sidebar.expander("Perfil de la página", expanded=True):
+        secciones = pd.DataFrame([r for r in registros if r["tipo"] == "seccion"])
+        if not secciones.empty:
+            st.markdown(f"**Secciones** ({secciones['ms'].sum():,.0f} ms)")
+            st.dataframe(secciones[["seccion", "ms", "filas", "bytes"]], hide_index=True)
+        caches = pd.DataFrame([r for r in registros if r["tipo"] == "cache"])
+        if not caches.empty:
+            resumen = caches.groupby("funcion").agg(
+                llamadas=("acierto", "size"), aciertos=("acierto", "sum"), ms=("ms", "sum")
+            ).reset_index()
+            st.markdown("**Cachés**")
+            st.dataframe(resumen, hide_index=True)
+        st.caption(f"Log: {RUTA_LOG}")
@@ -0,0 +1,195 @@
+"""
+Predicciones por cuadrante y asignación de patrullas para el tablero policial.
+
+Arma el cubo de predicciones_xgb.csv (año, mes, delito y cuadrante) del que
+sale cada combinación de filtros del mapa, el grafo de adyacencia de los
+cuadrantes y el optimizador voraz que reparte las patrullas sobre él:
+
+    cubo = cubo_predicciones()
+    filas = filas_predicciones()
+    celdas = rebanada_predicciones(cubo, 2024, 10)
+    ids, indptr, vecinos = grafo_cuadrantes()
+    rutas = asignar_patrullaje(valores, indptr, vecinos, k=20, tam_ruta=4)
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+import streamlit as st
+
+from data_loader import cargar_cuadrantes
+from perfilador import cache_medido
+
+
+# ============================================================
+# Cubo de predicciones
+
+# Valor de 'delito' en el cubo de predicciones que agrupa todos los delitos
+TODOS_LOS_DELITOS = "Todos los delitos"
+
+
+@cache_medido(st.cache_resource(max_entries=2))
+def _filas_predicciones(path: str, mtime_ns: int) -> pd.DataFrame:
+    df = pd.read_csv(path, parse_dates=["ds"])
+    return df.sort_values("ds", kind="stable").reset_index(drop=True)
+
+
+def filas_predicciones(path: str = "bases_de_datos/predicciones_xgb.csv") -> pd.DataFrame:
+    """
+    Filas de predicciones_xgb.csv ordenadas por fecha (las de un mes se toman
+    con searchsorted sobre ds). Se lee una vez por versión del archivo (mtime)
+    y todas las sesiones reciben el mismo DataFrame, sin copiarlo en cada
+    ejecución: solo lectura.
+    """
+    return _filas_predicciones(path, os.stat(path).st_mtime_ns)
+
+
+@cache_medido(st.cache_resource(max_entries=2))
+def _cubo_predicciones(path: str, mtime_ns: int) -> pd.DataFrame:
+    # Mismas filas que filas_predicciones: el CSV se parsea una sola vez
+    filas = _filas_predicciones(path, mtime_ns)
+    df = filas[["ds", "cell_id", "delito", "score", "yhat_cnt_xgb"]].assign(
+        anio=filas["ds"].dt.year, mes=filas["ds"].dt.month
+    )
+    sumas = dict(n=("score", "size"), suma_score=("score", "sum"), suma_cnt=("yhat_cnt_xgb", "sum"))
+
+    por_delito = df.groupby(["anio", "mes", "delito", "cell_id"]).agg(**sumas).reset_index()
+    por_delito["lista_delitos"] = por_delito["delito"]
+
+    # Nivel "todos los delitos": se suma sobre el nivel por delito, que ya es pequeño
+    por_celda = por_delito.sort_values(["anio", "mes", "cell_id", "delito"])
+    claves = ["anio", "mes", "cell_id"]
+    todos = por_celda.groupby(claves)[["n", "suma_score", "suma_cnt"]].sum()
+    todos["lista_delitos"] = por_celda.groupby(claves)["delito"].agg(", ".join)
+    todos = todos.reset_index().assign(delito=TODOS_LOS_DELITOS)
+
+    cubo = pd.concat([por_delito, todos], ignore_index=True)
+    cubo["score"] = cubo["suma_score"] / cubo["n"]
+    cubo["yhat_cnt_xgb"] = cubo["suma_cnt"] / cubo["n"]
+    return cubo.set_index(["anio", "mes", "delito", "cell_id"]).sort_index()
+
+
+def cubo_predicciones(path: str = "bases_de_datos/predicciones_xgb.csv") -> pd.DataFrame:
+    """
+    Cubo de predicciones con índice (anio, mes, delito, cell_id) y columnas n
+    (filas del CSV), suma_score, suma_cnt, los promedios score y yhat_cnt_xgb y
+    lista_delitos. El nivel delito incluye TODOS_LOS_DELITOS, que agrega los
+    delitos de cada celda, así cada combinación de filtros del mapa es una
+    rebanada (ver rebanada_predicciones). Se arma una vez por versión del
+    archivo (mtime) y se comparte entre sesiones: solo lectura.
+    """
+    return _cubo_predicciones(path, os.stat(path).st_mtime_ns)
+
+
+def rebanada_predicciones(cubo: pd.DataFrame, anio: int, mes: int, delito: str = TODOS_LOS_DELITOS) -> pd.DataFrame:
+    """
+    Celdas de cubo_predicciones para un año, mes y delito, con cell_id como
+    columna. Si la combinación no existe, devuelve un DataFrame vacío.
+    """
+    try:
+        rebanada = cubo.loc[(anio, mes, delito)]
+    except KeyError:
+        rebanada = cubo.iloc[:0].droplevel(["anio", "mes", "delito"])
+    return rebanada.reset_index()
+
+
+# ============================================================
+# Asignación de patrullas
+
+# Distancia (en grados, ~1 m) bajo la que dos cuadrantes son vecinos: cubre las rendijas entre polígonos
+DISTANCIA_VECINOS = 1e-5
+
+
+@cache_medido(st.cache_resource(max_entries=4))
+def _grafo_cuadrantes(path: str, mtime_ns: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    gdf = cargar_cuadrantes(path)
+    geometrias = gdf.geometry.to_numpy()
+    origen, destino = shapely.STRtree(geometrias).query(
+        geometrias, predicate="dwithin", distance=DISTANCIA_VECINOS
+    )
+    distintos = origen != destino
+    origen, destino = origen[distintos], destino[distintos]
+    orden = np.lexsort((destino, origen))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(origen, minlength=len(geometrias)))])
+    return gdf["id"].to_numpy(), indptr, destino[orden]
+
+
+def grafo_cuadrantes(path: str = "bases_de_datos/cuadrantes.csv") -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Grafo de adyacencia de los cuadrantes (se tocan o están a menos de
+    DISTANCIA_VECINOS) en formato CSR: (ids, indptr, vecinos). Los vecinos de
+    ids[i] son ids[vecinos[indptr[i]:indptr[i + 1]]]. Se calcula una vez por
+    versión de cuadrantes.csv (mtime) y se comparte entre sesiones: solo lectura.
+    """
+    return _grafo_cuadrantes(path, os.stat(path).st_mtime_ns)
+
+
+def indices_mayores(valores: np.ndarray, n: int) -> np.ndarray:
+    """
+    Posiciones de los n valores más altos, de mayor a menor. Usa selección
+    parcial (argpartition, lineal) y solo ordena esos n, en lugar de ordenar
+    todo el arreglo; los NaN quedan al final.
+    """
+    valores = np.where(np.isnan(valores), -np.inf, np.asarray(valores, dtype=float))
+    n = min(max(int(n), 0), len(valores))
+    if n == 0:
+        return np.array([], dtype=np.intp)
+    mayores = np.argpartition(-valores, n - 1)[:n]
+    return mayores[np.argsort(-valores[mayores], kind="stable")]
+
+
+def asignar_patrullaje(
+    valores: np.ndarray,
+    indptr: np.ndarray,
+    vecinos: np.ndarray,
+    k: int,
+    tam_ruta: int = 1,
+) -> list[np.ndarray]:
+    """
+    Elige k rutas de patrullaje sin cuadrantes repetidos que cubran la mayor
+    cantidad de robos esperados, sobre el grafo de grafo_cuadrantes.
+
+    Con tam_ruta = 1 cada ruta es un cuadrante y el resultado (los k de mayor
+    valor) es óptimo. Con rutas más largas es una heurística voraz: cada ruta
+    empieza en el cuadrante libre con más valor propio más el de sus vecinos
+    libres y crece agregando el vecino libre de mayor valor hasta tener
+    tam_ruta cuadrantes contiguos (o quedarse sin vecinos libres).
+
+    Parámetros:
+        valores (np.ndarray): robos esperados por cuadrante, en el orden de ids.
+        indptr, vecinos (np.ndarray): grafo CSR de grafo_cuadrantes.
+        k (int): número de rutas (patrullas).
+        tam_ruta (int): cuadrantes por ruta.
+
+    Retorna:
+        list[np.ndarray]: posiciones (en ids) de los cuadrantes de cada ruta,
+        en el orden en que se agregaron.
+    """
+    valores = np.nan_to_num(np.asarray(valores, dtype=float))
+    if tam_ruta <= 1:
+        return [np.array([i]) for i in indices_mayores(valores, k)]
+
+    libre = np.ones(len(valores), dtype=bool)
+    rutas = []
+    for _ in range(int(k)):
+        # Potencial de cada semilla: su valor más el de sus vecinos libres (sumas por fila del CSR)
+        acumulado = np.concatenate([[0.0], np.cumsum(np.where(libre[vecinos], valores[vecinos], 0.0))])
+        potencial = np.where(libre, valores + acumulado[indptr[1:]] - acumulado[indptr[:-1]], -np.inf)
+        semilla = int(np.argmax(potencial))
+        if not np.isfinite(potencial[semilla]):
+            break
+        ruta = [semilla]
+        libre[semilla] = False
+        frontera = np.zeros(len(valores), dtype=bool)
+        frontera[vecinos[indptr[semilla]:indptr[semilla + 1]]] = True
+        while len(ruta) < tam_ruta:
+            candidatos = frontera & libre
+            if not candidatos.any():
+                break
+            elegido = int(np.argmax(np.where(candidatos, valores, -np.inf)))
+            ruta.append(elegido)
+            libre[elegido] = False
+            frontera[vecinos[indptr[elegido]:indptr[elegido + 1]]] = True
+        rutas.append(np.array(ruta))
+    return rutas
@@ -0,0 +1,335 @@
+"""
+Teselas vectoriales (Mapbox Vector Tile) locales para las capas de polígonos.
+
+Genera las teselas de cuadrantes.csv y de limite-de-las-alcaldias.json para
+cada nivel de zoom dentro de static/teselas, que Streamlit sirve en app/static
+(server.enableStaticServing). Los mapas piden solo las teselas visibles, con
+la geometría simplificada al nivel de zoom, sin un servidor de teselas
+externo. Se vuelven a generar cuando cambia el archivo de origen:
+
+    python teselas.py
+    python teselas.py --zoom-min 9 --zoom-max 16 --capas cuadrantes
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import struct
+import time
+
+import numpy as np
+import shapely
+import streamlit as st
+
+from data_loader import (
+    ARCHIVO_ALCALDIAS,
+    ARCHIVO_CUADRANTES,
+    CAMPOS_CUADRANTE,
+    DIR_ESTATICO,
+    cargar_cuadrantes,
+    huella_archivo,
+    ruta_temporal,
+    url_estatica,
+)
+
+# Unidades por lado de cada tesela (valor estándar de MVT)
+EXTENSION = 4096
+# Margen alrededor de la tesela, para que los trazos no se corten en el borde
+BORDE = 64
+# Tolerancia de simplificación por nivel, en unidades de tesela (~½ píxel a 256 px)
+TOLERANCIA = 8
+ZOOM_MIN = 9
+ZOOM_MAX = 15
+# Cambia cuando cambia la forma de generar las teselas (las invalida)
+VERSION_TESELAS = 1
+
+DIR_TESELAS = os.path.join(DIR_ESTATICO, "teselas")
+# Capas disponibles y su archivo de origen dentro de bases_de_datos
+CAPAS = {"cuadrantes": ARCHIVO_CUADRANTES, "alcaldias": ARCHIVO_ALCALDIAS}
+
+
+# ============================================================
+# Codificación protobuf de MVT (especificación 2.1)
+
+def _varint(n: int) -> bytes:
+    salida = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            salida.append(byte | 0x80)
+        else:
+            salida.append(byte)
+            return bytes(salida)
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def _campo(numero: int, tipo: int, contenido) -> bytes:
+    """Campo protobuf: tipo 0 = varint, 1 = 64 bits, 2 = bytes con longitud."""
+    clave = _varint((numero << 3) | tipo)
+    if tipo == 0:
+        return clave + _varint(contenido)
+    if tipo == 2:
+        return clave + _varint(len(contenido)) + contenido
+    return clave + contenido
+
+
+def _empacado(numeros) -> bytes:
+    return b"".join(_varint(int(n)) for n in numeros)
+
+
+def _valor(v) -> bytes:
+    """Mensaje Value de MVT para una propiedad."""
+    if isinstance(v, (bool, np.bool_)):
+        return _campo(7, 0, int(v))
+    if isinstance(v, (int, np.integer)):
+        return _campo(6, 0, _zigzag(int(v)))
+    if isinstance(v, (float, np.floating)):
+        return _campo(3, 1, struct.pack("<d", float(v)))
+    return _campo(1, 2, str(v).encode("utf-8"))
+
+
+def _poligonos(geometria) -> list:
+    """Polígonos de una geometría recortada (las colecciones pueden traer líneas o puntos)."""
+    return [p for p in shapely.get_parts(geometria) if shapely.get_type_id(p) == 3 and not p.is_empty]
+
+
+def codificar_geometria(geometria) -> list[int]:
+    """
+    Comandos MVT (MoveTo, LineTo, ClosePath con deltas en zigzag) de una
+    geometría poligonal ya en coordenadas enteras de la tesela y orientada.
+    """
+    comandos = []
+    cursor = np.zeros(2, dtype=np.int64)
+    for poligono in _poligonos(geometria):
+        for k, anillo in enumerate([poligono.exterior, *poligono.interiors]):
+            xy = shapely.get_coordinates(anillo).astype(np.int64)[:-1]
+            if len(xy) < 3:
+                if k == 0:
+                    break  # sin anillo exterior no se escriben sus huecos
+                continue
+            deltas = _zigzag(np.diff(xy, axis=0, prepend=cursor[None, :])).ravel().tolist()
+            comandos += [(1 << 3) | 1, *deltas[:2], ((len(xy) - 1) << 3) | 2, *deltas[2:], (1 << 3) | 7]
+            cursor = xy[-1]
+    return comandos
+
+
+def codificar_capa(nombre: str, elementos) -> bytes:
+    """
+    Capa MVT a partir de (id, propiedades, geometría) ya recortadas a la
+    tesela; devuelve el campo 'layers' listo para concatenar en la tesela.
+    """
+    claves, valores, features = {}, {}, []
+    for id_elemento, propiedades, geometria in elementos:
+        comandos = codificar_geometria(geometria)
+        if not comandos:
+            continue
+        etiquetas = []
+        for clave, valor in propiedades.items():
+            if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+                continue
+            etiquetas += [claves.setdefault(clave, len(claves)), valores.setdefault(_valor(valor), len(valores))]
+        feature = _campo(1, 0, int(id_elemento)) if id_elemento is not None else b""
+        feature += _campo(2, 2, _empacado(etiquetas)) + _campo(3, 0, 3) + _campo(4, 2, _empacado(comandos))
+        features.append(_campo(2, 2, feature))
+    if not features:
+        return b""
+    capa = (
+        _campo(15, 0, 2)
+        + _campo(1, 2, nombre.encode("utf-8"))
+        + b"".join(features)
+        + b"".join(_campo(3, 2, c.encode("utf-8")) for c in claves)
+        + b"".join(_campo(4, 2, v) for v in valores)
+        + _campo(5, 0, EXTENSION)
+    )
+    return _campo(3, 2, capa)
+
+
+# ============================================================
+# Generación de las teselas
+
+def _leer_capa(nombre: str, path: str) -> tuple[list, list, np.ndarray]:
+    """ids (o None), propiedades y geometrías (lon/lat) de una capa de CAPAS."""
+    if nombre == "cuadrantes":
+        gdf = cargar_cuadrantes(path)
+        campos = gdf[CAMPOS_CUADRANTE]
+        propiedades = campos.astype(object).where(campos.notna(), None).to_dict("records")
+        return gdf["id"].tolist(), propiedades, gdf.geometry.to_numpy()
+    with open(path, "r", encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    geometrias = shapely.from_geojson([json.dumps(f["geometry"]) for f in features])
+    return [None] * len(features), [f.get("properties") or {} for f in features], geometrias
+
+
+def _a_mundo(coordenadas: np.ndarray) -> np.ndarray:
+    """lon/lat a Web Mercator normalizado: x e y en [0, 1], y hacia abajo."""
+    lon = coordenadas[:, 0]
+    lat = np.radians(coordenadas[:, 1])
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return np.column_stack([x, y])
+
+
+def _teselas_zoom(nombre: str, ids: list, propiedades: list, mundo: np.ndarray, zoom: int):
+    """Genera ((x, y), bytes) de cada tesela con datos en un nivel de zoom."""
+    escala = float((1 << zoom) * EXTENSION)
+    geometrias = shapely.transform(mundo, lambda c: c * escala)
+    # coverage_simplify simplifica las fronteras compartidas una vez: los vecinos no se separan
+    geometrias = shapely.coverage_simplify(geometrias, TOLERANCIA)
+    arbol = shapely.STRtree(geometrias)
+    xmin, ymin, xmax, ymax = shapely.total_bounds(geometrias)
+    for tx in range(int(xmin // EXTENSION), int(xmax // EXTENSION) + 1):
+        for ty in range(int(ymin // EXTENSION), int(ymax // EXTENSION) + 1):
+            caja = (tx * EXTENSION - BORDE, ty * EXTENSION - BORDE,
+                    (tx + 1) * EXTENSION + BORDE, (ty + 1) * EXTENSION + BORDE)
+            candidatos = arbol.query(shapely.box(*caja), predicate="intersects")
+            if len(candidatos) == 0:
+                continue
+            candidatos.sort()
+            recortes = shapely.clip_by_rect(geometrias[candidatos], *caja)
+            origen = np.array([tx * EXTENSION, ty * EXTENSION], dtype=float)
+            recortes = shapely.transform(recortes, lambda c: c - origen)
+            recortes = shapely.set_precision(recortes, 1.0)
+            # Anillo exterior con área positiva en coordenadas de tesela (horario con y hacia abajo)
+            recortes = shapely.orient_polygons(recortes, exterior_cw=False)
+            contenido = codificar_capa(
+                nombre,
+                ((ids[i], propiedades[i], g) for i, g in zip(candidatos, recortes) if not g.is_empty),
+            )
+            if contenido:
+                yield (tx, ty), contenido
+
+
+def _ruta_manifiesto(nombre: str) -> str:
+    return os.path.join(DIR_TESELAS, f"{nombre}.json")
+
+
+def _version(path: str, zoom_min: int, zoom_max: int) -> str:
+    huella = huella_archivo(path)["sha256"]
+    parametros = f"{huella}-{zoom_min}-{zoom_max}-{EXTENSION}-{BORDE}-{TOLERANCIA}-v{VERSION_TESELAS}"
+    return hashlib.sha256(parametros.encode()).hexdigest()[:16]
+
+
+def construir_teselas(
+    nombre: str,
+    path: str,
+    zoom_min: int = ZOOM_MIN,
+    zoom_max: int = ZOOM_MAX,
+) -> dict:
+    """
+    Genera las teselas {z}/{x}/{y}.pbf de una capa de CAPAS en
+    static/teselas/<capa>-<versión> y escribe su manifiesto. Si ya existen
+    para el mismo contenido y parámetros, no hace nada.
+
+    Parámetros:
+        nombre (str): capa ("cuadrantes" o "alcaldias"); es también el nombre
+            de la capa dentro de cada tesela.
+        path (str): archivo de origen de la capa.
+        zoom_min (int), zoom_max (int): niveles de zoom a generar.
+
+    Retorna:
+        dict: manifiesto (versión, carpeta, zooms, límites y número de teselas).
+    """
+    version = _version(path, zoom_min, zoom_max)
+    carpeta = f"{nombre}-{version}"
+    destino = os.path.join(DIR_TESELAS, carpeta)
+    try:
+        with open(_ruta_manifiesto(nombre), "r", encoding="utf-8") as f:
+            previo = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        previo = {}
+    if previo.get("version") == version and os.path.isdir(destino):
+        return previo
+
+    ids, propiedades, geometrias = _leer_capa(nombre, path)
+    validas = ~shapely.is_missing(geometrias)
+    ids = [i for i, v in zip(ids, validas) if v]
+    propiedades = [p for p, v in zip(propiedades, validas) if v]
+    geometrias = geometrias[validas]
+    mundo = shapely.transform(geometrias, _a_mundo)
+
+    temporal = ruta_temporal(destino)
+    total = 0
+    for zoom in range(zoom_min, zoom_max + 1):
+        for (tx, ty), contenido in _teselas_zoom(nombre, ids, propiedades, mundo, zoom):
+            ruta = os.path.join(temporal, str(zoom), str(tx), f"{ty}.pbf")
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, "wb") as f:
+                f.write(contenido)
+            total += 1
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(temporal, destino)
+
+    oeste, sur, este, norte = shapely.total_bounds(geometrias)
+    manifiesto = {
+        "version": version,
+        "carpeta": carpeta,
+        "fuente_sha256": huella_archivo(path)["sha256"],
+        "zoom_min": zoom_min,
+        "zoom_max": zoom_max,
+        "limites": [[float(sur), float(oeste)], [float(norte), float(este)]],
+        "teselas": total,
+    }
+    tmp = ruta_temporal(_ruta_manifiesto(nombre))
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f)
+    os.replace(tmp, _ruta_manifiesto(nombre))
+
+    # Versiones anteriores de la misma capa
+    for otra in os.listdir(DIR_TESELAS):
+        if otra.startswith(f"{nombre}-") and otra != carpeta and not otra.endswith(".tmp"):
+            shutil.rmtree(os.path.join(DIR_TESELAS, otra), ignore_errors=True)
+    return manifiesto
+
+
+def plantilla_teselas(nombre: str, directorio: str = "bases_de_datos") -> dict | None:
+    """
+    Datos para pedir las teselas de una capa desde el mapa: url con {z}/{x}/{y}
+    (de url_estatica, con ?v=<versión> para la caché del navegador), nombre de
+    la capa, zooms y límites. Devuelve None si Streamlit
+    no sirve archivos estáticos, si las teselas no se han generado o si el
+    archivo de origen cambió desde entonces; en ese caso el mapa usa el
+    GeoJSON de siempre.
+    """
+    if not st.get_option("server.enableStaticServing"):
+        return None
+    try:
+        with open(_ruta_manifiesto(nombre), "r", encoding="utf-8") as f:
+            manifiesto = json.load(f)
+        vigente = huella_archivo(os.path.join(directorio, CAPAS[nombre]))["sha256"] == manifiesto["fuente_sha256"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+    if not vigente or not os.path.isdir(os.path.join(DIR_TESELAS, manifiesto["carpeta"])):
+        return None
+    return {
+        "url": url_estatica(f"teselas/{manifiesto['carpeta']}/{{z}}/{{x}}/{{y}}.pbf?v={manifiesto['version']}"),
+        "capa": nombre,
+        "zoom_min": manifiesto["zoom_min"],
+        "zoom_max": manifiesto["zoom_max"],
+        "limites": manifiesto["limites"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera las teselas vectoriales de las capas de polígonos.")
+    parser.add_argument("--directorio", default="bases_de_datos", help="carpeta con los archivos de las capas")
+    parser.add_argument("--capas", nargs="+", choices=sorted(CAPAS), default=sorted(CAPAS))
+    parser.add_argument("--zoom-min", type=int, default=ZOOM_MIN)
+    parser.add_argument("--zoom-max", type=int, default=ZOOM_MAX)
+    args = parser.parse_args()
+
+    for nombre in args.capas:
+        inicio = time.perf_counter()
+        manifiesto = construir_teselas(
+            nombre, os.path.join(args.directorio, CAPAS[nombre]), args.zoom_min, args.zoom_max
+        )
+        print(f"{nombre}: {manifiesto['teselas']} teselas (zoom {manifiesto['zoom_min']}-"
+              f"{manifiesto['zoom_max']}) en {time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
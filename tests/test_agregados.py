@@ -0,0 +1,67 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_loader import (  # noqa: E402
+    DELITOS_PREFIJOS,
+    FAMILIA_TOTAL,
+    _abrir_almacen,
+    acumulado_diario,
+    conteo_en_rango,
+    preparar_almacen,
+)
+
+COLUMNAS = "fecha_inicio,fecha_hecho,delito,categoria_delito,alcaldia_hecho,latitud,longitud\n"
+
+
+def _base(tmp_path) -> str:
+    rng = np.random.default_rng(1)
+    delitos = [f"{p} SIN VIOLENCIA" for p in DELITOS_PREFIJOS] + ["FRAUDE", "AMENAZAS"]
+    alcaldias = ["COYOACAN", "TLALPAN", "IZTAPALAPA"]
+    filas = []
+    for _ in range(500):
+        # Hueco de días sin incidentes en medio del rango
+        dia = int(rng.choice(np.r_[0:40, 60:120]))
+        fecha = pd.Timestamp("2024-01-01") + pd.Timedelta(days=dia, minutes=int(rng.integers(0, 1440)))
+        filas.append(
+            f"{fecha},{fecha},{rng.choice(delitos)},DELITO DE BAJO IMPACTO,"
+            f"{rng.choice(alcaldias)},19.3,-99.1\n"
+        )
+    ruta = tmp_path / "df_rt.csv"
+    ruta.write_text(COLUMNAS + "".join(filas), encoding="utf-8")
+    return str(ruta)
+
+
+def test_conteo_en_rango_igual_a_filtrar(tmp_path):
+    path = _base(tmp_path)
+    df = _abrir_almacen(preparar_almacen(path)).to_table().to_pandas()
+    dias = df["fecha_hecho"].dt.normalize()
+    acumulado = acumulado_diario(path)
+    por_alcaldia = acumulado_diario(path, por_alcaldia=True)
+
+    rangos = [
+        ("2024-01-01", "2024-04-29"),  # todo el historial
+        ("2024-01-10", "2024-01-10"),  # un solo día
+        ("2024-02-15", "2024-02-25"),  # dentro del hueco
+        ("2024-02-01", "2024-03-15"),  # cruza el hueco
+        ("2023-12-01", "2024-01-05"),  # empieza antes del primer incidente
+        ("2024-04-20", "2024-06-30"),  # termina después del último
+    ]
+    for inicio, fin in rangos:
+        en_rango = df[dias.between(pd.Timestamp(inicio), pd.Timestamp(fin))]
+        conteos = conteo_en_rango(acumulado, inicio, fin)
+        assert conteos[FAMILIA_TOTAL] == len(en_rango)
+        for familia in DELITOS_PREFIJOS:
+            assert conteos[familia] == (en_rango["familia"] == familia).sum()
+
+        conteos_alc = conteo_en_rango(por_alcaldia, inicio, fin)
+        esperado = en_rango[en_rango["familia"].notna()].groupby(
+            ["alcaldia_hecho", "familia"], observed=True
+        ).size()
+        for (alcaldia, familia), total in conteos_alc.items():
+            assert total == esperado.get((alcaldia, familia), 0)
+        assert conteos_alc.sum() == esperado.sum()
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_loader import aplicar_esquema  # noqa: E402
+
+
+def test_fechas_fuera_de_formato():
+    df = pd.DataFrame({
+        "fecha_hecho": ["2024-01-03 10:00:00", "03/01/2024 10:00", None, "", "sin fecha"],
+        "delito": ["robo de motocicleta"] * 5,
+    })
+    with pytest.warns(UserWarning, match="fecha_hecho: 1 valores"):
+        fechas = aplicar_esquema(df)["fecha_hecho"]
+
+    assert fechas[0] == pd.Timestamp("2024-01-03 10:00:00")
+    # Fuera de ISO 8601: se recupera infiriendo el formato solo para esa fila
+    assert fechas[1] == pd.Timestamp("2024-03-01 10:00:00")
+    assert fechas[2:].isna().all()
@@ -0,0 +1,95 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_loader import (  # noqa: E402
+    AGREGADOS,
+    DELITOS_PREFIJOS,
+    _abrir_almacen,
+    ingestar_incidentes,
+    leer_agregado,
+    preparar_almacen,
+)
+
+COLUMNAS = "fecha_inicio,fecha_hecho,delito,categoria_delito,alcaldia_hecho,latitud,longitud\n"
+
+
+def _escribir(ruta, filas):
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write(COLUMNAS + "".join(f"{fila}\n" for fila in filas))
+
+
+def test_lote_con_categorica_vacia(tmp_path):
+    base = tmp_path / "df_rt.csv"
+    _escribir(base, [
+        "2024-01-03 10:00:00,2024-01-03 10:00:00,ROBO DE MOTOCICLETA SIN VIOLENCIA,DELITO DE BAJO IMPACTO,COYOACAN,19.35,-99.16",
+        "2024-01-05 21:30:00,2024-01-05 21:30:00,ROBO DE ACCESORIOS DE AUTO,DELITO DE BAJO IMPACTO,TLALPAN,19.29,-99.17",
+    ])
+    preparar_almacen(str(base))
+
+    # categoria_delito vacía en todo el lote: pandas la leería como float64
+    lote = tmp_path / "lote.csv"
+    _escribir(lote, [
+        "2024-02-01 08:15:00,2024-02-01 08:15:00,ROBO DE MOTOCICLETA CON VIOLENCIA,,COYOACAN,19.34,-99.15",
+        "2024-02-02 12:00:00,2024-02-02 12:00:00,ROBO DE MOTOCICLETA SIN VIOLENCIA,,IZTAPALAPA,19.36,-99.06",
+    ])
+    assert ingestar_incidentes(str(lote), path=str(base)) == 2
+
+    df = _abrir_almacen(preparar_almacen(str(base))).to_table().to_pandas()
+    assert len(df) == 4
+    febrero = df[df["mes"] == 2]
+    assert febrero["categoria_delito"].isna().all()
+    assert set(febrero["alcaldia_hecho"]) == {"COYOACAN", "IZTAPALAPA"}
+    assert len(pd.read_csv(base)) == 4
+
+
+def _filas_aleatorias(rng, n, inicio):
+    """Filas con delitos de las familias (y uno ajeno) y fechas en unos 90 días."""
+    delitos = [f"{p} CON VIOLENCIA" for p in DELITOS_PREFIJOS] + ["FRAUDE"]
+    alcaldias = ["COYOACAN", "TLALPAN", "IZTAPALAPA"]
+    filas = []
+    for _ in range(n):
+        fecha = pd.Timestamp(inicio) + pd.Timedelta(minutes=int(rng.integers(0, 90 * 24 * 60)))
+        filas.append(
+            f"{fecha},{fecha},{rng.choice(delitos)},DELITO DE BAJO IMPACTO,"
+            f"{rng.choice(alcaldias)},19.3,-99.1"
+        )
+    return filas
+
+
+def _agregado_comparable(path, nombre):
+    claves = AGREGADOS[nombre][1]
+    df = leer_agregado(path, nombre)
+    df = df[df["total"] > 0].astype({c: object for c in claves if isinstance(df[c].dtype, pd.CategoricalDtype)})
+    return df.sort_values(list(claves)).reset_index(drop=True)
+
+
+def test_ingestas_equivalen_a_reconstruir(tmp_path):
+    rng = np.random.default_rng(0)
+    base = _filas_aleatorias(rng, 200, "2024-01-01")
+    lotes = [_filas_aleatorias(rng, 50, "2024-03-01"), _filas_aleatorias(rng, 50, "2024-03-15")]
+
+    (tmp_path / "incremental").mkdir()
+    incremental = tmp_path / "incremental" / "df_rt.csv"
+    _escribir(incremental, base)
+    preparar_almacen(str(incremental))
+    for i, filas in enumerate(lotes):
+        lote = tmp_path / f"lote{i}.csv"
+        _escribir(lote, filas)
+        assert ingestar_incidentes(str(lote), path=str(incremental)) == len(filas)
+
+    (tmp_path / "completo").mkdir()
+    completo = tmp_path / "completo" / "df_rt.csv"
+    _escribir(completo, base + lotes[0] + lotes[1])
+    preparar_almacen(str(completo))
+
+    for nombre in ("conteo_mensual", "conteo_diario", "conteo_dia_hora"):
+        pd.testing.assert_frame_equal(
+            _agregado_comparable(str(incremental), nombre),
+            _agregado_comparable(str(completo), nombre),
+            check_dtype=False,
+        )
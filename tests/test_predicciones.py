@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from predicciones import asignar_patrullaje, grafo_cuadrantes, indices_mayores  # noqa: E402
+
+LADO = 4
+
+
+def _cuadrantes_rejilla(tmp_path) -> str:
+    """cuadrantes.csv con una rejilla LADO x LADO de cuadrados que comparten lados."""
+    filas = ["id,alcaldia,geo_shape"]
+    for fila in range(LADO):
+        for col in range(LADO):
+            x, y = -99.2 + col * 0.01, 19.3 + fila * 0.01
+            anillo = [[x, y], [x + 0.01, y], [x + 0.01, y + 0.01], [x, y + 0.01], [x, y]]
+            geo = json.dumps({"type": "Polygon", "coordinates": [anillo]}).replace('"', '""')
+            filas.append(f'{fila * LADO + col + 1},COYOACAN,"{geo}"')
+    ruta = tmp_path / "cuadrantes.csv"
+    ruta.write_text("\n".join(filas) + "\n", encoding="utf-8")
+    return str(ruta)
+
+
+def _vecinos(indptr, vecinos, i) -> set:
+    return set(vecinos[indptr[i]:indptr[i + 1]].tolist())
+
+
+def test_grafo_rejilla(tmp_path):
+    ids, indptr, vecinos = grafo_cuadrantes(_cuadrantes_rejilla(tmp_path))
+    assert len(ids) == LADO * LADO
+    # Las esquinas tocan a 3 cuadrantes (dos lados y la diagonal); el centro a 8
+    assert len(_vecinos(indptr, vecinos, 0)) == 3
+    assert len(_vecinos(indptr, vecinos, LADO + 1)) == 8
+    assert all(i not in _vecinos(indptr, vecinos, i) for i in range(len(ids)))
+
+
+def test_rutas_contiguas_y_sin_repetir(tmp_path):
+    ids, indptr, vecinos = grafo_cuadrantes(_cuadrantes_rejilla(tmp_path))
+    valores = np.random.default_rng(0).random(len(ids))
+    rutas = asignar_patrullaje(valores, indptr, vecinos, k=3, tam_ruta=4)
+
+    assert len(rutas) == 3
+    todas = np.concatenate(rutas)
+    assert len(set(todas.tolist())) == len(todas)
+    for ruta in rutas:
+        assert len(ruta) == 4
+        # Cada cuadrante que se agrega toca a alguno de los anteriores de su ruta
+        for j in range(1, len(ruta)):
+            assert any(ruta[j] in _vecinos(indptr, vecinos, r) for r in ruta[:j])
+
+
+def test_k_mayor_que_las_celdas(tmp_path):
+    ids, indptr, vecinos = grafo_cuadrantes(_cuadrantes_rejilla(tmp_path))
+    valores = np.arange(len(ids), dtype=float)
+
+    individuales = asignar_patrullaje(valores, indptr, vecinos, k=100, tam_ruta=1)
+    assert len(individuales) == len(ids)
+    assert [int(r[0]) for r in individuales] == list(range(len(ids)))[::-1]
+
+    rutas = asignar_patrullaje(valores, indptr, vecinos, k=100, tam_ruta=3)
+    cubiertas = np.concatenate(rutas)
+    assert sorted(cubiertas.tolist()) == list(range(len(ids)))
+
+
+def test_indices_mayores():
+    valores = np.array([0.2, np.nan, 0.9, 0.5, 0.9])
+    assert indices_mayores(valores, 3).tolist() == [2, 4, 3]
+    assert indices_mayores(valores, 10).tolist()[-1] == 1
+    assert indices_mayores(valores, 0).tolist() == []
@@ -0,0 +1,193 @@
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import shapely
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import teselas  # noqa: E402
+from teselas import EXTENSION, codificar_capa, construir_teselas  # noqa: E402
+
+# Decodificador protobuf mínimo (independiente del codificador) para leer las teselas
+
+
+def _varint(datos: bytes, i: int) -> tuple[int, int]:
+    n = desplazamiento = 0
+    while True:
+        byte = datos[i]
+        i += 1
+        n |= (byte & 0x7F) << desplazamiento
+        desplazamiento += 7
+        if not byte & 0x80:
+            return n, i
+
+
+def _campos(datos: bytes) -> list:
+    """[(número de campo, valor)]: int para varint, bytes para longitud y 64 bits."""
+    campos, i = [], 0
+    while i < len(datos):
+        clave, i = _varint(datos, i)
+        tipo = clave & 7
+        if tipo == 0:
+            valor, i = _varint(datos, i)
+        elif tipo == 1:
+            valor, i = datos[i:i + 8], i + 8
+        elif tipo == 2:
+            largo, i = _varint(datos, i)
+            valor, i = datos[i:i + largo], i + largo
+        else:
+            raise ValueError(f"tipo de campo inesperado: {tipo}")
+        campos.append((clave >> 3, valor))
+    return campos
+
+
+def _empacados(datos: bytes) -> list:
+    numeros, i = [], 0
+    while i < len(datos):
+        n, i = _varint(datos, i)
+        numeros.append(n)
+    return numeros
+
+
+def _desde_zigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+
+def _valor(datos: bytes):
+    numero, valor = _campos(datos)[0]
+    if numero == 1:
+        return valor.decode("utf-8")
+    if numero == 3:
+        return struct.unpack("<d", valor)[0]
+    if numero == 6:
+        return _desde_zigzag(valor)
+    if numero == 7:
+        return bool(valor)
+    raise ValueError(f"tipo de valor inesperado: {numero}")
+
+
+def _anillos(comandos: list) -> list:
+    """Anillos (listas de (x, y) absolutos) a partir de los comandos de geometría."""
+    anillos, actual, x, y, i = [], [], 0, 0, 0
+    while i < len(comandos):
+        comando, cuenta = comandos[i] & 7, comandos[i] >> 3
+        i += 1
+        if comando == 7:
+            anillos.append(actual)
+            actual = []
+            continue
+        for _ in range(cuenta):
+            x += _desde_zigzag(comandos[i])
+            y += _desde_zigzag(comandos[i + 1])
+            i += 2
+            actual.append((x, y))
+    return anillos
+
+
+def _decodificar(tesela: bytes) -> list:
+    """Capas de una tesela: nombre, extensión y features con id, propiedades y anillos."""
+    capas = []
+    for numero, capa in _campos(tesela):
+        assert numero == 3
+        campos = _campos(capa)
+        claves = [v.decode("utf-8") for n, v in campos if n == 3]
+        valores = [_valor(v) for n, v in campos if n == 4]
+        features = []
+        for _, feature in (c for c in campos if c[0] == 2):
+            datos = dict(_campos(feature))
+            etiquetas = _empacados(datos.get(2, b""))
+            features.append({
+                "id": datos.get(1),
+                "tipo": datos[3],
+                "propiedades": {claves[k]: valores[v] for k, v in zip(etiquetas[::2], etiquetas[1::2])},
+                "anillos": _anillos(_empacados(datos[4])),
+            })
+        capas.append({
+            "version": next(v for n, v in campos if n == 15),
+            "nombre": next(v for n, v in campos if n == 1).decode("utf-8"),
+            "extension": next(v for n, v in campos if n == 5),
+            "features": features,
+        })
+    return capas
+
+
+def test_capa_ida_y_vuelta():
+    exterior = [(100, 100), (900, 100), (900, 900), (100, 900), (100, 100)]
+    hueco = [(400, 400), (400, 600), (600, 600), (600, 400), (400, 400)]
+    poligono = shapely.orient_polygons(shapely.Polygon(exterior, [hueco]), exterior_cw=False)
+    propiedades = {"nombre": "COYOACÁN", "sector": 7, "area": 1.5, "activo": True, "vacio": None}
+
+    capas = _decodificar(codificar_capa("cuadrantes", [(42, propiedades, poligono)]))
+
+    assert len(capas) == 1
+    capa = capas[0]
+    assert (capa["version"], capa["nombre"], capa["extension"]) == (2, "cuadrantes", EXTENSION)
+    (feature,) = capa["features"]
+    assert feature["id"] == 42
+    assert feature["tipo"] == 3  # POLYGON
+    assert feature["propiedades"] == {"nombre": "COYOACÁN", "sector": 7, "area": 1.5, "activo": True}
+    decodificado = shapely.Polygon(feature["anillos"][0], feature["anillos"][1:])
+    assert decodificado.equals(poligono)
+    # Orientación MVT: exterior con área positiva (horario con y hacia abajo), hueco al revés
+    assert shapely.Polygon(feature["anillos"][0]).area > 0
+    assert shapely.LinearRing(feature["anillos"][0]).is_ccw
+    assert not shapely.LinearRing(feature["anillos"][1]).is_ccw
+
+
+def test_capa_sin_geometria_util():
+    linea = shapely.LineString([(0, 0), (10, 10)])
+    assert codificar_capa("vacia", [(1, {}, linea)]) == b""
+
+
+def _a_lonlat(x_mundo, y_mundo):
+    lon = x_mundo * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y_mundo))))
+    return lon, lat
+
+
+def test_construir_teselas(tmp_path, monkeypatch):
+    monkeypatch.setattr(teselas, "DIR_TESELAS", str(tmp_path / "teselas"))
+    oeste, sur, este, norte = -99.20, 19.30, -99.15, 19.35
+    geojson = {
+        "type": "FeatureCollection",
+        "features": [{
+            "type": "Feature",
+            "properties": {"nomgeo": "Coyoacán", "cve_mun": 3},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[oeste, sur], [este, sur], [este, norte], [oeste, norte], [oeste, sur]]],
+            },
+        }],
+    }
+    origen = tmp_path / "limite-de-las-alcaldias.json"
+    origen.write_text(json.dumps(geojson), encoding="utf-8")
+
+    zoom = 10
+    manifiesto = construir_teselas("alcaldias", str(origen), zoom_min=zoom, zoom_max=zoom)
+    carpeta = tmp_path / "teselas" / manifiesto["carpeta"]
+    archivos = sorted(carpeta.rglob("*.pbf"))
+    assert manifiesto["teselas"] == len(archivos) >= 1
+    assert manifiesto["limites"] == [[sur, oeste], [norte, este]]
+    # Sin cambios en el origen no se regenera
+    assert construir_teselas("alcaldias", str(origen), zoom_min=zoom, zoom_max=zoom) == manifiesto
+
+    # Se juntan los recortes de todas las teselas en coordenadas lon/lat
+    escala = float((1 << zoom) * EXTENSION)
+    partes = []
+    for archivo in archivos:
+        tx, ty = int(archivo.parent.name), int(archivo.stem)
+        assert int(archivo.parent.parent.name) == zoom
+        (capa,) = _decodificar(archivo.read_bytes())
+        assert capa["nombre"] == "alcaldias"
+        for feature in capa["features"]:
+            assert feature["propiedades"] == {"nomgeo": "Coyoacán", "cve_mun": 3}
+            xy = np.array(feature["anillos"][0], dtype=float)
+            lon, lat = _a_lonlat((xy[:, 0] + tx * EXTENSION) / escala, (xy[:, 1] + ty * EXTENSION) / escala)
+            partes.append(shapely.Polygon(np.column_stack([lon, lat])))
+
+    # Cada unidad de tesela a zoom 10 mide ~8.6e-5 grados
+    xmin, ymin, xmax, ymax = shapely.total_bounds(shapely.union_all(partes))
+    assert np.allclose([xmin, ymin, xmax, ymax], [oeste, sur, este, norte], atol=2e-4)